@@ -48,6 +48,13 @@ setup(
             "anthropic>=0.18.0",
             "ollama>=0.1.7",
         ],
+        "documents": [
+            "pypdfium2>=4.0.0",
+            "tifffile>=2023.1.0",
+        ],
+        "rag": [
+            "sentence-transformers>=2.2.0",
+        ],
         "finetune": [
             "torch>=2.0.0",
             "transformers>=4.35.0",
@@ -11,7 +11,9 @@ It has been refactored into separate modules:
 - mech_dwg_orchestrator.py: Main orchestrator
 """
 
-from typing import Optional
+from typing import Dict, List, Optional
+from pathlib import Path
+import json
 from .mech_dwg_orchestrator import MechanicalDrawingAnalyzer as NewAnalyzer
 from .models import PartSpecification, Dimension, GDTSymbol, DrawingView
 
@@ -23,148 +25,36 @@ class MechanicalDrawingAnalyzer(NewAnalyzer):
     """Legacy analyzer class that inherits from the new implementation"""
     
     def __init__(self, provider="openai", model=None, 
-                 local_model=None):
+                 local_model=None, llm_provider=None):
         from .config import AnalyzerConfig
+        from .llm_providers import get_provider
         
         # Convert legacy parameters to new config
         config = AnalyzerConfig()
-        config.llm_config.provider = provider
-        config.llm_config.model = model or config.llm_config.model
+        config.llm_config.provider = llm_provider or provider
+        # local_model was the Ollama model name in the old API
+        config.llm_config.model = (model or local_model
+                                   or get_provider(config.llm_config.provider).default_model)
         
         # Initialize with new architecture
         super().__init__(config=config)
-        elif llm_provider == "claude":
-            # For Claude via API
-            import anthropic
-            self.client = anthropic.Anthropic(api_key=anthropic_api_key)
-        
-        # CV parameters
-        self.min_region_area = 5000
-        self.edge_threshold = (50, 150)
+        self.llm_provider = config.llm_config.provider
         
     def preprocess_drawing(self, image_path: str) -> Dict:
         """Use OpenCV to preprocess and segment the drawing"""
-        
-        # Load image
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError(f"Could not load image from {image_path}")
-            
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Enhance contrast for better LLM recognition
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
-        
-        # Detect major regions (views, title block, tables)
-        regions = self._detect_regions(enhanced)
-        
-        # Detect and enhance text areas
-        text_regions = self._enhance_text_regions(enhanced)
-        
-        # Prepare images for LLM
-        processed_images = {
-            'full': self._prepare_for_llm(img),
-            'enhanced': self._prepare_for_llm(cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)),
-            'regions': []
-        }
-        
-        # Extract individual regions for focused analysis
-        for region in regions:
-            x, y, w, h = region['bbox']
-            region_img = img[y:y+h, x:x+w]
-            processed_images['regions'].append({
-                'type': region['type'],
-                'bbox': region['bbox'],
-                'image': self._prepare_for_llm(region_img)
-            })
-        
-        return processed_images
-    
-    def _detect_regions(self, gray: np.ndarray) -> List[Dict]:
-        """Detect major regions in the drawing"""
-        regions = []
-        
-        # Use edge detection and contours
-        edges = cv2.Canny(gray, *self.edge_threshold)
-        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        
-        img_h, img_w = gray.shape
-        
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if area < self.min_region_area:
-                continue
-                
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Classify region based on position and aspect ratio
-            region_type = self._classify_region(x, y, w, h, img_w, img_h)
-            
-            regions.append({
-                'type': region_type,
-                'bbox': (x, y, w, h),
-                'contour': contour
-            })
-        
-        return regions
-    
-    def _classify_region(self, x: int, y: int, w: int, h: int, 
-                        img_w: int, img_h: int) -> str:
-        """Heuristic classification of regions"""
-        # Title block is usually bottom-right
-        if x > img_w * 0.6 and y > img_h * 0.7:
-            return 'title_block'
-        # Tables often have specific aspect ratios
-        elif 0.3 < w/h < 3 and w > img_w * 0.2:
-            return 'table'
-        # Main views take up significant space
-        elif w > img_w * 0.25 or h > img_h * 0.25:
-            return 'drawing_view'
-        else:
-            return 'detail'
-    
-    def _enhance_text_regions(self, gray: np.ndarray) -> np.ndarray:
-        """Enhance text for better OCR by LLM"""
-        # Morphological operations to connect text
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-        morph = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        
-        # Threshold for text
-        _, text_mask = cv2.threshold(morph, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        return text_mask
-    
-    def _prepare_for_llm(self, img: np.ndarray) -> str:
-        """Convert image to base64 for LLM input"""
-        # Convert to PIL Image
-        if len(img.shape) == 2:
-            pil_img = Image.fromarray(img)
-        else:
-            pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
-        
-        # Convert to base64
-        buffer = io.BytesIO()
-        pil_img.save(buffer, format="PNG")
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        return f"data:image/png;base64,{img_str}"
+        return self.cv.process_drawing(image_path)['processed_images']
     
     def analyze_with_llm(self, processed_images: Dict, 
                         compliance_rules: Optional[List[str]] = None) -> PartSpecification:
         """Use LLM to understand the drawing content"""
         
         # Build the prompt
-        prompt = self._build_analysis_prompt(compliance_rules)
+        prompt = self._build_legacy_prompt(compliance_rules)
         
-        if self.llm_provider == "openai":
-            return self._analyze_with_gpt4v(processed_images, prompt)
-        elif self.llm_provider == "ollama":
-            return self._analyze_with_ollama(processed_images, prompt)
-        elif self.llm_provider == "claude":
-            return self._analyze_with_claude(processed_images, prompt)
+        # Provider dispatch now lives in the LLMClient provider plugins
+        return self.llm.analyze(processed_images, prompt, PartSpecification)
     
-    def _build_analysis_prompt(self, compliance_rules: Optional[List[str]]) -> str:
+    def _build_legacy_prompt(self, compliance_rules: Optional[List[str]]) -> str:
         """Build the analysis prompt"""
         base_prompt = """You are an expert mechanical engineer analyzing technical drawings. 
         Extract the following information from this mechanical drawing:
@@ -194,64 +84,15 @@ class MechanicalDrawingAnalyzer(NewAnalyzer):
     
     def _analyze_with_gpt4v(self, processed_images: Dict, prompt: str) -> PartSpecification:
         """Analyze using GPT-4 Vision with function calling"""
-        
-        messages = [
-            {
-                "role": "system",
-                "content": prompt
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Analyze this mechanical drawing. First show the full drawing:"},
-                    {"type": "image_url", "image_url": {"url": processed_images['full']}}
-                ]
-            }
-        ]
-        
-        # Add region images for detailed analysis
-        for region in processed_images['regions']:
-            if region['type'] == 'title_block':
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Here's the title block in detail:"},
-                        {"type": "image_url", "image_url": {"url": region['image']}}
-                    ]
-                })
-        
-        # Use function calling for structured output
-        tools = [{
-            "type": "function",
-            "function": {
-                "name": "extract_part_specification",
-                "description": "Extract structured part specification from drawing",
-                "parameters": PartSpecification.model_json_schema()
-            }
-        }]
-        
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            tools=tools,
-            tool_choice={"type": "function", "function": {"name": "extract_part_specification"}}
-        )
-        
-        # Parse the function call response
-        function_args = json.loads(response.choices[0].message.tool_calls[0].function.arguments)
-        return PartSpecification(**function_args)
+        return self.llm.analyze(processed_images, prompt, PartSpecification)
     
     def _analyze_with_ollama(self, processed_images: Dict, prompt: str) -> PartSpecification:
         """Analyze using Ollama (local model)"""
-        # Implementation for Ollama
-        # This is a placeholder - you'd need to implement based on Ollama's API
-        raise NotImplementedError("Ollama integration needs to be implemented")
+        return self.llm.analyze(processed_images, prompt, PartSpecification)
     
     def _analyze_with_claude(self, processed_images: Dict, prompt: str) -> PartSpecification:
         """Analyze using Claude"""
-        # Implementation for Claude
-        # This is a placeholder - you'd need to implement based on Anthropic's API
-        raise NotImplementedError("Claude integration needs to be implemented")
+        return self.llm.analyze(processed_images, prompt, PartSpecification)
     
     def analyze_drawing(self, image_path: str, 
                        compliance_rules: Optional[List[str]] = None,
@@ -0,0 +1,88 @@
+"""
+Model Cascade for Mechanical Drawing Analysis
+Scores cheap-model extractions so only the weak ones go to a stronger model
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+import threading
+
+from src.models import PartSpecification
+
+
+@dataclass
+class ExtractionScore:
+    """How trustworthy an extraction looks, 0 (useless) to 1 (confident)."""
+    score: float
+    reasons: List[str] = field(default_factory=list)
+
+
+def score_specification(spec: PartSpecification,
+                        sanitize_fixes: int = 0,
+                        missing_field_penalty: float = 0.25,
+                        fix_penalty: float = 0.05) -> ExtractionScore:
+    """
+    Score an extraction without looking at the drawing again.
+    
+    Like a foreman glancing over an apprentice's worksheet: start from how
+    sure the model said it was about each dimension, then dock points for
+    blank part number / material boxes and for every formatting mistake
+    that had to be corrected (_sanitize_llm_response fixes).
+    
+    Args:
+        spec: The extracted specification
+        sanitize_fixes: Number of fixes the response needed
+        missing_field_penalty: Deducted for each of part_number / material
+        fix_penalty: Deducted per sanitize fix
+    
+    Returns:
+        ExtractionScore with the score and what lowered it
+    """
+    reasons = []
+    dimensions = list(spec.critical_dimensions) + list(spec.overall_dimensions.values())
+    if dimensions:
+        score = sum(d.confidence for d in dimensions) / len(dimensions)
+        if score < 1.0:
+            reasons.append(f"average confidence {score:.2f}")
+    else:
+        score = 0.0
+        reasons.append("no dimensions")
+    
+    for name in ('part_number', 'material'):
+        if not getattr(spec, name):
+            score -= missing_field_penalty
+            reasons.append(f"missing {name}")
+    
+    if sanitize_fixes:
+        score -= fix_penalty * sanitize_fixes
+        reasons.append(f"{sanitize_fixes} schema fixes")
+    
+    return ExtractionScore(score=max(0.0, min(1.0, score)), reasons=reasons)
+
+
+class CascadeStats:
+    """Running escalation rate and per-tier latency (thread-safe)."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.drawings = 0
+        self.escalated = 0
+        self._latency_ms: Dict[str, List[float]] = {}
+    
+    def record(self, escalated: bool, tier_latency_ms: Dict[str, float]):
+        with self._lock:
+            self.drawings += 1
+            self.escalated += int(escalated)
+            for tier, ms in tier_latency_ms.items():
+                self._latency_ms.setdefault(tier, []).append(ms)
+    
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                'drawings': self.drawings,
+                'escalated': self.escalated,
+                'escalation_rate': self.escalated / self.drawings if self.drawings else 0.0,
+                'mean_latency_ms': {
+                    tier: sum(values) / len(values) for tier, values in self._latency_ms.items()
+                }
+            }
@@ -3,11 +3,56 @@ Compliance checking module
 Co-Author: AI-assisted development with Claude (Anthropic)
 """
 
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+from dataclasses import dataclass, field
+from functools import lru_cache
+import json
+import re
 from pydantic import BaseModel
 
 
+# Units rule limits and extracted values are normalized to, per quantity
+_TO_BASE_UNIT = {
+    'length': {'mm': 1.0, 'cm': 10.0, 'm': 1000.0, 'in': 25.4, 'inch': 25.4, '"': 25.4, 'ft': 304.8},
+    'angle': {'deg': 1.0, '°': 1.0, 'degree': 1.0, 'degrees': 1.0, 'rad': 57.29578},
+    'roughness': {'um': 1.0, 'µm': 1.0, 'μm': 1.0, 'uin': 0.0254, 'µin': 0.0254, 'μin': 0.0254},
+}
+_BASE_UNIT = {'length': 'mm', 'angle': '°', 'roughness': 'µm'}
+
+# Feature categories of numeric rules (the rule name without min_/max_):
+# which dimension features they apply to, and what kind of quantity they are.
+# Rules for other categories match features that contain their words in order.
+FEATURE_CATEGORIES = {
+    'wall_thickness': (r'\bwall', 'length'),
+    # A hole's depth, spacing or position is not its diameter
+    'hole_diameter': (r'^(?!.*\b(?:depth|spacing|pitch|position|location|distance)\b).*\b(?:hole|bore)s?\b',
+                      'length'),
+    'fillet_radius': (r'\bfillet', 'length'),
+    'draft_angle': (r'\bdraft', 'angle'),
+    'surface_roughness_ra': (r'\brough|\bsurface finish|\bra\b', 'roughness'),
+}
+
+# GD&T symbol names as extracted -> canonical rule names
+_SYMBOL_ALIASES = {
+    'true_position': 'position',
+    'coaxiality': 'concentricity',
+    'total_runout': 'total_runout',
+    'circular_runout': 'circular_runout',
+    'runout': 'circular_runout',
+}
+
+# Characteristics that are meaningless without a datum reference frame
+DATUM_REQUIRED_SYMBOLS = {
+    'perpendicularity', 'parallelism', 'angularity', 'position', 'concentricity',
+    'symmetry', 'circular_runout', 'total_runout',
+}
+
+# Distinct feature texts whose categories a CompiledRules remembers
+MAX_MEMOIZED_FEATURES = 4096
+
+_HEAT_TREATMENT = re.compile(r'heat[\s-]*treat|harden|temper|anneal|quench|\bhrc\b', re.IGNORECASE)
+
+
 @dataclass
 class ComplianceRule:
     """Single compliance rule"""
@@ -20,141 +65,369 @@ class ComplianceRule:
     severity: str = 'error'  # 'error', 'warning', 'info'
 
 
-class ComplianceChecker:
-    """Check drawings against design rules"""
+def load_compliance_rules(rules_file: str) -> Dict:
+    """Read a rules JSON file (text_rules / numeric_rules / material_rules / gdt_rules)."""
+    with open(rules_file, 'r') as f:
+        return json.load(f)
+
+
+def parse_rules(rules_data: Dict) -> List[ComplianceRule]:
+    """
+    Turn a rules dict into ComplianceRules.
     
-    def __init__(self, rules_file: Optional[str] = None):
-        self.rules = []
-        if rules_file:
-            self.load_rules(rules_file)
+    A numeric rule's value may also be a dict with 'value' and optional
+    'unit' and 'severity', e.g. {"min_wall_thickness": {"value": 0.08, "unit": "in"}}.
+    A dict without any *_rules section is read as numeric rules.
+    """
+    sections = ('numeric_rules', 'material_rules', 'gdt_rules')
+    if not any(section in rules_data for section in sections) and 'text_rules' not in rules_data:
+        rules_data = {'numeric_rules': rules_data}
     
-    def load_rules(self, rules_file: str):
-        """Load rules from JSON file"""
-        import json
-        with open(rules_file, 'r') as f:
-            rules_data = json.load(f)
+    rules = []
+    for name, value in rules_data.get('numeric_rules', {}).items():
+        rules.append(_rule(name, 'dimensional', 'numeric', value))
+    for name, value in rules_data.get('material_rules', {}).items():
+        rules.append(_rule(name, 'material', 'exists' if 'require' in name else 'list', value,
+                           severity='warning' if name == 'allowed_materials' else 'error'))
+    for name, value in rules_data.get('gdt_rules', {}).items():
+        check_type = 'numeric' if isinstance(value, (int, float)) and not isinstance(value, bool) else 'boolean'
+        rules.append(_rule(name, 'gdt', check_type, value))
+    return rules
+
+
+def _rule(name: str, category: str, check_type: str, value, severity: str = 'error') -> ComplianceRule:
+    if isinstance(value, dict):
+        return ComplianceRule(name=name, category=category, check_type=check_type,
+                              value=value['value'], tolerance=value.get('tolerance'),
+                              unit=value.get('unit'), severity=value.get('severity', severity))
+    return ComplianceRule(name=name, category=category, check_type=check_type,
+                          value=value, severity=severity)
+
+
+@dataclass
+class _Limit:
+    """A compiled min_/max_ rule, with its limit in the base unit."""
+    rule: ComplianceRule
+    label: str
+    bound: str  # 'min' or 'max'
+    limit: float
+    unit: str
+    
+    def violated(self, value):
+        """Whether a value (or, elementwise, an array of values) breaks the limit."""
+        return value < self.limit if self.bound == 'min' else value > self.limit
+    
+    def message(self, value: float) -> str:
+        relation = "below minimum" if self.bound == 'min' else "exceeds maximum"
+        return f"{self.label} {value:g}{self.unit} {relation} {self.limit:g}{self.unit}"
+    
+    def violation(self, value: float, location: str) -> Dict:
+        return _violation(self.rule, self.message(value), location)
+    
+    def check(self, value: float, location: str) -> Optional[Dict]:
+        return self.violation(value, location) if self.violated(value) else None
+
+
+@dataclass
+class CompiledRules:
+    """
+    Rules turned into a dispatch index.
+    
+    - dimension_rules: feature category -> limits (values in the category's base unit)
+    - category_patterns / category_units: the features a category applies
+      to (regex) and the kind of quantity it limits
+    - gdt_rules: canonical symbol type -> tolerance limits (mm)
+    - datum_rules: rules requiring datum references on DATUM_REQUIRED_SYMBOLS
+    - aspect_ratio_rules: limits on overall length / width
+    - material_rules: require_material_spec / allowed_materials / require_heat_treatment
+    - unsupported: rule names nothing knows how to check
+    """
+    dimension_rules: Dict[str, List[_Limit]] = field(default_factory=dict)
+    category_patterns: Dict[str, str] = field(default_factory=dict)
+    category_units: Dict[str, str] = field(default_factory=dict)
+    gdt_rules: Dict[str, List[_Limit]] = field(default_factory=dict)
+    datum_rules: List[ComplianceRule] = field(default_factory=list)
+    aspect_ratio_rules: List[_Limit] = field(default_factory=list)
+    material_rules: List[ComplianceRule] = field(default_factory=list)
+    unsupported: List[str] = field(default_factory=list)
+    
+    def __post_init__(self):
+        self.index_features()
+    
+    def index_features(self):
+        """Compile the category patterns (after adding categories)."""
+        self._patterns = {category: re.compile(pattern, re.IGNORECASE)
+                          for category, pattern in self.category_patterns.items()}
+        self._feature_categories: Dict[str, List[str]] = {}
+    
+    def categories(self, feature: str) -> List[str]:
+        """
+        Categories a dimension's feature text belongs to - possibly several
+        ("hole depth" is a hole, and has a depth).
         
-        # Parse numeric rules
-        if 'numeric_rules' in rules_data:
-            for name, value in rules_data['numeric_rules'].items():
-                self.rules.append(ComplianceRule(
-                    name=name,
-                    category='dimensional',
-                    check_type='numeric',
-                    value=value
-                ))
+        Feature texts repeat across the dimensions and drawings checked with
+        the same rules ("hole diameter", "wall"), so the patterns are only
+        searched the first time a text (ignoring case and spacing) comes up.
+        """
+        text = ' '.join(feature.lower().split())
+        categories = self._feature_categories.get(text)
+        if categories is None:
+            categories = [category for category, pattern in self._patterns.items() if pattern.search(text)]
+            if len(self._feature_categories) < MAX_MEMOIZED_FEATURES:
+                self._feature_categories[text] = categories
+        return categories
+    
+    def evaluate(self, spec: Dict) -> List[Dict]:
+        """Every violation of a spec, in one pass over its dimensions and callouts."""
+        violations = []
         
-        # Parse material rules
-        if 'material_rules' in rules_data:
-            for name, value in rules_data['material_rules'].items():
-                self.rules.append(ComplianceRule(
-                    name=name,
-                    category='material',
-                    check_type='exists' if 'require' in name else 'list',
-                    value=value
-                ))
+        if self.dimension_rules:
+            dimensions = list(spec.get('overall_dimensions', {}).values()) + spec.get('critical_dimensions', [])
+            for dim in dimensions:
+                violations.extend(self.dimension_violations(dim))
         
-        # Parse GD&T rules
-        if 'gdt_rules' in rules_data:
-            for name, value in rules_data['gdt_rules'].items():
-                self.rules.append(ComplianceRule(
-                    name=name,
-                    category='gdt',
-                    check_type='numeric' if isinstance(value, (int, float)) else 'boolean',
-                    value=value
-                ))
-    
-    def check_specification(self, spec: dict) -> List[Dict]:
-        """Check a part specification against all rules"""
-        violations = []
+        for gdt in spec.get('gdt_requirements', []):
+            violations.extend(self.gdt_violations(gdt))
         
-        for rule in self.rules:
-            violation = self._check_single_rule(spec, rule)
+        if self.aspect_ratio_rules:
+            ratio = aspect_ratio(spec.get('overall_dimensions', {}))
+            if ratio is not None:
+                for limit in self.aspect_ratio_rules:
+                    violation = limit.check(ratio, 'overall dimensions')
+                    if violation:
+                        violations.append(violation)
+        
+        if self.material_rules:
+            material = spec.get('material') or ''
+            heat_treated = has_heat_treatment(material, spec.get('notes', []), spec.get('title_block_info', {}))
+            for rule in self.material_rules:
+                violation = material_violation(rule, material, heat_treated)
+                if violation:
+                    violations.append(violation)
+        return violations
+    
+    def dimension_violations(self, dim: Dict) -> List[Dict]:
+        """Violations of the dimension rules by one dimension."""
+        violations = []
+        feature = dim.get('feature', '') or ''
+        for category in self.categories(feature):
+            value = _to_base(dim.get('value'), dim.get('unit'), self.category_units[category])
+            if value is None:
+                continue
+            for limit in self.dimension_rules[category]:
+                violation = limit.check(value, feature or 'unknown')
+                if violation:
+                    violations.append(violation)
+        return violations
+    
+    def gdt_violations(self, gdt: Dict) -> List[Dict]:
+        """Violations of the tolerance and datum rules by one GD&T callout."""
+        violations = []
+        symbol = canonical_symbol(gdt.get('symbol_type', ''))
+        location = gdt.get('applies_to') or 'unknown feature'
+        for limit in self.gdt_rules.get(symbol, []):
+            violation = limit.check(gdt.get('tolerance', 0), location)
             if violation:
                 violations.append(violation)
-        
+        if symbol in DATUM_REQUIRED_SYMBOLS and not gdt.get('datum_references'):
+            violations.extend(datum_violation(rule, symbol, location) for rule in self.datum_rules)
         return violations
     
-    def _check_single_rule(self, spec: dict, rule: ComplianceRule) -> Optional[Dict]:
-        """Check a single rule"""
-        
-        if rule.category == 'dimensional':
-            return self._check_dimensional_rule(spec, rule)
-        elif rule.category == 'material':
-            return self._check_material_rule(spec, rule)
-        elif rule.category == 'gdt':
-            return self._check_gdt_rule(spec, rule)
+    def field_violations(self, name: str, value) -> List[Dict]:
+        """
+        Violations a single field of a spec shows on its own - one
+        dimension, one GD&T callout, or the material against
+        allowed_materials - for checking a spec while it is still coming in.
         
-        return None
+        Rules that need the whole spec (aspect ratio, required material,
+        heat treatment) are left to evaluate(); everything reported here is
+        reported by evaluate() too.
+        """
+        if name in ('overall_dimensions', 'critical_dimensions'):
+            return self.dimension_violations(value) if self.dimension_rules else []
+        if name == 'gdt_requirements':
+            return self.gdt_violations(value)
+        violations = []
+        if name == 'material':
+            for rule in self.material_rules:
+                violation = rule.name == 'allowed_materials' and material_violation(rule, value or '', True)
+                if violation:
+                    violations.append(violation)
+        return violations
+
+
+def canonical_symbol(symbol_type: str) -> str:
+    """'True Position' -> 'position', 'Circular Runout' -> 'circular_runout'."""
+    key = '_'.join(symbol_type.lower().replace('-', ' ').split())
+    return _SYMBOL_ALIASES.get(key, key)
+
+
+def compile_rules(rules: Union[Dict, List[ComplianceRule]]) -> CompiledRules:
+    """
+    Compile rules once so that checking a spec doesn't loop over them.
     
-    def _check_dimensional_rule(self, spec: dict, rule: ComplianceRule) -> Optional[Dict]:
-        """Check dimensional compliance"""
-        
-        # Check in critical dimensions
-        for dim in spec.get('critical_dimensions', []):
-            if rule.name == 'min_wall_thickness' and 'wall' in dim.get('feature', '').lower():
-                if dim['value'] < rule.value:
-                    return {
-                        'rule': rule.name,
-                        'severity': rule.severity,
-                        'message': f"Wall thickness {dim['value']}{dim.get('unit', 'mm')} below minimum {rule.value}mm",
-                        'location': dim.get('feature', 'unknown')
-                    }
-        
-        # Check aspect ratios
-        if rule.name == 'max_aspect_ratio':
-            overall = spec.get('overall_dimensions', {})
-            if 'length' in overall and 'width' in overall:
-                ratio = overall['length'].get('value', 0) / max(overall['width'].get('value', 1), 0.001)
-                if ratio > rule.value:
-                    return {
-                        'rule': rule.name,
-                        'severity': rule.severity,
-                        'message': f"Aspect ratio {ratio:.2f} exceeds maximum {rule.value}",
-                        'location': 'overall dimensions'
-                    }
-        
-        return None
+    Like sorting a rulebook into tabs before an inspection: instead of
+    reading every rule for every feature, the inspector looks at a
+    feature, flips to its tab (wall thickness, hole diameter, position
+    tolerance...) and checks only the rules there. Rule limits are
+    converted to mm (degrees, µm) here, once, not per check.
     
-    def _check_material_rule(self, spec: dict, rule: ComplianceRule) -> Optional[Dict]:
-        """Check material compliance"""
-        
-        material = spec.get('material', '')
-        
-        if rule.name == 'require_material_spec' and rule.value and not material:
-            return {
-                'rule': rule.name,
-                'severity': rule.severity,
-                'message': "Material specification is required but not found",
-                'location': 'title block'
-            }
-        
-        if rule.name == 'allowed_materials' and material:
-            if material not in rule.value:
-                return {
-                    'rule': rule.name,
-                    'severity': 'warning',
-                    'message': f"Material '{material}' not in approved list",
-                    'location': 'title block'
-                }
+    Args:
+        rules: A rules dict (see parse_rules()) or parsed ComplianceRules
+    """
+    if isinstance(rules, dict):
+        rules = parse_rules(rules)
+    compiled = CompiledRules()
+    
+    for rule in rules:
+        name = rule.name.lower()
+        bound, _, subject = name.partition('_')
+        numeric = (rule.check_type == 'numeric' and bound in ('min', 'max')
+                   and subject and subject != 'tolerance_stack')
         
+        if numeric and (rule.category == 'gdt' or subject.endswith('_tolerance')):
+            # max_flatness in gdt_rules, or max_position_tolerance in numeric_rules
+            symbol = canonical_symbol(re.sub(r'_tolerance$', '', subject))
+            compiled.gdt_rules.setdefault(symbol, []).append(
+                _limit(rule, bound, f"{symbol.replace('_', ' ').title()} tolerance", 'length'))
+        elif rule.category == 'gdt' and name == 'require_datum_references':
+            if rule.value:
+                compiled.datum_rules.append(rule)
+        elif rule.category == 'dimensional' and numeric and subject == 'aspect_ratio':
+            compiled.aspect_ratio_rules.append(
+                _Limit(rule=rule, label="Aspect ratio", bound=bound, limit=float(rule.value), unit=''))
+        elif rule.category == 'dimensional' and numeric:
+            pattern, quantity = FEATURE_CATEGORIES.get(
+                subject, (r'\b' + r'[\s_-]*'.join(map(re.escape, subject.split('_'))), 'length'))
+            compiled.category_patterns[subject] = pattern
+            compiled.category_units[subject] = quantity
+            compiled.dimension_rules.setdefault(subject, []).append(
+                _limit(rule, bound, subject.replace('_', ' ').capitalize(), quantity))
+        elif rule.category == 'material' and name in ('require_material_spec', 'allowed_materials',
+                                                      'require_heat_treatment'):
+            compiled.material_rules.append(rule)
+        else:
+            compiled.unsupported.append(rule.name)
+    
+    compiled.index_features()
+    return compiled
+
+
+def _limit(rule: ComplianceRule, bound: str, label: str, quantity: str) -> _Limit:
+    limit = _to_base(rule.value, rule.unit, quantity)
+    if limit is None:
+        raise ValueError(f"Rule {rule.name}: unknown {quantity} unit {rule.unit!r}")
+    return _Limit(rule=rule, label=label, bound=bound, limit=limit, unit=_BASE_UNIT[quantity])
+
+
+def _to_base(value, unit: Optional[str], quantity: str) -> Optional[float]:
+    """A value in the quantity's base unit (no unit = already in it); None if unknown."""
+    if value is None:
+        return None
+    if not unit:
+        return float(value)
+    factor = unit_factor(unit, quantity)
+    return float(value) * factor if factor is not None else None
+
+
+def unit_factor(unit: str, quantity: str) -> Optional[float]:
+    """Factor from a unit to the quantity's base unit; None if unknown."""
+    return _TO_BASE_UNIT[quantity].get(unit.strip().lower().rstrip('.'))
+
+
+def aspect_ratio(overall_dimensions: Dict) -> Optional[float]:
+    """Overall length / width (to 2 decimals), or None without both."""
+    if 'length' not in overall_dimensions or 'width' not in overall_dimensions:
+        return None
+    length = _to_base(overall_dimensions['length'].get('value'), overall_dimensions['length'].get('unit'), 'length')
+    width = _to_base(overall_dimensions['width'].get('value'), overall_dimensions['width'].get('unit'), 'length')
+    if not length or not width:
+        return None
+    return round(length / width, 2)
+
+
+def has_heat_treatment(material: str, notes: List[str], title_block_info: Dict[str, str]) -> bool:
+    """Whether the material, a note or a title block entry specifies heat treatment."""
+    return any(_HEAT_TREATMENT.search(text or '')
+               for text in [material] + list(notes) + list(title_block_info.values()))
+
+
+def datum_violation(rule: ComplianceRule, symbol: str, location: str) -> Dict:
+    return _violation(rule, datum_message(symbol), location)
+
+
+def datum_message(symbol: str) -> str:
+    return f"{symbol.replace('_', ' ').title()} tolerance has no datum reference"
+
+
+def material_violation(rule: ComplianceRule, material: str, heat_treated: bool) -> Optional[Dict]:
+    """Violation of a material rule by a part with this material, if any."""
+    if rule.name == 'require_material_spec' and rule.value and not material:
+        message = "Material specification is required but not found"
+    elif rule.name == 'allowed_materials' and material and normalize_material(material) not in {
+            normalize_material(allowed) for allowed in rule.value}:
+        message = f"Material '{material}' not in approved list"
+    elif rule.name == 'require_heat_treatment' and rule.value and not heat_treated:
+        message = "Heat treatment is required but not specified"
+    else:
         return None
+    return _violation(rule, message, 'title block')
+
+
+def _violation(rule: ComplianceRule, message: str, location: str) -> Dict:
+    return {'rule': rule.name, 'severity': rule.severity, 'message': message, 'location': location}
+
+
+def normalize_material(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+@lru_cache(maxsize=32)
+def _compile_json(rules_json: str) -> CompiledRules:
+    return compile_rules(json.loads(rules_json))
+
+
+def format_violation(violation: Dict) -> str:
+    """One-line form of a violation, as stored in DrawingAnalysisResult."""
+    return f"[{violation['severity']}] {violation['rule']}: {violation['message']} ({violation['location']})"
+
+
+class ComplianceChecker:
+    """Check drawings against design rules"""
     
-    def _check_gdt_rule(self, spec: dict, rule: ComplianceRule) -> Optional[Dict]:
-        """Check GD&T compliance"""
-        
-        gdt_symbols = spec.get('gdt_requirements', [])
-        
-        for gdt in gdt_symbols:
-            symbol_type = gdt.get('symbol_type', '').lower()
-            tolerance = gdt.get('tolerance', 0)
-            
-            if f"max_{symbol_type}" == rule.name and tolerance > rule.value:
-                return {
-                    'rule': rule.name,
-                    'severity': rule.severity,
-                    'message': f"{symbol_type.title()} tolerance {tolerance} exceeds maximum {rule.value}",
-                    'location': gdt.get('applies_to', 'unknown feature')
-                }
+    def __init__(self, rules_file: Optional[str] = None):
+        self.rules = []
+        self._compiled = None
+        if rules_file:
+            self.load_rules(rules_file)
+    
+    def load_rules(self, rules_file: str):
+        """Load rules from JSON file"""
+        self.rules.extend(parse_rules(load_compliance_rules(rules_file)))
+        self._compiled = None
+    
+    def check_specification(self, spec: Union[dict, BaseModel],
+                            rules: Optional[Dict] = None) -> List[Dict]:
+        """
+        Check a part specification against the rules and return every violation.
         
-        return None
+        Args:
+            spec: PartSpecification or its model_dump()
+            rules: Rules dict to check against instead of the loaded rules;
+                compiled once and reused for later calls with equal rules
+        """
+        if isinstance(spec, BaseModel):
+            spec = spec.model_dump()
+        return self.compiled_rules(rules).evaluate(spec)
+    
+    def compiled_rules(self, rules: Optional[Dict] = None) -> CompiledRules:
+        """
+        The rules dict (or, without one, the loaded rules) compiled, e.g. to
+        check a spec field by field while it streams in. Equal rules dicts
+        share one compilation.
+        """
+        if rules is not None:
+            return _compile_json(json.dumps(rules, sort_keys=True, default=str))
+        if self._compiled is None:
+            self._compiled = compile_rules(self.rules)
+        return self._compiled
@@ -1,5 +1,4 @@
 from dataclasses import dataclass
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,20 +7,117 @@ load_dotenv()
 class CVConfig:
     min_region_area: int = 5000
     edge_threshold: tuple = (50, 150)
+    # LLM image payload budget
+    max_long_edge: int = 2048  # pixels, 0 = no downscaling
+    image_format: str = "jpeg"  # jpeg, webp or png
+    image_quality: int = 85
+    max_request_bytes: int = 4 * 1024 * 1024  # all images in one request
+    # Tiled processing of very large sheets
+    tile_size: int = 2048  # pixels, 0 = never tile
+    tile_overlap: int = 64
+    tile_threshold_pixels: int = 40_000_000
+    # Multi-page PDF/TIFF ingestion
+    render_dpi: int = 200
 
 @dataclass
 class LLMConfig:
     provider: str = "openai"
-    model: str = "gpt-4o-mini"
-    api_key: str = os.getenv("OPENAI_API_KEY", "")
+    model: str = ""  # "" = the provider's default model
+    api_key: str = ""  # "" = the provider's env var (OPENAI_API_KEY, ANTHROPIC_API_KEY)
+    base_url: str = ""  # provider endpoint override ("" = SDK default / env)
+    # Client-side scheduling (0 = unlimited)
+    requests_per_minute: int = 500
+    tokens_per_minute: int = 200_000
+    max_retries: int = 5
+    backoff_base: float = 1.0  # seconds, doubled per retry
+    backoff_max: float = 60.0
+    # "single" = one request per sheet; "regions" = one concurrent request
+    # per detected view / table / title block, merged afterwards
+    extraction_mode: str = "single"
+    region_concurrency: int = 8
+    # Stream the structured output (see LLMClient.analyze_stream); same
+    # result, and the llm stage records first_field_ms
+    stream: bool = False
+
+@dataclass
+class CascadeConfig:
+    # llm_config is the cheap / local first tier; extractions scoring
+    # below min_score are re-run on this stronger model
+    enabled: bool = False
+    escalation_provider: str = "openai"
+    escalation_model: str = ""  # "" = the provider's default escalation model
+    escalation_api_key: str = ""
+    escalation_base_url: str = ""
+    min_score: float = 0.7
+
+@dataclass
+class CacheConfig:
+    # Opt-in: writes a SQLite database under the working directory
+    enabled: bool = False
+    path: str = ".mech_dwg_cache/results.sqlite"
+    max_entries: int = 10000
+    max_bytes: int = 512 * 1024 * 1024
+
+@dataclass
+class SimilarityConfig:
+    # Reuse results of near-duplicate sheets (revisions): skip the LLM when
+    # nothing changed, re-extract only the changed regions otherwise
+    enabled: bool = False
+    path: str = ".mech_dwg_cache/similarity.sqlite"
+    max_distance: int = 6  # perceptual hash bits (< 8)
+    min_layout_similarity: float = 0.8
+    max_entries: int = 10000
+
+@dataclass
+class StoreConfig:
+    # Archive every result in a queryable SQLite store (see src/result_store.py)
+    enabled: bool = False
+    path: str = "analysis_results/results.sqlite"
+
+@dataclass
+class RAGConfig:
+    enabled: bool = False  # open (or build) the knowledge-base index at startup
+    knowledge_base_dir: str = "knowledge_base"
+    index_dir: str = ".mech_dwg_cache/rag_index"
+    # sentence-transformers model for dense retrieval ("" = BM25 only)
+    embedding_model: str = ""
+    top_k: int = 3
+    # Re-index changed files at startup (False: only follow the published
+    # version, e.g. in workers when a separate job runs python -m src.rag_engine)
+    auto_update: bool = True
+    reload_interval: float = 1.0  # seconds between checks for a new version
+
+@dataclass
+class TracingConfig:
+    enabled: bool = True  # keep recent spans in memory
+    jsonl_path: str = ""  # also append spans to this JSON-lines file
+    max_records: int = 10000
 
 @dataclass
 class AnalyzerConfig:
     cv_config: CVConfig = None
     llm_config: LLMConfig = None
+    cache_config: CacheConfig = None
+    cascade_config: CascadeConfig = None
+    rag_config: RAGConfig = None
+    similarity_config: SimilarityConfig = None
+    store_config: StoreConfig = None
+    tracing_config: TracingConfig = None
     
     def __post_init__(self):
         if self.cv_config is None:
             self.cv_config = CVConfig()
         if self.llm_config is None:
-            self.llm_config = LLMConfig()
\ No newline at end of file
+            self.llm_config = LLMConfig()
+        if self.cache_config is None:
+            self.cache_config = CacheConfig()
+        if self.cascade_config is None:
+            self.cascade_config = CascadeConfig()
+        if self.rag_config is None:
+            self.rag_config = RAGConfig()
+        if self.similarity_config is None:
+            self.similarity_config = SimilarityConfig()
+        if self.store_config is None:
+            self.store_config = StoreConfig()
+        if self.tracing_config is None:
+            self.tracing_config = TracingConfig()
\ No newline at end of file
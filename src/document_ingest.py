@@ -0,0 +1,209 @@
+"""
+Document Ingestion for Mechanical Drawings
+Streams the sheets of multi-page PDFs and TIFFs one page at a time
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator, Optional
+from pathlib import Path
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+
+
+PDF_SUFFIXES = ('.pdf',)
+TIFF_SUFFIXES = ('.tif', '.tiff')
+
+# PDF user space is 72 points per inch
+PDF_POINTS_PER_INCH = 72
+
+# Largest page decoded or rendered - an A0 / E-size sheet at 600 dpi
+MAX_PAGE_PIXELS = 600_000_000
+
+
+@dataclass
+class Page:
+    """One sheet of a drawing package, rasterized."""
+    number: int  # 1-based
+    image: Optional[np.ndarray]  # BGR or grayscale; None if the page failed
+    dpi: Optional[float] = None  # None when the source doesn't say
+    error: Optional[Exception] = None  # why the page could not be rasterized
+
+
+def is_document(path: str) -> bool:
+    """Whether the file is a format that can hold several sheets."""
+    return Path(path).suffix.lower() in PDF_SUFFIXES + TIFF_SUFFIXES
+
+
+def iter_pages(path: str, dpi: int = 200, max_pixels: int = MAX_PAGE_PIXELS) -> Iterator[Page]:
+    """
+    Yield the sheets of a drawing package one at a time.
+    
+    Like feeding a stack of prints through a scanner: only the sheet on
+    the glass is in memory, the rest of the document stays on disk.
+    Drop the previous page before asking for the next one and peak memory
+    stays at a single sheet.
+    
+    - PDF pages are rendered at `dpi` (needs pypdfium2)
+    - TIFF frames are decoded one at a time; frames scanned above `dpi`
+      are downsampled to it, lower-resolution frames are left alone
+    - Any other image is a single-page document
+    
+    A page that can't be rasterized (damaged, or larger than max_pixels)
+    is yielded with `error` set and no image, and the next page follows.
+    Pillow's decompression-bomb limit (~89 MP, less than an E-size sheet
+    scanned at 400 dpi) does not apply; max_pixels takes its place.
+    
+    Args:
+        path: Path to the PDF, TIFF or image file
+        dpi: Rendering resolution for PDF pages / cap for TIFF frames
+        max_pixels: Largest page decoded (TIFF) or rendered (PDF)
+    
+    Yields:
+        Page objects in document order
+    
+    Raises:
+        ValueError, OSError: the document itself can't be opened
+    """
+    if dpi <= 0:
+        raise ValueError("dpi must be positive")
+    
+    suffix = Path(path).suffix.lower()
+    if suffix in PDF_SUFFIXES:
+        yield from _iter_pdf_pages(path, dpi, max_pixels)
+    elif suffix in TIFF_SUFFIXES:
+        yield from _iter_tiff_pages(path, dpi, max_pixels)
+    else:
+        image = cv2.imread(str(path))
+        if image is None:
+            raise ValueError(f"Could not load image from {path}")
+        yield Page(number=1, image=image)
+
+
+def _iter_pdf_pages(path: str, dpi: int, max_pixels: int) -> Iterator[Page]:
+    pdfium = _import_pdfium()
+    pdf = pdfium.PdfDocument(str(path))
+    try:
+        for index in range(len(pdf)):
+            # Rendered inside the yield expression so this frame keeps no
+            # reference to the page while the consumer works on it
+            yield _pdf_page(pdf, index, dpi, max_pixels)
+    finally:
+        pdf.close()
+
+
+def _pdf_page(pdf, index: int, dpi: int, max_pixels: int) -> Page:
+    try:
+        return Page(number=index + 1, image=_render_pdf_page(pdf, index, dpi, max_pixels), dpi=dpi)
+    except Exception as e:
+        return Page(number=index + 1, image=None, dpi=dpi, error=e)
+
+
+def _render_pdf_page(pdf, index: int, dpi: int, max_pixels: int) -> np.ndarray:
+    page = pdf[index]
+    try:
+        width, height = page.get_size()
+        pixels = round(width * dpi / PDF_POINTS_PER_INCH) * round(height * dpi / PDF_POINTS_PER_INCH)
+        if pixels > max_pixels:
+            raise ValueError(f"Page {index + 1} would render at {pixels} pixels, more than {max_pixels}")
+        bitmap = page.render(scale=dpi / PDF_POINTS_PER_INCH)
+        try:
+            # pdfium renders BGR(x) - copy out before the bitmap is freed
+            return np.array(bitmap.to_numpy()[..., :3])
+        finally:
+            bitmap.close()
+    finally:
+        page.close()
+
+
+def _iter_tiff_pages(path: str, dpi: int, max_pixels: int) -> Iterator[Page]:
+    with _without_pillow_pixel_limit():
+        tiff = Image.open(path)
+    with tiff:
+        index = 0
+        while True:
+            try:
+                tiff.seek(index)
+            except EOFError:
+                return
+            except Exception as e:
+                # The frames after a damaged directory can't be found
+                yield Page(number=index + 1, image=None, error=e)
+                return
+            yield _tiff_page(tiff, index, dpi, max_pixels)
+            index += 1
+
+
+def _tiff_page(tiff: Image.Image, index: int, dpi: int, max_pixels: int) -> Page:
+    """The current frame of an open TIFF as a Page."""
+    frame_dpi = _frame_dpi(tiff)
+    target_dpi = dpi if frame_dpi and frame_dpi > dpi else frame_dpi
+    try:
+        width, height = tiff.size
+        if width * height > max_pixels:
+            raise ValueError(f"Page {index + 1} has {width * height} pixels, more than {max_pixels}")
+        with _without_pillow_pixel_limit():
+            image = _frame_to_array(tiff, frame_dpi, dpi)
+    except Exception as e:
+        return Page(number=index + 1, image=None, dpi=target_dpi, error=e)
+    return Page(number=index + 1, image=image, dpi=target_dpi)
+
+
+_pixel_limit_lock = threading.Lock()
+_pixel_limit_users = 0
+_pillow_pixel_limit = None
+
+
+@contextmanager
+def _without_pillow_pixel_limit():
+    """
+    Switch off Pillow's decompression-bomb check (Image.MAX_IMAGE_PIXELS)
+    while a TIFF is opened or a frame decoded; frames are checked against
+    max_pixels instead. Threads decoding at the same time share one switch.
+    """
+    global _pixel_limit_users, _pillow_pixel_limit
+    with _pixel_limit_lock:
+        if _pixel_limit_users == 0:
+            _pillow_pixel_limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        _pixel_limit_users += 1
+    try:
+        yield
+    finally:
+        with _pixel_limit_lock:
+            _pixel_limit_users -= 1
+            if _pixel_limit_users == 0:
+                Image.MAX_IMAGE_PIXELS = _pillow_pixel_limit
+
+
+def _frame_to_array(frame: Image.Image, frame_dpi: Optional[float], dpi: int) -> np.ndarray:
+    """Convert a decoded TIFF frame to 8-bit grayscale or BGR, capped at dpi."""
+    if frame.mode in ('1', 'L', 'I;16', 'I'):
+        image = np.array(frame.convert('L'))
+    else:
+        image = cv2.cvtColor(np.array(frame.convert('RGB')), cv2.COLOR_RGB2BGR)
+    
+    if frame_dpi and frame_dpi > dpi:
+        scale = dpi / frame_dpi
+        h, w = image.shape[:2]
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    return image
+
+
+def _frame_dpi(frame: Image.Image) -> Optional[float]:
+    dpi = frame.info.get('dpi')
+    if not dpi:
+        return None
+    return float(max(dpi))
+
+
+def _import_pdfium():
+    try:
+        import pypdfium2
+    except ImportError as e:
+        raise ImportError(
+            "PDF ingestion needs pypdfium2: pip install pypdfium2"
+        ) from e
+    return pypdfium2
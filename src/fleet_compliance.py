@@ -0,0 +1,204 @@
+"""
+Fleet-wide Compliance for Mechanical Drawing Analysis
+Re-checks stored specifications against a rule set, column by column
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, Union
+import json
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from src.compliance_rules import (
+    DATUM_REQUIRED_SYMBOLS, ComplianceRule, CompiledRules, aspect_ratio, canonical_symbol,
+    compile_rules, datum_message, has_heat_treatment, material_violation,
+    normalize_material, unit_factor
+)
+from src.models import PartSpecification
+
+VIOLATION_COLUMNS = ['part_id', 'rule', 'severity', 'message', 'location']
+
+
+@dataclass
+class FleetTables:
+    """
+    Stored specifications flattened into columns.
+    
+    Like a parts spreadsheet instead of a drawer of folders: to find every
+    wall under 2mm you scan one column instead of opening each folder.
+    Everything that doesn't depend on the rules (canonical GD&T symbols,
+    aspect ratios, heat treatment callouts) is worked out once here, so a
+    rule change only costs the comparisons.
+    
+    - parts: one row per part - part_id, material, material_key,
+      heat_treated, aspect_ratio
+    - dimensions: one row per overall or critical dimension - part (row
+      in parts), feature, value, unit (feature and unit categorical)
+    - gdt: one row per GD&T callout - part, symbol (canonical,
+      categorical), tolerance, has_datums, location
+    """
+    parts: pd.DataFrame
+    dimensions: pd.DataFrame
+    gdt: pd.DataFrame
+    
+    def __len__(self) -> int:
+        return len(self.parts)
+    
+    @classmethod
+    def from_specifications(cls, specifications: Iterable[Tuple[str, Union[PartSpecification, Dict]]]
+                            ) -> 'FleetTables':
+        """
+        Flatten (part_id, specification) pairs.
+        
+        Specifications may be PartSpecifications or their model_dump().
+        """
+        parts, dimensions, gdt = [], [], []
+        for part, (part_id, spec) in enumerate(specifications):
+            if isinstance(spec, BaseModel):
+                spec = spec.model_dump()
+            material = spec.get('material') or ''
+            overall = spec.get('overall_dimensions') or {}
+            parts.append((
+                part_id, material, normalize_material(material),
+                has_heat_treatment(material, spec.get('notes') or [], spec.get('title_block_info') or {}),
+                aspect_ratio(overall)
+            ))
+            for dim in list(overall.values()) + list(spec.get('critical_dimensions') or []):
+                dimensions.append((part, dim.get('feature') or '', dim.get('value'), dim.get('unit') or ''))
+            for callout in spec.get('gdt_requirements') or []:
+                gdt.append((part, callout.get('symbol_type') or '', callout.get('tolerance', 0),
+                            bool(callout.get('datum_references')),
+                            callout.get('applies_to') or 'unknown feature'))
+        
+        # A fleet repeats a small vocabulary of feature names, units and
+        # symbols; as categoricals each distinct value is matched only once
+        dimensions = pd.DataFrame(dimensions, columns=['part', 'feature', 'value', 'unit']).astype(
+            {'part': np.int64, 'feature': 'category', 'value': np.float64, 'unit': 'category'})
+        gdt = pd.DataFrame(gdt, columns=['part', 'symbol', 'tolerance', 'has_datums', 'location'])
+        gdt['symbol'] = gdt['symbol'].map({s: canonical_symbol(s) for s in gdt['symbol'].unique()})
+        gdt = gdt.astype({'part': np.int64, 'symbol': 'category', 'tolerance': np.float64, 'has_datums': bool})
+        return cls(
+            parts=pd.DataFrame(parts, columns=['part_id', 'material', 'material_key',
+                                               'heat_treated', 'aspect_ratio']),
+            dimensions=dimensions,
+            gdt=gdt
+        )
+    
+    @classmethod
+    def from_result_files(cls, paths: Iterable[Union[str, Path]]) -> 'FleetTables':
+        """
+        Flatten saved DrawingAnalysisResults (the *_analysis.json files
+        written by analyze_batch()), keyed by their file_path.
+        
+        Results that failed (error set) are skipped.
+        """
+        def specifications():
+            for path in paths:
+                with open(path, 'r') as f:
+                    result = json.load(f)
+                if not result.get('error'):
+                    yield result['file_path'], result['specification']
+        return cls.from_specifications(specifications())
+
+
+def check_fleet(tables: FleetTables,
+                rules: Union[Dict, List[ComplianceRule], CompiledRules]) -> pd.DataFrame:
+    """
+    Every violation of a rule set across a fleet of stored specifications.
+    
+    Each rule is one vectorized predicate over a column (dimension values
+    converted to the rule's unit, GD&T tolerances of one symbol, part
+    materials...); messages are only built for the rows that fail. The
+    violations are the same ones ComplianceChecker.check_specification()
+    reports part by part.
+    
+    Args:
+        tables: Flattened specifications (see FleetTables)
+        rules: A rules dict, parsed ComplianceRules or compile_rules() output
+    
+    Returns:
+        DataFrame with part_id, rule, severity, message and location
+        columns, one row per violation, grouped by part
+    """
+    compiled = rules if isinstance(rules, CompiledRules) else compile_rules(rules)
+    found = []
+    
+    dims = tables.dimensions
+    dim_parts, features = dims['part'].to_numpy(), dims['feature'].to_numpy()
+    in_base_unit = {}
+    for category, limits in compiled.dimension_rules.items():
+        quantity = compiled.category_units[category]
+        if quantity not in in_base_unit:
+            # No unit means the value is already in the base unit
+            factors = [unit_factor(unit, quantity) if unit else 1.0 for unit in dims['unit'].cat.categories]
+            in_base_unit[quantity] = dims['value'].to_numpy() * _per_row(dims['unit'], factors, np.float64)
+        values = in_base_unit[quantity]
+        matches = dims['feature'].cat.categories.str.contains(compiled.category_patterns[category], case=False)
+        applies = _per_row(dims['feature'], matches, bool)
+        for limit in limits:
+            rows = np.flatnonzero(applies & limit.violated(values))
+            found.append(_found(limit.rule, dim_parts[rows], [limit.message(v) for v in values[rows]],
+                                [feature or 'unknown' for feature in features[rows]]))
+    
+    gdt = tables.gdt
+    gdt_parts, symbols = gdt['part'].to_numpy(), gdt['symbol'].to_numpy(object)
+    tolerances, locations = gdt['tolerance'].to_numpy(), gdt['location'].to_numpy()
+    for symbol, limits in compiled.gdt_rules.items():
+        of_symbol = (gdt['symbol'] == symbol).to_numpy(bool)
+        for limit in limits:
+            rows = np.flatnonzero(of_symbol & limit.violated(tolerances))
+            found.append(_found(limit.rule, gdt_parts[rows], [limit.message(v) for v in tolerances[rows]],
+                                locations[rows]))
+    if compiled.datum_rules:
+        needs_datums = gdt['symbol'].cat.categories.isin(DATUM_REQUIRED_SYMBOLS)
+        rows = np.flatnonzero(_per_row(gdt['symbol'], needs_datums, bool) & ~gdt['has_datums'].to_numpy())
+        messages = [datum_message(symbol) for symbol in symbols[rows]]
+        for rule in compiled.datum_rules:
+            found.append(_found(rule, gdt_parts[rows], messages, locations[rows]))
+    
+    parts = tables.parts
+    ratios = parts['aspect_ratio'].to_numpy(np.float64, na_value=np.nan)
+    for limit in compiled.aspect_ratio_rules:
+        rows = np.flatnonzero(limit.violated(ratios))
+        found.append(_found(limit.rule, rows, [limit.message(v) for v in ratios[rows]], 'overall dimensions'))
+    
+    materials = parts['material'].to_numpy()
+    has_material = materials != ''
+    heat_treated = parts['heat_treated'].to_numpy(bool)
+    for rule in compiled.material_rules:
+        if rule.name == 'allowed_materials':
+            allowed = {normalize_material(material) for material in rule.value}
+            rows = np.flatnonzero(has_material & ~parts['material_key'].isin(allowed).to_numpy(bool))
+        elif rule.value:
+            rows = np.flatnonzero(~has_material if rule.name == 'require_material_spec' else ~heat_treated)
+        else:
+            continue
+        # Only allowed_materials messages name the material
+        messages = {material: material_violation(rule, material, False)['message']
+                    for material in set(materials[rows])}
+        found.append(_found(rule, rows, [messages[material] for material in materials[rows]], 'title block'))
+    
+    found = [frame for frame in found if len(frame)]
+    if not found:
+        return pd.DataFrame(columns=VIOLATION_COLUMNS)
+    violations = pd.concat(found, ignore_index=True).sort_values('part', kind='stable')
+    violations.insert(0, 'part_id', parts['part_id'].to_numpy()[violations.pop('part').to_numpy()])
+    return violations.reset_index(drop=True)[VIOLATION_COLUMNS]
+
+
+def _found(rule: ComplianceRule, part_rows: np.ndarray, messages: List[str], locations) -> pd.DataFrame:
+    return pd.DataFrame({
+        'part': np.asarray(part_rows, dtype=np.int64),
+        'rule': rule.name,
+        'severity': rule.severity,
+        'message': messages,
+        'location': locations
+    })
+
+
+def _per_row(column: pd.Series, per_category, dtype) -> np.ndarray:
+    """Expand values computed once per category of a categorical column to its rows."""
+    return np.asarray(per_category, dtype=dtype)[column.cat.codes.to_numpy()]
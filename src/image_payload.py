@@ -0,0 +1,267 @@
+"""
+Image Payload Module for Mechanical Drawing Analysis
+Encodes images for LLM requests under a size budget, only when needed
+"""
+
+from collections.abc import Mapping
+from typing import Dict, List, Optional
+import base64
+import cv2
+import numpy as np
+
+
+class ImageEncoder:
+    """
+    Encodes images as base64 data URLs within a payload budget.
+    
+    Like a shipping clerk packing a parcel:
+    - Shrinks oversized sheets to a maximum long edge first
+    - Packs them in a compact format (JPEG/WebP instead of PNG)
+    - Squeezes harder (lower quality, then smaller size) if the parcel
+      is still over the weight limit
+    """
+    
+    FORMATS = {
+        'jpeg': ('.jpg', 'image/jpeg', cv2.IMWRITE_JPEG_QUALITY),
+        'webp': ('.webp', 'image/webp', cv2.IMWRITE_WEBP_QUALITY),
+        'png': ('.png', 'image/png', None),
+    }
+    
+    MIN_QUALITY = 40
+    MIN_LONG_EDGE = 256
+    
+    def __init__(self,
+                 max_long_edge: int = 2048,
+                 image_format: str = "jpeg",
+                 quality: int = 85):
+        """
+        Args:
+            max_long_edge: Longest side in pixels after downscaling (0 = keep)
+            image_format: 'jpeg', 'webp' or 'png'
+            quality: Encoder quality for lossy formats (1-100)
+        """
+        image_format = image_format.lower()
+        if image_format == 'jpg':
+            image_format = 'jpeg'
+        if image_format not in self.FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        
+        self.max_long_edge = max_long_edge
+        self.image_format = image_format
+        self.quality = quality
+    
+    def encode(self, img: np.ndarray, max_bytes: Optional[int] = None) -> Optional[str]:
+        """
+        Encode an image as a data URL.
+        
+        Args:
+            img: BGR or grayscale image
+            max_bytes: Maximum length of the data URL (None = no limit)
+        
+        Returns:
+            Data URL string, or None if it cannot fit in max_bytes
+        """
+        # Memory-mapped / channel-flipped views must be contiguous for OpenCV
+        img = self._downscale(np.ascontiguousarray(img), self.max_long_edge)
+        quality = self.quality
+        
+        while True:
+            data_url = self._encode_once(img, quality)
+            if max_bytes is None or len(data_url) <= max_bytes:
+                return data_url
+            
+            # Too big - lower the quality first, then the resolution
+            if self.FORMATS[self.image_format][2] is not None and quality > self.MIN_QUALITY:
+                quality = max(self.MIN_QUALITY, quality - 15)
+                continue
+            
+            long_edge = max(img.shape[:2])
+            if long_edge <= self.MIN_LONG_EDGE:
+                return None
+            img = self._downscale(img, max(self.MIN_LONG_EDGE, int(long_edge * 0.75)))
+    
+    def _encode_once(self, img: np.ndarray, quality: int) -> str:
+        """Encode at a fixed quality without any budget checks."""
+        ext, mime, quality_flag = self.FORMATS[self.image_format]
+        params = [quality_flag, int(quality)] if quality_flag is not None else []
+        
+        ok, buffer = cv2.imencode(ext, img, params)
+        if not ok:
+            raise ValueError(f"Could not encode image as {self.image_format}")
+        
+        img_str = base64.b64encode(buffer.tobytes()).decode()
+        return f"data:{mime};base64,{img_str}"
+    
+    @staticmethod
+    def _downscale(img: np.ndarray, max_long_edge: int) -> np.ndarray:
+        """Shrink so the longest side is at most max_long_edge (never enlarges)."""
+        h, w = img.shape[:2]
+        long_edge = max(h, w)
+        if not max_long_edge or long_edge <= max_long_edge:
+            return img
+        
+        scale = max_long_edge / long_edge
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+
+
+class LazyImagePayload(Mapping):
+    """
+    The 'processed_images' handed to the LLM client, encoded on demand.
+    
+    Behaves like the old dict ('full', 'enhanced', 'regions'), but an image
+    is only encoded the first time somebody reads it. Images the LLM client
+    never sends are never encoded.
+    
+    'full' and region images share one per-request byte budget; the full
+    sheet is normally read first, so it gets first claim on the budget.
+    """
+    
+    KEYS = ('full', 'enhanced', 'regions')
+    
+    def __init__(self,
+                 image: np.ndarray,
+                 encoder: ImageEncoder,
+                 enhanced: Optional[np.ndarray] = None,
+                 regions: Optional[List[Dict]] = None,
+                 region_source: Optional[np.ndarray] = None,
+                 max_request_bytes: Optional[int] = None):
+        """
+        Args:
+            image: Original BGR image
+            encoder: Encoder holding the format/size settings
+            enhanced: Contrast-enhanced grayscale image (debug use)
+            regions: Detected Region descriptors (plain dicts are wrapped);
+                they are bound to this payload's image
+            region_source: Full-resolution image to crop regions from, when
+                `image` is a downscaled copy (tiled mode); defaults to `image`
+            max_request_bytes: Byte cap for all images sent in one request
+        """
+        self._image = image
+        self._enhanced = enhanced
+        self._region_source = image if region_source is None else region_source
+        self._encoder = encoder
+        self._encoded = {}
+        self.max_request_bytes = max_request_bytes
+        self.bytes_encoded = 0
+        self._budget_used = 0
+        self._regions = [r if isinstance(r, Region) else Region(r['type'], r['bbox'], r.get('area', 0))
+                         for r in (regions or [])]
+        for region in self._regions:
+            region.bind(self)
+    
+    def __getitem__(self, key):
+        if key == 'regions':
+            return self._regions
+        if key == 'full':
+            return self._cached('full', lambda: self._encode_budgeted(self._image))
+        if key == 'enhanced':
+            # Debug view only - never sent, so it doesn't use the budget
+            return self._cached('enhanced', lambda: self._encode(self._enhanced))
+        raise KeyError(key)
+    
+    def __iter__(self):
+        return iter(self.KEYS)
+    
+    def __len__(self):
+        return len(self.KEYS)
+    
+    def _cached(self, key: str, encode):
+        if key not in self._encoded:
+            self._encoded[key] = encode()
+        return self._encoded[key]
+    
+    def _encode(self, img: Optional[np.ndarray], max_bytes: Optional[int] = None) -> Optional[str]:
+        if img is None:
+            return None
+        data_url = self._encoder.encode(img, max_bytes)
+        if data_url is not None:
+            self.bytes_encoded += len(data_url)
+        return data_url
+    
+    def _encode_budgeted(self, img: Optional[np.ndarray]) -> Optional[str]:
+        """Encode within whatever is left of the per-request budget."""
+        if self.max_request_bytes is None:
+            return self._encode(img)
+        remaining = self.max_request_bytes - self._budget_used
+        if remaining <= 0:
+            return None
+        data_url = self._encode(img, remaining)
+        if data_url is not None:
+            self._budget_used += len(data_url)
+        return data_url
+    
+    def region_payload(self, region: 'Region') -> 'LazyImagePayload':
+        """
+        A payload whose 'full' image is just this region's crop, with a
+        byte budget of its own - for sending the region in its own request.
+        """
+        return LazyImagePayload(
+            image=region.crop(),
+            encoder=self._encoder,
+            max_request_bytes=self.max_request_bytes
+        )
+    
+    def __getstate__(self):
+        # Crossing a process boundary (e.g. analyze_batch CV workers):
+        # ship the payloads the LLM client sends, not the raw pixels
+        self['full']
+        for region in self._regions:
+            if region['type'] == 'title_block':
+                region.image
+        
+        state = self.__dict__.copy()
+        state['_image'] = None
+        state['_enhanced'] = None
+        state['_region_source'] = None
+        return state
+
+
+class Region(dict):
+    """
+    Lightweight descriptor of one detected region.
+    
+    A plain dict of 'type', 'bbox' and 'area' (so it prints and serializes
+    like before), bound to the shared sheet image it was detected on:
+    - crop() returns a numpy view into that image - no pixels are copied
+    - region['image'] encodes the crop for the LLM on first read
+    
+    Nothing is cropped or encoded for regions nobody asks about.
+    """
+    
+    def __init__(self, region_type: str, bbox: tuple, area: float,
+                 payload: Optional['LazyImagePayload'] = None):
+        super().__init__(type=region_type, bbox=tuple(int(v) for v in bbox), area=area)
+        self._payload = payload
+        self._encoded = False
+        self._image = None
+    
+    def bind(self, payload: 'LazyImagePayload') -> None:
+        """Attach the region to the payload holding its source image."""
+        self._payload = payload
+        self._encoded = False
+        self._image = None
+    
+    def crop(self) -> Optional[np.ndarray]:
+        """View of the region in the shared image (None once detached)."""
+        source = self._payload._region_source if self._payload is not None else None
+        if source is None:
+            return None
+        x, y, w, h = self['bbox']
+        return source[y:y+h, x:x+w]
+    
+    @property
+    def image(self) -> Optional[str]:
+        """The crop as a data URL, encoded within the request budget."""
+        if not self._encoded:
+            crop = self.crop()
+            if crop is not None:
+                self._image = self._payload._encode_budgeted(crop)
+            self._encoded = True
+        return self._image
+    
+    def __missing__(self, key):
+        # region['image'] keeps working for existing consumers
+        if key == 'image':
+            return self.image
+        raise KeyError(key)
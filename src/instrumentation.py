@@ -0,0 +1,190 @@
+"""
+Instrumentation for Mechanical Drawing Analysis
+Lightweight spans that time each pipeline stage and report to pluggable sinks
+"""
+
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from pathlib import Path
+import json
+import threading
+import time
+import uuid
+
+
+# The span the current thread / asyncio task is running in
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+class Span:
+    """
+    One timed stage of the pipeline.
+    
+    Like a stopwatch with a notepad: it measures wall and CPU time between
+    entering and leaving the `with` block, and any code running inside can
+    jot down counters (bytes encoded, tokens, retries) on it via
+    current_span() - without the span being passed around.
+    
+    Finished child spans are collected on their parent, so a root span
+    ends up with a per-stage breakdown (see stage_metrics()).
+    """
+    
+    def __init__(self, name: str, tracer: Optional['Tracer'] = None,
+                 parent: Optional['Span'] = None, **attributes):
+        self.name = name
+        self.tracer = tracer
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.attributes = dict(attributes)
+        self.children: List[Dict] = []
+        self.wall_ms = None
+        self.cpu_ms = None
+        self._token = None
+    
+    def set(self, **attributes) -> 'Span':
+        """Record attribute values (last write wins)."""
+        self.attributes.update(attributes)
+        return self
+    
+    def add(self, **counters) -> 'Span':
+        """Add to numeric counters, e.g. add(tokens_in=812, retries=1)."""
+        for key, amount in counters.items():
+            if amount:
+                self.attributes[key] = self.attributes.get(key, 0) + amount
+        return self
+    
+    def __enter__(self) -> 'Span':
+        self._token = _current_span.set(self)
+        self._start_time = time.time()
+        self._start_wall = time.perf_counter()
+        # thread_time: the LLM stage runs on worker threads in batch mode
+        self._start_cpu = time.thread_time()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_ms = (time.perf_counter() - self._start_wall) * 1000
+        self.cpu_ms = (time.thread_time() - self._start_cpu) * 1000
+        if exc_type is not None:
+            self.attributes['error'] = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        
+        record = self.record()
+        if self.parent is not None:
+            self.parent.children.append(record)
+        if self.tracer is not None:
+            self.tracer.emit(record)
+        return False
+    
+    def record(self) -> Dict:
+        """The finished span as a flat, JSON-serializable dict."""
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'parent': self.parent.name if self.parent is not None else None,
+            'start': getattr(self, '_start_time', None),
+            'wall_ms': round(self.wall_ms, 3) if self.wall_ms is not None else None,
+            'cpu_ms': round(self.cpu_ms, 3) if self.cpu_ms is not None else None,
+            **self.attributes
+        }
+    
+    def adopt(self, record: Dict):
+        """
+        Attach a span recorded elsewhere (e.g. in a CV worker process) as
+        a child of this one, and emit it.
+        """
+        record = dict(record, trace_id=self.trace_id, parent=self.name)
+        self.children.append(record)
+        if self.tracer is not None:
+            self.tracer.emit(record)
+    
+    def stage_metrics(self) -> Dict[str, Dict]:
+        """Per-stage metrics of the finished children, keyed by stage name."""
+        stages = {}
+        for child in self.children:
+            metrics = {k: v for k, v in child.items()
+                       if k not in ('trace_id', 'name', 'parent', 'start')}
+            stages[child['name']] = metrics
+        return stages
+
+
+class _NoopSpan(Span):
+    """Stand-in returned by current_span() outside any span."""
+    
+    def set(self, **attributes) -> 'Span':
+        return self
+    
+    def add(self, **counters) -> 'Span':
+        return self
+
+
+_NOOP_SPAN = _NoopSpan('noop')
+
+
+def current_span() -> Span:
+    """The innermost active span, or a no-op span if there is none."""
+    span = _current_span.get()
+    return span if span is not None else _NOOP_SPAN
+
+
+class Tracer:
+    """
+    Creates spans and hands finished ones to the sinks.
+    
+    Sinks are any objects with an emit(record: dict) method.
+    """
+    
+    def __init__(self, sinks: Optional[List] = None):
+        self.sinks = list(sinks) if sinks is not None else [InMemorySink()]
+    
+    def span(self, name: str, **attributes) -> Span:
+        """A span nested under the current one (a new trace if there is none)."""
+        return Span(name, tracer=self, parent=_current_span.get(), **attributes)
+    
+    def emit(self, record: Dict):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                # Telemetry must never break an analysis
+                print(f"  ⚠️ Trace sink {type(sink).__name__} failed: {e}")
+
+
+class InMemorySink:
+    """Keeps the most recent span records in memory (for tests and dashboards)."""
+    
+    def __init__(self, max_records: int = 10000):
+        self.records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+    
+    def emit(self, record: Dict):
+        with self._lock:
+            self.records.append(record)
+    
+    def by_stage(self) -> Dict[str, List[float]]:
+        """Wall times (ms) grouped by stage name - e.g. for percentiles."""
+        with self._lock:
+            records = list(self.records)
+        stages = {}
+        for record in records:
+            stages.setdefault(record['name'], []).append(record['wall_ms'])
+        return stages
+    
+    def clear(self):
+        with self._lock:
+            self.records.clear()
+
+
+class JsonLinesSink:
+    """Appends one JSON object per span to a file."""
+    
+    def __init__(self, path: str = "traces.jsonl"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+    
+    def emit(self, record: Dict):
+        line = json.dumps(record, default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
@@ -3,14 +3,40 @@ LLM Client Module for Mechanical Drawing Analysis
 Handles communication with various LLM providers
 """
 
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Callable, Iterator, Tuple, Union, get_args, get_origin
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from src.models import PartSpecification  # Fix import path
-import json
-import os
+from src.compliance_rules import CompiledRules, compile_rules
+from src.instrumentation import current_span
+from src.llm_errors import (
+    LLMError, LLMRateLimitError, LLMRequestError, LLMResponseError, LLMUnavailableError
+)
+from src.llm_providers import get_provider, tool_schema_json
+from src.rate_limiter import RateLimiter
+from src.stream_parser import IncrementalJSONParser
+import asyncio
+import itertools
+import random
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Confidence given to critical dimensions the model didn't rate
+DEFAULT_CONFIDENCE = 0.9
+
+
+@dataclass
+class StreamEvent:
+    """One piece of a streamed analysis (see LLMClient.analyze_stream)."""
+    kind: str  # 'field', 'violation' or 'specification'
+    path: Tuple = ()  # ('part_number',), ('critical_dimensions', 0)...
+    value: Any = None
+
+
 class LLMClient:
     """
     LLM Client for analyzing mechanical drawings.
@@ -19,12 +45,32 @@ class LLMClient:
     - OpenAI (GPT-4)
     - Anthropic (Claude)  
     - Local models (Ollama)
+    
+    Each provider is a plugin (see src/llm_providers.py) that only knows
+    its own API; rate limiting, retries, sanitizing and validation happen
+    here, the same way for all of them.
     """
     
+    # Rough per-request token estimates for the tokens-per-minute budget;
+    # the real usage from the response corrects the bucket afterwards
+    IMAGE_TOKEN_ESTIMATE = 1000
+    OUTPUT_TOKEN_RESERVE = 1000
+    
+    # Worth retrying: timeouts, conflicts, rate limits and server errors
+    RETRYABLE_STATUS = (408, 409, 429)
+    
     def __init__(self, 
                  provider: str = "openai",
                  model: str = None,
-                 api_key: str = None):
+                 api_key: str = None,
+                 max_connections: int = 64,
+                 base_url: Optional[str] = None,
+                 requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None,
+                 max_retries: int = 5,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0,
+                 rate_limiter: Optional[RateLimiter] = None):
         """
         Initialize the LLM client.
         
@@ -37,62 +83,49 @@ class LLMClient:
             provider: Which LLM provider to use
             model: Specific model name (defaults based on provider)
             api_key: API key for the provider
+            max_connections: Size of the HTTP connection pool shared by
+                all async requests from this client
+            base_url: Override the provider endpoint (proxy, self-hosted
+                gateway, Ollama host, local stub server)
+            requests_per_minute / tokens_per_minute: Provider budgets to
+                stay under (None = unlimited)
+            max_retries: Retries for rate limits and transient errors
+            backoff_base / backoff_max: Exponential backoff bounds (seconds)
+            rate_limiter: Share one limiter between several clients that
+                draw on the same provider quota (overrides the budgets)
         """
         self.provider = provider.lower()
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_minute, tokens_per_minute)
         
-        # Set default models based on provider
-        if model is None:
-            default_models = {
-                'openai': 'gpt-4o-mini',
-                'claude': 'claude-3-5-haiku-latest',
-                'ollama': 'llava:latest'
-            }
-            self.model = default_models.get(provider, 'gpt-4o-mini')
-        else:
-            self.model = model
+        # Provider plugin: knows how to build, send and parse requests
+        provider_class = get_provider(self.provider)
+        self._provider = provider_class(model=model, api_key=api_key, base_url=base_url)
+        self.model = self._provider.model
+        
+        # Async client is created lazily on first use (see _get_async_client)
+        self._async_client = None
         
         # Initialize the appropriate client
-        self._initialize_client(api_key)
+        self._initialize_client()
     
-    def _initialize_client(self, api_key: str = None):
+    def _initialize_client(self):
         """
         Initialize the API client for the selected provider.
         
         Like connecting to different services - each needs its own setup.
         """
-        if self.provider == 'openai':
-            from openai import OpenAI
-            
-            # Use provided key or get from environment
-            key = api_key or os.getenv("OPENAI_API_KEY")
-            if not key:
-                raise ValueError("OpenAI API key not provided and OPENAI_API_KEY not set")
-            
-            self.client = OpenAI(api_key=key)
-            
-        elif self.provider == 'claude':
-            import anthropic
-            
-            key = api_key or os.getenv("ANTHROPIC_API_KEY")
-            if not key:
-                raise ValueError("Anthropic API key not provided and ANTHROPIC_API_KEY not set")
-            
-            self.client = anthropic.Anthropic(api_key=key)
-            
-        elif self.provider == 'ollama':
-            # Ollama runs locally, no API key needed
-            try:
-                import ollama
-                self.client = ollama
-            except ImportError:
-                raise ImportError("Ollama package not installed. Run: pip install ollama")
-        else:
-            raise ValueError(f"Unsupported provider: {self.provider}")
+        self.client = self._provider.create_client()
+        self._api_key = self._provider.api_key
     
     def analyze(self, 
                 images: Dict,
                 prompt: str,
-                structured_output: type = PartSpecification) -> PartSpecification:
+                structured_output: type = PartSpecification,
+                context: str = "") -> PartSpecification:
         """
         Main analysis method - this is what the orchestrator calls.
         
@@ -103,88 +136,356 @@ class LLMClient:
         
         Args:
             images: Dictionary with processed images
-            prompt: The analysis instructions
+            prompt: The analysis instructions - keep them the same for
+                every drawing so providers can cache them as a prefix
             structured_output: The expected output format (Pydantic model)
+            context: Per-drawing text (regions, references, rules) sent
+                after the cacheable prefix
             
         Returns:
             PartSpecification object with extracted information
+            
+        Raises:
+            LLMError: a typed subclass (see src.llm_errors) when the
+                provider can't produce a result, instead of an empty spec
         """
-        if self.provider == "openai":
-            return self._analyze_with_openai(images, prompt, structured_output)
-        elif self.provider == "claude":
-            return self._analyze_with_claude(images, prompt, structured_output)
-        elif self.provider == "ollama":
-            return self._analyze_with_ollama(images, prompt, structured_output)
-        else:
-            raise ValueError(f"Unsupported provider: {self.provider}")
+        request = self._provider.build_request(images, prompt, structured_output, context)
+        response = self._send(
+            lambda: self._provider.send(self.client, request),
+            self._estimate_tokens(images, prompt + context, structured_output)
+        )
+        return self._parse_response(response, structured_output)
     
-    def _analyze_with_openai(self, 
-                            images: Dict, 
-                            prompt: str,
-                            output_model: type) -> PartSpecification:
+    def _parse_response(self, response, output_model: type) -> PartSpecification:
+        """Turn a provider response into the structured output model."""
+        tokens_in, tokens_out = self._provider.usage(response)
+        cache_read, cache_write = self._provider.cache_usage(response)
+        current_span().add(tokens_in=tokens_in, tokens_out=tokens_out,
+                           tokens_cached=cache_read, tokens_cache_write=cache_write)
+        
+        try:
+            function_args = self._provider.parse_response(response)
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+            raise LLMResponseError(
+                f"No usable structured output in {self.provider} response: {e}",
+                provider=self.provider
+            ) from e
+        
+        return self._to_output(function_args, output_model)
+    
+    def _to_output(self, function_args: Dict, output_model: type) -> PartSpecification:
+        """Sanitize the raw output dict and validate it into the output model."""
+        if not isinstance(function_args, dict):
+            raise LLMResponseError(f"{self.provider} structured output is not an object",
+                                   provider=self.provider)
+        
+        # Sanitize the response before creating the model
+        function_args = self._sanitize_llm_response(function_args)
+        
+        try:
+            return output_model(**function_args)
+        except ValidationError as e:
+            raise LLMResponseError(
+                f"{self.provider} response does not match {output_model.__name__}: {e}",
+                provider=self.provider
+            ) from e
+    
+    # ------------------------------------------------------------------
+    # Streaming
+    # ------------------------------------------------------------------
+    
+    def analyze_stream(self,
+                       images: Dict,
+                       prompt: str,
+                       structured_output: type = PartSpecification,
+                       context: str = "",
+                       compliance_rules: Optional[Union[Dict, CompiledRules]] = None
+                       ) -> Iterator[StreamEvent]:
         """
-        This is like having a conversation with GPT:
-        1. Show it the images
-        2. Ask it to analyze them
-        3. Request structured output
+        Streaming version of analyze(): the output field by field, as the
+        model writes it.
+        
+        Like an inspector calling out measurements while still walking
+        round the part instead of handing over the sheet at the end: the
+        part number and material arrive with the first few output tokens,
+        and each dimension can be checked against the rules while the rest
+        is still being generated. The tool-call arguments are parsed
+        incrementally (see src/stream_parser.py).
+        
+        Yields StreamEvents:
+        - 'field': a top-level value (path ('part_number',)) or one member
+          of a list or dict field (('critical_dimensions', 0),
+          ('overall_dimensions', 'length')), sanitized and validated on its
+          own - e.g. a Dimension. Members that don't validate on their own
+          are only reported by the final validation.
+        - 'violation': with compliance_rules, a violation dict as soon as
+          the dimension, GD&T callout or material it is about is complete;
+          violations of rules that need the whole spec follow at the end
+          (path ())
+        - 'specification': last, the validated output model - the same
+          one analyze() returns
+        
+        Raises:
+            LLMError: as analyze(). Only opening the stream is retried; a
+                stream that breaks off midway raises LLMUnavailableError
         """
-        # Build messages for the chat
-        messages = [
-            {
-                "role": "system",
-                "content": prompt
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Analyze this mechanical drawing:"},
-                    {"type": "image_url", "image_url": {"url": images['full']}}
-                ]
-            }
-        ]
-        
-        # Add detailed region images if available
-        for region in images.get('regions', []):
-            if region['type'] == 'title_block':
-                messages.append({
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": "Title block detail:"},
-                        {"type": "image_url", "image_url": {"url": region['image']}}
-                    ]
-                })
-        
-        # Use function calling for structured output
-        tools = [{
-            "type": "function",
-            "function": {
-                "name": "extract_specifications",
-                "description": "Extract structured specifications from drawing",
-                "parameters": output_model.model_json_schema()
-            }
-        }]
+        rules = compile_rules(compliance_rules) if isinstance(compliance_rules, dict) else compliance_rules
+        request = self._provider.build_request(images, prompt, structured_output, context)
+        estimated_tokens = self._estimate_tokens(images, prompt + context, structured_output)
+        span = current_span()
+        start = time.perf_counter()
+        stream, events = self._send(lambda: self._open_stream(request), estimated_tokens, settle=False)
         
+        parser = IncrementalJSONParser()
+        usage = [None, None, None, None]  # tokens in, out, cache read, cache write
+        reported = []
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                tools=tools,
-                tool_choice={"type": "function", "function": {"name": "extract_specifications"}}
-            )
-            
-            function_args = json.loads(
-                response.choices[0].message.tool_calls[0].function.arguments
-            )
-            
-            # Sanitize the response before creating the model
-            function_args = self._sanitize_llm_response(function_args)
-            
-            return output_model(**function_args)
-            
+            for event in events:
+                for i, count in enumerate(self._provider.stream_usage(event)):
+                    if count is not None:
+                        usage[i] = count
+                for path, value in parser.feed(self._provider.stream_text(event)):
+                    partial = self._partial(path, value, structured_output)
+                    if partial is None:
+                        continue
+                    if 'first_field_ms' not in span.attributes:
+                        span.set(first_field_ms=round((time.perf_counter() - start) * 1000, 3))
+                    path, value = partial
+                    yield StreamEvent('field', path, value)
+                    if rules is not None:
+                        fields = value.model_dump() if isinstance(value, BaseModel) else value
+                        for violation in rules.field_violations(path[0], fields):
+                            reported.append(violation)
+                            yield StreamEvent('violation', path, violation)
+        except LLMError:
+            raise
+        except ValueError as e:
+            raise LLMResponseError(f"Malformed structured output in {self.provider} stream: {e}",
+                                   provider=self.provider) from e
         except Exception as e:
-            print(f"❌ OpenAI API error: {e}")
-            return output_model()     
-
+            raise LLMUnavailableError(f"{self.provider} stream broke off: {e}",
+                                      provider=self.provider) from e
+        finally:
+            # Also when the stream broke off or the consumer stopped early;
+            # without a usage report the estimate stays charged
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+            tokens_in, tokens_out, cache_read, cache_write = usage
+            span.add(tokens_in=tokens_in, tokens_out=tokens_out,
+                     tokens_cached=cache_read, tokens_cache_write=cache_write)
+            self.rate_limiter.settle(estimated_tokens, self._total_tokens(tokens_in, tokens_out))
+        
+        try:
+            function_args = parser.close()
+        except ValueError as e:
+            raise LLMResponseError(f"Incomplete structured output in {self.provider} stream: {e}",
+                                   provider=self.provider) from e
+        specification = self._to_output(function_args, structured_output)
+        
+        if rules is not None:
+            # Whole-spec rules, and anything the members didn't show on their own
+            for violation in rules.evaluate(specification.model_dump()):
+                if violation in reported:
+                    reported.remove(violation)
+                else:
+                    yield StreamEvent('violation', (), violation)
+        yield StreamEvent('specification', (), specification)
+    
+    def _open_stream(self, request: Dict) -> Tuple[Any, Iterator]:
+        """
+        Start a streamed call; returns the stream (to close) and its events.
+        The first event is read here, so connection and HTTP errors surface
+        inside _send and are retried there.
+        """
+        stream = self._provider.send_stream(self.client, request)
+        try:
+            events = iter(stream)
+            first = next(events, None)
+        except BaseException:
+            # A failed attempt is retried - don't leave its connection open
+            getattr(stream, 'close', lambda: None)()
+            raise
+        return stream, (events if first is None else itertools.chain([first], events))
+    
+    def _partial(self, path: Tuple, value, output_model: type) -> Optional[Tuple[Tuple, Any]]:
+        """
+        (path, value) of a streamed field or field member, sanitized like
+        _sanitize_llm_response() would and validated on its own; None if
+        it doesn't validate.
+        """
+        name = path[0]
+        field = output_model.model_fields.get(name)
+        if field is None:
+            return None
+        annotation = field.annotation
+        
+        if len(path) == 2:
+            if get_origin(annotation) not in (list, dict):
+                return None
+            annotation = get_args(annotation)[-1]
+            if name == 'overall_dimensions' and isinstance(path[1], int):
+                # Given as a list, keyed by feature afterwards
+                if not isinstance(value, dict) or 'feature' not in value:
+                    return None
+                path = (name, self._dimension_key(value))
+            elif name == 'critical_dimensions' and isinstance(value, dict):
+                value.setdefault('confidence', DEFAULT_CONFIDENCE)
+        
+        try:
+            return path, _type_adapter(annotation).validate_python(value)
+        except (ValidationError, TypeError):
+            return None
+    
+    # ------------------------------------------------------------------
+    # Rate limiting and retries
+    # ------------------------------------------------------------------
+    
+    def _send(self, call: Callable, estimated_tokens: int, settle: bool = True):
+        """
+        Make a provider call within the rate limits, retrying transient failures.
+        
+        Like a polite courier: wait your turn at the counter (token bucket),
+        and if the counter says "come back later", come back later - after
+        exponential backoff with jitter, or exactly when Retry-After says.
+        
+        With settle=False the caller settles the token reservation itself,
+        once the real usage is known (streamed responses).
+        
+        Raises:
+            LLMRequestError: the request itself is bad (not retried)
+            LLMRateLimitError / LLMUnavailableError: retries exhausted
+        """
+        attempt = 0
+        while True:
+            time.sleep(self.rate_limiter.reserve(estimated_tokens))
+            try:
+                response = call()
+            except Exception as e:
+                # A failed attempt used the request slot, not the tokens
+                self.rate_limiter.settle(estimated_tokens, 0)
+                attempt += 1
+                time.sleep(self._retry_delay(e, attempt))
+                continue
+            if settle:
+                self.rate_limiter.settle(estimated_tokens, self._usage_tokens(response))
+            return response
+    
+    async def _send_async(self, call: Callable, estimated_tokens: int):
+        """Async version of _send (call returns an awaitable)."""
+        attempt = 0
+        while True:
+            await asyncio.sleep(self.rate_limiter.reserve(estimated_tokens))
+            try:
+                response = await call()
+            except Exception as e:
+                self.rate_limiter.settle(estimated_tokens, 0)
+                attempt += 1
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                continue
+            self.rate_limiter.settle(estimated_tokens, self._usage_tokens(response))
+            return response
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Decide what to do about a failed call.
+        
+        Returns the seconds to wait before retrying, or raises the typed
+        error if the failure is permanent or retries are used up.
+        """
+        if isinstance(error, LLMError):
+            raise error
+        
+        status = getattr(error, 'status_code', None)
+        retry_after = self._retry_after(error)
+        details = dict(provider=self.provider, status_code=status, attempts=attempt)
+        
+        if status == 429:
+            typed = LLMRateLimitError(
+                f"{self.provider} rate limit: {error}", retry_after=retry_after, **details
+            )
+        elif (status is not None and (status >= 500 or status in self.RETRYABLE_STATUS)) \
+                or self._is_connection_error(error):
+            typed = LLMUnavailableError(f"{self.provider} unavailable: {error}", **details)
+        elif status is not None:
+            raise LLMRequestError(f"{self.provider} rejected the request: {error}", **details) from error
+        else:
+            raise LLMError(f"{self.provider} call failed: {error}", **details) from error
+        
+        if attempt > self.max_retries:
+            raise typed from error
+        
+        # Exponential backoff with full jitter, so retries don't synchronize
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+            self.rate_limiter.pause(retry_after)
+        
+        current_span().add(retries=1)
+        print(f"  ⏳ {error.__class__.__name__} from {self.provider}, "
+              f"retry {attempt}/{self.max_retries} in {delay:.1f}s")
+        return delay
+    
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """Seconds from the Retry-After(-ms) header of an HTTP error, if any."""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if not headers:
+            return None
+        
+        value = headers.get('retry-after-ms')
+        if value is not None:
+            try:
+                return max(0.0, float(value) / 1000)
+            except ValueError:
+                pass
+        
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            # HTTP-date form
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _is_connection_error(error: Exception) -> bool:
+        """Timeouts and dropped connections, from whichever SDK raised them."""
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        
+        types = []
+        for module, name in (('httpx', 'TransportError'),
+                             ('openai', 'APIConnectionError'),
+                             ('anthropic', 'APIConnectionError')):
+            try:
+                types.append(getattr(__import__(module), name))
+            except (ImportError, AttributeError):
+                pass
+        return isinstance(error, tuple(types))
+    
+    def _usage_tokens(self, response) -> Optional[int]:
+        """Total tokens billed for a response, if the provider reports it."""
+        return self._total_tokens(*self._provider.usage(response))
+    
+    @staticmethod
+    def _total_tokens(tokens_in: Optional[int], tokens_out: Optional[int]) -> Optional[int]:
+        if tokens_in is None and tokens_out is None:
+            return None
+        return (tokens_in or 0) + (tokens_out or 0)
+    
+    def _estimate_tokens(self, images: Dict, prompt: str, output_model: type) -> int:
+        """Rough token count of a request, reserved before it is sent."""
+        text_chars = len(prompt) + len(tool_schema_json(output_model))
+        image_count = len(self._provider.images_to_send(images))
+        return text_chars // 4 + image_count * self.IMAGE_TOKEN_ESTIMATE + self.OUTPUT_TOKEN_RESERVE
+    
     def _sanitize_llm_response(self, response: Dict) -> Dict:
         """
         Fix common LLM response issues.
@@ -192,83 +493,124 @@ class LLMClient:
         Like a translator fixing grammar mistakes - the meaning is there,
         just needs the format adjusted.
         """
+        fixes = 0
+        
         # Fix overall_dimensions if it's a list
         if 'overall_dimensions' in response and isinstance(response['overall_dimensions'], list):
+            fixes += 1
             # Convert list to dict with standard keys
             dims_dict = {}
             for dim in response['overall_dimensions']:
                 if 'feature' in dim:
                     # Use feature name as key
-                    key = dim['feature'].lower().replace(' ', '_')
-                    dims_dict[key] = dim
+                    dims_dict[self._dimension_key(dim)] = dim
             response['overall_dimensions'] = dims_dict
         
         # Add default confidence if missing
         if 'critical_dimensions' in response:
             for dim in response['critical_dimensions']:
                 if 'confidence' not in dim:
-                    dim['confidence'] = 0.9  # Default confidence
+                    dim['confidence'] = DEFAULT_CONFIDENCE
+                    fixes += 1
         
-        return response 
+        # A response that needed fixing is less trustworthy (see cascade)
+        current_span().add(sanitize_fixes=fixes)
+        return response
+    
+    @staticmethod
+    def _dimension_key(dim: Dict) -> str:
+        """overall_dimensions key of a dimension given as a list item."""
+        return dim['feature'].lower().replace(' ', '_')
             
     
-    def _analyze_with_claude(self, 
-                           images: Dict, 
-                           prompt: str,
-                           output_model: type) -> PartSpecification:
+    def test_connection(self) -> bool:
         """
-        Analyze using Anthropic's Claude.
+        Test if the LLM client can connect to its provider.
         
-        Note: Implementation depends on Anthropic's current API structure.
+        Like doing a mic check before a presentation.
         """
-        # This is a placeholder - you'll implement when you need it
-        raise NotImplementedError(
-            "Claude integration coming soon! "
-            "Check Anthropic's vision API documentation."
-        )
+        try:
+            models = self._provider.list_models(self.client)
+            print(f"✅ Connected to {self.provider}. Available models: {len(models)}")
+            return True
+        except Exception as e:
+            print(f"❌ Connection test failed: {e}")
+            return False
+    
+    # ------------------------------------------------------------------
+    # Asyncio path
+    # ------------------------------------------------------------------
     
-    def _analyze_with_ollama(self, 
-                           images: Dict, 
-                           prompt: str,
-                           output_model: type) -> PartSpecification:
+    def _get_async_client(self):
         """
-        Analyze using local Ollama models.
+        Lazily create the asyncio client for the selected provider.
         
-        Great for privacy-sensitive drawings or offline work!
+        Every async request from this LLMClient goes through one pooled
+        HTTP client, so dozens of concurrent vision requests reuse the same
+        keep-alive connections instead of opening a new one each time.
+        The pool is bound to the event loop it is first used on.
         """
-        # This is a placeholder for Ollama implementation
-        raise NotImplementedError(
-            "Ollama integration coming soon! "
-            "Make sure you have a vision model like LLaVA installed."
+        if self._async_client is not None:
+            return self._async_client
+        
+        import httpx
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections
         )
+        self._async_client = self._provider.create_async_client(limits)
+        return self._async_client
     
-    def test_connection(self) -> bool:
+    async def analyze_async(self,
+                            images: Dict,
+                            prompt: str,
+                            structured_output: type = PartSpecification,
+                            context: str = "") -> PartSpecification:
         """
-        Test if the LLM client can connect to its provider.
+        Async version of analyze().
         
-        Like doing a mic check before a presentation.
+        Many of these can be awaited together (e.g. with asyncio.gather)
+        to keep lots of drawings in flight from a single process.
+        
+        Args:
+            images: Dictionary with processed images
+            prompt: The analysis instructions (cacheable prefix)
+            structured_output: The expected output format (Pydantic model)
+            context: Per-drawing text sent after the prefix
+            
+        Returns:
+            PartSpecification object with extracted information
         """
+        request = self._provider.build_request(images, prompt, structured_output, context)
+        client = self._get_async_client()
+        response = await self._send_async(
+            lambda: self._provider.send_async(client, request),
+            self._estimate_tokens(images, prompt + context, structured_output)
+        )
+        return self._parse_response(response, structured_output)
+    
+    async def test_connection_async(self) -> bool:
+        """Async version of test_connection() using the pooled async client."""
         try:
-            if self.provider == 'openai':
-                # Try a simple API call
-                response = self.client.models.list()
-                print(f"✅ Connected to OpenAI. Available models: {len(list(response.data))}")
-                return True
-                
-            elif self.provider == 'ollama':
-                # Check if Ollama is running
-                models = self.client.list()
-                print(f"✅ Connected to Ollama. Models: {len(models)}")
-                return True
-                
-            elif self.provider == 'claude':
-                # Test Claude connection
-                print("✅ Claude client initialized")
-                return True
-                
+            models = await self._provider.list_models_async(self._get_async_client())
+            print(f"✅ Connected to {self.provider}. Available models: {len(models)}")
+            return True
         except Exception as e:
             print(f"❌ Connection test failed: {e}")
             return False
+    
+    async def aclose(self):
+        """Close the pooled async HTTP client (a new one is created on next use)."""
+        if self._async_client is None:
+            return
+        await self._async_client.close()
+        self._async_client = None
+
+
+@lru_cache(maxsize=None)
+def _type_adapter(annotation) -> TypeAdapter:
+    """Validator for one field type, built once per process."""
+    return TypeAdapter(annotation)
 
 
 # Quick test function
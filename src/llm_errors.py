@@ -0,0 +1,37 @@
+"""
+LLM Errors for Mechanical Drawing Analysis
+Typed failures raised by LLMClient instead of returning empty specifications
+"""
+
+from typing import Optional
+
+
+class LLMError(Exception):
+    """Base class for everything that can go wrong talking to an LLM."""
+    
+    def __init__(self, message: str, provider: Optional[str] = None,
+                 status_code: Optional[int] = None, attempts: int = 1):
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        self.attempts = attempts
+
+
+class LLMRequestError(LLMError):
+    """The provider rejected the request (bad input, auth, unknown model) - retrying won't help."""
+
+
+class LLMRateLimitError(LLMError):
+    """Still rate limited (HTTP 429) after all retries."""
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None, **kwargs):
+        super().__init__(message, **kwargs)
+        self.retry_after = retry_after
+
+
+class LLMUnavailableError(LLMError):
+    """Server errors, timeouts or connection failures persisted through all retries."""
+
+
+class LLMResponseError(LLMError):
+    """The provider answered, but not with a usable structured output."""
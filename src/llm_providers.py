@@ -0,0 +1,459 @@
+"""
+LLM Provider Plugins for Mechanical Drawing Analysis
+One class per vision API; LLMClient handles everything they have in common
+"""
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import os
+
+
+# Name of the structured-output tool every provider is asked to call
+TOOL_NAME = "extract_specifications"
+TOOL_DESCRIPTION = "Extract structured specifications from drawing"
+
+_PROVIDERS: Dict[str, type] = {}
+
+
+def register_provider(name: str):
+    """Class decorator that makes a provider available to LLMClient by name."""
+    def decorator(cls):
+        cls.name = name
+        _PROVIDERS[name] = cls
+        return cls
+    return decorator
+
+
+def get_provider(name: str) -> type:
+    """Look up a registered provider class."""
+    try:
+        return _PROVIDERS[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unsupported provider: {name}") from None
+
+
+def available_providers() -> List[str]:
+    return list(_PROVIDERS)
+
+
+@lru_cache(maxsize=None)
+def tool_schema(output_model: type) -> Dict:
+    """
+    JSON schema of an output model, generated once per process.
+    
+    Every request shares the same dict (don't mutate it), so the tool
+    definition is byte-for-byte the same in each one - a prerequisite for
+    the providers' prompt prefix caching.
+    """
+    return output_model.model_json_schema()
+
+
+@lru_cache(maxsize=None)
+def tool_schema_json(output_model: type) -> str:
+    """tool_schema() serialized, also once per process."""
+    return json.dumps(tool_schema(output_model))
+
+
+class LLMProvider(ABC):
+    """
+    Plugin interface for a vision LLM backend.
+    
+    Like a power adapter for a different country: the appliance
+    (LLMClient - rate limiting, retries, sanitizing, validation) stays the
+    same, the adapter only knows how to talk to one kind of socket:
+    - create the SDK clients
+    - turn images + prompt into that API's request
+    - send it, and dig the raw output dict and token usage back out
+    - optionally, stream it: the output's JSON text piece by piece
+    """
+    
+    name = "base"
+    default_model = None
+    # Stronger model for the second tier of a model cascade (None = default_model)
+    escalation_model = None
+    
+    def __init__(self, model: Optional[str] = None, api_key: Optional[str] = None,
+                 base_url: Optional[str] = None):
+        self.model = model or self.default_model
+        self.api_key = api_key
+        self.base_url = base_url or None
+    
+    # Clients
+    
+    @abstractmethod
+    def create_client(self):
+        """Create the synchronous SDK client."""
+    
+    @abstractmethod
+    def create_async_client(self, limits):
+        """Create the asyncio SDK client with a pooled httpx.Limits."""
+    
+    # Requests
+    
+    @abstractmethod
+    def build_request(self, images: Dict, prompt: str, output_model: type,
+                      context: str = "") -> Dict:
+        """
+        Keyword arguments for one structured-extraction call.
+        
+        The tool schema and `prompt` (the static instructions) come first
+        and must not vary between drawings, so providers can cache them as
+        a prompt prefix; the per-drawing `context` and the images go after.
+        """
+    
+    @abstractmethod
+    def send(self, client, request: Dict):
+        """Make the call with the sync client."""
+    
+    @abstractmethod
+    async def send_async(self, client, request: Dict):
+        """Make the call with the async client."""
+    
+    @abstractmethod
+    def parse_response(self, response) -> Dict:
+        """
+        Raw structured output (before sanitizing) from a response.
+        
+        Raises ValueError, KeyError, AttributeError, etc. if the response
+        holds no usable output - LLMClient turns that into LLMResponseError.
+        """
+    
+    def usage(self, response) -> Tuple[Optional[int], Optional[int]]:
+        """(tokens in, tokens out) billed for a response, if reported."""
+        return None, None
+    
+    def cache_usage(self, response) -> Tuple[Optional[int], Optional[int]]:
+        """(prompt tokens read from, written to) the provider's prompt cache, if reported."""
+        return None, None
+    
+    # Streaming
+    
+    def send_stream(self, client, request: Dict) -> Iterable:
+        """Make the call with the sync client; iterate the events of the streamed response."""
+        raise NotImplementedError(f"{self.name} provider does not stream")
+    
+    def stream_text(self, event) -> str:
+        """The piece of structured output (JSON text) an event carries, '' if none."""
+        raise NotImplementedError(f"{self.name} provider does not stream")
+    
+    def stream_usage(self, event) -> Tuple[Optional[int], ...]:
+        """usage() + cache_usage() of an event; most events report nothing (None)."""
+        return self.usage(event) + self.cache_usage(event)
+    
+    # Connection checks
+    
+    @abstractmethod
+    def list_models(self, client) -> List:
+        """Cheap call used by LLMClient.test_connection()."""
+    
+    @abstractmethod
+    async def list_models_async(self, client) -> List:
+        """Async version of list_models()."""
+    
+    # Helpers shared by the providers
+    
+    @staticmethod
+    def images_to_send(images: Dict) -> List[Tuple[str, str]]:
+        """
+        (caption, data URL) pairs for the request: the full sheet first,
+        then title block close-ups. Images that didn't fit the byte budget
+        (None) are skipped.
+        """
+        pairs = []
+        if images.get('full'):
+            pairs.append(("Analyze this mechanical drawing:", images['full']))
+        for region in images.get('regions', []):
+            if region['type'] == 'title_block' and region['image']:
+                pairs.append(("Title block detail:", region['image']))
+        return pairs
+    
+    @staticmethod
+    def split_data_url(data_url: str) -> Tuple[str, str]:
+        """'data:image/jpeg;base64,XXXX' -> ('image/jpeg', 'XXXX')."""
+        header, _, data = data_url.partition(',')
+        media_type = header[len('data:'):].split(';')[0]
+        return media_type, data
+
+
+@register_provider('openai')
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions with function calling."""
+    
+    default_model = 'gpt-4o-mini'
+    escalation_model = 'gpt-4o'
+    
+    def create_client(self):
+        from openai import OpenAI
+        
+        # Use provided key or get from environment
+        key = self.api_key or os.getenv("OPENAI_API_KEY")
+        if not key:
+            raise ValueError("OpenAI API key not provided and OPENAI_API_KEY not set")
+        self.api_key = key
+        
+        # Retries are handled by LLMClient, which also honors our rate limits
+        return OpenAI(api_key=key, base_url=self.base_url, max_retries=0)
+    
+    def create_async_client(self, limits):
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        return AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=limits)
+        )
+    
+    def build_request(self, images: Dict, prompt: str, output_model: type,
+                      context: str = "") -> Dict:
+        # Build messages for the chat. Prefixes of 1024+ tokens (tools,
+        # then the system prompt) are cached automatically
+        messages = [{"role": "system", "content": prompt}]
+        if context:
+            messages.append({"role": "user", "content": context})
+        for caption, url in self.images_to_send(images):
+            messages.append({
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": caption},
+                    {"type": "image_url", "image_url": {"url": url}}
+                ]
+            })
+        
+        # Use function calling for structured output
+        tools = [{
+            "type": "function",
+            "function": {
+                "name": TOOL_NAME,
+                "description": TOOL_DESCRIPTION,
+                "parameters": tool_schema(output_model)
+            }
+        }]
+        
+        return {
+            "model": self.model,
+            "messages": messages,
+            "tools": tools,
+            "tool_choice": {"type": "function", "function": {"name": TOOL_NAME}}
+        }
+    
+    def send(self, client, request: Dict):
+        return client.chat.completions.create(**request)
+    
+    async def send_async(self, client, request: Dict):
+        return await client.chat.completions.create(**request)
+    
+    def parse_response(self, response) -> Dict:
+        return json.loads(response.choices[0].message.tool_calls[0].function.arguments)
+    
+    def send_stream(self, client, request: Dict) -> Iterable:
+        # Usage comes in a last chunk without choices
+        return client.chat.completions.create(**request, stream=True,
+                                              stream_options={"include_usage": True})
+    
+    def stream_text(self, event) -> str:
+        if not event.choices:
+            return ''
+        return ''.join(call.function.arguments or ''
+                       for call in event.choices[0].delta.tool_calls or []
+                       if call.index == 0 and call.function)
+    
+    def usage(self, response):
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None, None
+        return usage.prompt_tokens, usage.completion_tokens
+    
+    def cache_usage(self, response):
+        details = getattr(getattr(response, 'usage', None), 'prompt_tokens_details', None)
+        return getattr(details, 'cached_tokens', None), None
+    
+    def list_models(self, client) -> List:
+        return list(client.models.list().data)
+    
+    async def list_models_async(self, client) -> List:
+        return [m async for m in client.models.list()]
+
+
+@register_provider('claude')
+class AnthropicProvider(LLMProvider):
+    """Anthropic Messages API with a forced tool call."""
+    
+    default_model = 'claude-haiku-4-5'
+    escalation_model = 'claude-sonnet-4-6'
+    max_tokens = 4096
+    
+    def create_client(self):
+        import anthropic
+        
+        key = self.api_key or os.getenv("ANTHROPIC_API_KEY")
+        if not key:
+            raise ValueError("Anthropic API key not provided and ANTHROPIC_API_KEY not set")
+        self.api_key = key
+        
+        return anthropic.Anthropic(api_key=key, base_url=self.base_url, max_retries=0)
+    
+    def create_async_client(self, limits):
+        from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+        return AsyncAnthropic(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=limits)
+        )
+    
+    def build_request(self, images: Dict, prompt: str, output_model: type,
+                      context: str = "") -> Dict:
+        content = [{"type": "text", "text": context}] if context else []
+        for caption, url in self.images_to_send(images):
+            media_type, data = self.split_data_url(url)
+            content.append({"type": "text", "text": caption})
+            content.append({
+                "type": "image",
+                "source": {"type": "base64", "media_type": media_type, "data": data}
+            })
+        
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            # The breakpoint caches everything up to here: tools, then system
+            "system": [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}],
+            "messages": [{"role": "user", "content": content}],
+            "tools": [{
+                "name": TOOL_NAME,
+                "description": TOOL_DESCRIPTION,
+                "input_schema": tool_schema(output_model)
+            }],
+            "tool_choice": {"type": "tool", "name": TOOL_NAME}
+        }
+    
+    def send(self, client, request: Dict):
+        return client.messages.create(**request)
+    
+    async def send_async(self, client, request: Dict):
+        return await client.messages.create(**request)
+    
+    def parse_response(self, response) -> Dict:
+        for block in response.content:
+            if block.type == 'tool_use' and block.name == TOOL_NAME:
+                return dict(block.input)
+        raise ValueError(f"no {TOOL_NAME} tool call (stop_reason={response.stop_reason})")
+    
+    def send_stream(self, client, request: Dict) -> Iterable:
+        return client.messages.create(**request, stream=True)
+    
+    def stream_text(self, event) -> str:
+        if event.type == 'content_block_delta' and event.delta.type == 'input_json_delta':
+            return event.delta.partial_json
+        return ''
+    
+    def stream_usage(self, event):
+        # Input (and cache) tokens come first, the output count at the end
+        if event.type == 'message_start':
+            return self.usage(event.message) + self.cache_usage(event.message)
+        if event.type == 'message_delta':
+            return None, event.usage.output_tokens, None, None
+        return None, None, None, None
+    
+    def usage(self, response):
+        usage = getattr(response, 'usage', None)
+        if usage is None:
+            return None, None
+        return usage.input_tokens, usage.output_tokens
+    
+    def cache_usage(self, response):
+        usage = getattr(response, 'usage', None)
+        return (getattr(usage, 'cache_read_input_tokens', None),
+                getattr(usage, 'cache_creation_input_tokens', None))
+    
+    def list_models(self, client) -> List:
+        return list(client.models.list())
+    
+    async def list_models_async(self, client) -> List:
+        return [m async for m in client.models.list()]
+
+
+@register_provider('ollama')
+class OllamaProvider(LLMProvider):
+    """
+    Local Ollama vision model in JSON mode.
+    
+    Ollama has no forced tool call, so the schema goes into the system
+    prompt and format='json' makes the model answer with a JSON object.
+    """
+    
+    default_model = 'llava:latest'
+    
+    def create_client(self):
+        try:
+            import ollama
+        except ImportError:
+            raise ImportError("Ollama package not installed. Run: pip install ollama")
+        # Ollama runs locally, no API key needed; host defaults to OLLAMA_HOST
+        return ollama.Client(host=self.base_url)
+    
+    def create_async_client(self, limits):
+        from ollama import AsyncClient
+        # Extra kwargs are passed straight to its httpx.AsyncClient
+        return AsyncClient(host=self.base_url, limits=limits)
+    
+    def build_request(self, images: Dict, prompt: str, output_model: type,
+                      context: str = "") -> Dict:
+        pairs = self.images_to_send(images)
+        captions = " ".join(caption for caption, _ in pairs) or "Analyze this mechanical drawing:"
+        if context:
+            captions = f"{context}\n\n{captions}"
+        
+        return {
+            "model": self.model,
+            "messages": [
+                # Same system message every time, so the server can reuse
+                # the evaluated prefix
+                {"role": "system", "content": _json_mode_system_prompt(prompt, output_model)},
+                {
+                    "role": "user",
+                    "content": captions,
+                    # Ollama takes bare base64, not data URLs
+                    "images": [self.split_data_url(url)[1] for _, url in pairs]
+                }
+            ],
+            "format": "json",
+            "options": {"temperature": 0}
+        }
+    
+    def send(self, client, request: Dict):
+        return client.chat(**request)
+    
+    async def send_async(self, client, request: Dict):
+        return await client.chat(**request)
+    
+    def parse_response(self, response) -> Dict:
+        output = json.loads(response['message']['content'])
+        if not isinstance(output, dict):
+            raise ValueError("JSON output is not an object")
+        return output
+    
+    def usage(self, response):
+        return response.get('prompt_eval_count'), response.get('eval_count')
+    
+    def send_stream(self, client, request: Dict) -> Iterable:
+        return client.chat(**request, stream=True)
+    
+    def stream_text(self, event) -> str:
+        return event['message']['content']
+    
+    def list_models(self, client) -> List:
+        return list(client.list()['models'])
+    
+    async def list_models_async(self, client) -> List:
+        return list((await client.list())['models'])
+
+
+@lru_cache(maxsize=32)
+def _json_mode_system_prompt(prompt: str, output_model: type) -> str:
+    """System prompt with the schema spelled out, for APIs without tool calls."""
+    return (
+        f"{prompt}\n\nRespond only with a JSON object that matches this "
+        f"JSON schema:\n{tool_schema_json(output_model)}"
+    )
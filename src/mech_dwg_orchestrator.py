@@ -4,16 +4,79 @@ Refactored for modularity and dependency injection
 Co-Author: AI-assisted development with Claude (Anthropic)
 """
 
+import hashlib
 import json
-from typing import Dict, List, Optional
+import os
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from pathlib import Path
+import time
+import cv2
+import numpy as np
 
 # Import modular components (running from project root)
 from src.cv_processor import CVProcessor
-from src.llm_client import LLMClient
-from src.models import PartSpecification, DrawingAnalysisResult
+from src.llm_client import LLMClient, StreamEvent
+from src.llm_errors import LLMError
+from src.llm_providers import get_provider
+from src.models import (
+    PartSpecification, DrawingAnalysisResult, DocumentAnalysisResult, RevisionDiff
+)
 from src.config import AnalyzerConfig
-from src.compliance_rules import ComplianceChecker
+from src.compliance_rules import ComplianceChecker, format_violation
+from src.rag_engine import RAGEngine, SentenceTransformerEmbedder
+from src.cascade import CascadeStats, ExtractionScore, score_specification
+from src.region_extraction import extract_by_region, sum_region_counters
+from src.similarity_index import SimilarityIndex, diff_fingerprints
+from src.revision_diff import change_mask, diff_specifications, locate_changes, register_sheets
+from src.image_payload import Region
+from src.document_ingest import is_document, iter_pages
+from src.instrumentation import InMemorySink, JsonLinesSink, Span, Tracer
+from src.result_cache import ResultCache, file_digest, make_cache_key, schema_version
+from src.result_store import ResultStore
+
+
+# Static extraction instructions, sent first in every request. They never
+# vary between drawings so providers can serve them (and the tool schema)
+# from their prompt cache; see _build_analysis_context() for the rest.
+ANALYSIS_INSTRUCTIONS = """You are an expert mechanical engineer analyzing technical drawings.
+Extract the following information from this mechanical drawing:
+
+1. Part identification (number, name, material)
+2. Overall dimensions (length, width, height) with units and tolerances
+3. Critical dimensions with their tolerances and what they measure
+4. All GD&T symbols with their tolerances and datum references
+5. Different views present (top, front, side, section, etc.)
+6. Any notes or special requirements
+7. Title block information
+
+Focus on precision and completeness."""
+
+
+def _process_drawing_worker(cv_processor: CVProcessor, image_path: str,
+                            outputs: Optional[List[str]] = None) -> Dict:
+    """Run CV in a worker process (module-level so it can be pickled)."""
+    return _traced_cv(cv_processor.process_drawing, image_path, outputs)
+
+
+def _traced_cv(process, source, *args) -> Dict:
+    """
+    Run a CV call under its own 'cv' span.
+    
+    The span is not tied to a tracer because CV may run in another process;
+    its record travels with the results and is adopted by the drawing's
+    trace in _analyze_cv_results.
+    """
+    with Span('cv') as span:
+        cv_results = process(source, *args)
+        metadata = cv_results.get('metadata', {})
+        if 'image_shape' in metadata:
+            span.set(image_dims=list(metadata['image_shape'][:2]))
+        span.set(regions=len(cv_results.get('regions', [])))
+    cv_results['cv_span'] = span.record()
+    return cv_results
 
 
 class MechanicalDrawingAnalyzer:
@@ -32,7 +95,13 @@ class MechanicalDrawingAnalyzer:
                  cv_processor: Optional[CVProcessor] = None,
                  llm_client: Optional[LLMClient] = None,
                  compliance_checker: Optional[ComplianceChecker] = None,
-                 rag_engine=None):  # Future RAG integration
+                 rag_engine: Optional[RAGEngine] = None,
+                 result_cache: Optional[ResultCache] = None,
+                 tracer: Optional[Tracer] = None,
+                 escalation_llm: Optional[LLMClient] = None,
+                 similarity_index: Optional[SimilarityIndex] = None,
+                 result_store: Optional[ResultStore] = None,
+                 on_stream_event: Optional[Callable[[StreamEvent], None]] = None):
         """
         Initialize with dependency injection pattern.
         
@@ -46,7 +115,24 @@ class MechanicalDrawingAnalyzer:
             cv_processor: Computer vision module (if None, creates default)
             llm_client: LLM communication module (if None, creates default)
             compliance_checker: Rules checking module (if None, creates default)
-            rag_engine: RAG module for context retrieval (optional, for future)
+            rag_engine: Knowledge-base retrieval module (if None, creates one
+                when enabled in config)
+            result_cache: Cache of LLM extractions (if None, creates default
+                when enabled in config)
+            tracer: Receives per-stage timing spans (if None, creates one
+                with the sinks from config.tracing_config)
+            escalation_llm: Stronger model for low-scoring extractions (if
+                None, creates one when config.cascade_config is enabled)
+            similarity_index: Previously analyzed sheets, for reusing the
+                results of near-duplicates (if None, creates one when
+                config.similarity_config is enabled)
+            result_store: Archive every result is added to (if None, creates
+                one when config.store_config is enabled)
+            on_stream_event: With llm_config.stream, called with every
+                field and violation as it arrives, before the drawing's
+                result is ready. It runs in the thread doing the extraction;
+                current_span().trace_id there is the result's
+                processing_info['trace_id']
         """
         # Load configuration
         self.config = config or AnalyzerConfig()
@@ -55,22 +141,100 @@ class MechanicalDrawingAnalyzer:
         # If not provided, create default instances
         self.cv = cv_processor or CVProcessor(
             min_region_area=self.config.cv_config.min_region_area,
-            edge_threshold=self.config.cv_config.edge_threshold
+            edge_threshold=self.config.cv_config.edge_threshold,
+            max_long_edge=self.config.cv_config.max_long_edge,
+            image_format=self.config.cv_config.image_format,
+            image_quality=self.config.cv_config.image_quality,
+            max_request_bytes=self.config.cv_config.max_request_bytes,
+            tile_size=self.config.cv_config.tile_size,
+            tile_overlap=self.config.cv_config.tile_overlap,
+            tile_threshold_pixels=self.config.cv_config.tile_threshold_pixels
         )
         
         self.llm = llm_client or LLMClient(
             provider=self.config.llm_config.provider,
             model=self.config.llm_config.model,
-            api_key=self.config.llm_config.api_key
+            api_key=self.config.llm_config.api_key,
+            base_url=self.config.llm_config.base_url or None,
+            requests_per_minute=self.config.llm_config.requests_per_minute,
+            tokens_per_minute=self.config.llm_config.tokens_per_minute,
+            max_retries=self.config.llm_config.max_retries,
+            backoff_base=self.config.llm_config.backoff_base,
+            backoff_max=self.config.llm_config.backoff_max
         )
         
+        # Model cascade: self.llm is the cheap first tier, extractions that
+        # score below cascade_config.min_score are re-run on escalation_llm
+        cascade_config = self.config.cascade_config
+        if escalation_llm is None and cascade_config.enabled:
+            escalation_llm = LLMClient(
+                provider=cascade_config.escalation_provider,
+                model=(cascade_config.escalation_model
+                       or get_provider(cascade_config.escalation_provider).escalation_model),
+                api_key=cascade_config.escalation_api_key,
+                base_url=cascade_config.escalation_base_url or None,
+                requests_per_minute=self.config.llm_config.requests_per_minute,
+                tokens_per_minute=self.config.llm_config.tokens_per_minute,
+                max_retries=self.config.llm_config.max_retries,
+                backoff_base=self.config.llm_config.backoff_base,
+                backoff_max=self.config.llm_config.backoff_max
+            )
+        self.escalation_llm = escalation_llm
+        self.cascade_stats = CascadeStats()
+        
         self.compliance = compliance_checker or ComplianceChecker()
         
-        # RAG is optional for now - you'll build this!
+        # Knowledge-base retrieval: the index is built once and reopened
+        # (memory-mapped) by later runs
+        rag_config = self.config.rag_config
+        if rag_engine is None and rag_config.enabled:
+            rag_engine = RAGEngine(
+                knowledge_base_dir=rag_config.knowledge_base_dir,
+                index_dir=rag_config.index_dir,
+                embedder=(SentenceTransformerEmbedder(rag_config.embedding_model)
+                          if rag_config.embedding_model else None),
+                top_k=rag_config.top_k,
+                auto_update=rag_config.auto_update,
+                reload_interval=rag_config.reload_interval
+            )
         self.rag = rag_engine
         
-        # Results cache (useful for RAG later)
-        self._analysis_cache = {}
+        # Content-addressed cache: resubmitted drawings skip the LLM
+        cache_config = self.config.cache_config
+        if result_cache is None and cache_config.enabled:
+            result_cache = ResultCache(
+                path=cache_config.path,
+                max_entries=cache_config.max_entries,
+                max_bytes=cache_config.max_bytes
+            )
+        self.cache = result_cache
+        
+        # Near-duplicate index: revisions of analyzed sheets reuse their results
+        similarity_config = self.config.similarity_config
+        if similarity_index is None and similarity_config.enabled:
+            similarity_index = SimilarityIndex(
+                path=similarity_config.path,
+                max_distance=similarity_config.max_distance,
+                min_layout_similarity=similarity_config.min_layout_similarity,
+                max_entries=similarity_config.max_entries
+            )
+        self.similarity = similarity_index
+        
+        if result_store is None and self.config.store_config.enabled:
+            result_store = ResultStore(path=self.config.store_config.path)
+        self.store = result_store
+        self.on_stream_event = on_stream_event
+        
+        # Per-stage spans: wall/CPU time, bytes, tokens -> processing_info and sinks
+        if tracer is None:
+            tracing_config = self.config.tracing_config
+            sinks = []
+            if tracing_config.enabled:
+                sinks.append(InMemorySink(max_records=tracing_config.max_records))
+                if tracing_config.jsonl_path:
+                    sinks.append(JsonLinesSink(tracing_config.jsonl_path))
+            tracer = Tracer(sinks)
+        self.tracer = tracer
     
     def analyze_drawing(self, 
                        image_path: str,
@@ -92,7 +256,7 @@ class MechanicalDrawingAnalyzer:
             use_rag: Whether to use RAG for context (when you build it!)
             compliance_rules: Dict of rules to check against
             save_intermediate: Whether to save intermediate processing results
-            
+        
         Returns:
             DrawingAnalysisResult with all extracted information
         """
@@ -102,127 +266,792 @@ class MechanicalDrawingAnalyzer:
         
         # Step 1: Computer Vision Processing
         print(f"🔍 Processing image: {Path(image_path).name}")
-        cv_results = self.cv.process_drawing(image_path)
+        cv_results = _traced_cv(self.cv.process_drawing, image_path, self._cv_outputs(save_intermediate, use_rag))
         
-        if save_intermediate:
-            self._save_intermediate_results(image_path, "cv", cv_results)
+        return self._analyze_cv_results(
+            image_path, cv_results, use_rag, compliance_rules, save_intermediate
+        )
+    
+    def analyze_document(self,
+                         document_path: str,
+                         dpi: Optional[int] = None,
+                         use_rag: bool = False,
+                         compliance_rules: Optional[Dict] = None,
+                         save_intermediate: bool = False) -> DocumentAnalysisResult:
+        """
+        Analyze every sheet of a multi-page drawing package (PDF or TIFF).
         
-        # Step 2: RAG Context Retrieval (if enabled and available)
-        rag_context = None
-        if use_rag and self.rag:
-            print("📚 Retrieving similar drawings context...")
+        Pages are rasterized one at a time and each runs through the normal
+        pipeline before the next one is rendered, so the whole document is
+        never in memory at once. Plain images are treated as a one-sheet
+        document.
+        
+        A sheet that fails - including one that can't be rendered - is
+        recorded with `error` set (processing_info['failed_stage'] 'render',
+        'cv' or 'llm') and the rest of the document still gets analyzed.
+        
+        Args:
+            document_path: Path to the PDF, TIFF or image
+            dpi: Rendering resolution (None = cv_config.render_dpi)
+            use_rag: Whether to use RAG for context
+            compliance_rules: Dict of rules to check against
+            save_intermediate: Whether to save intermediate processing results
+        
+        Returns:
+            DocumentAnalysisResult with one DrawingAnalysisResult per sheet
+            (file_path "<document>#page=<n>") and a document-level rollup
+        """
+        if not Path(document_path).exists():
+            raise FileNotFoundError(f"Drawing not found: {document_path}")
+        
+        dpi = dpi or self.config.cv_config.render_dpi
+        print(f"📄 Processing document: {Path(document_path).name}")
+        
+        if not is_document(document_path):
+            sheets = [self.analyze_drawing(document_path, use_rag, compliance_rules, save_intermediate)]
+            return self._rollup_document(document_path, sheets, dpi)
+        
+        document_digest = file_digest(document_path) if self.cache is not None else None
+        sheets = []
+        for page in iter_pages(document_path, dpi):
+            sheet_path = f"{document_path}#page={page.number}"
+            print(f"🔍 Processing sheet {page.number}")
+            
+            stage = 'render'
             try:
-                rag_context = self.rag.retrieve_context(
-                    image_features=cv_results.get('features'),
-                    query_embedding=cv_results.get('embedding')
-                )
-                print(f"  Found {len(rag_context)} relevant references")
+                if page.error is not None:
+                    raise page.error
+                
+                stage = 'cv'
+                cv_results = _traced_cv(self.cv.process_image, page.image, self._cv_outputs(save_intermediate, use_rag))
+                cv_results['metadata']['page'] = page.number
+                cv_results['metadata']['dpi'] = page.dpi
+                
+                stage = 'llm'
+                image_digest = None
+                if document_digest is not None:
+                    image_digest = hashlib.sha256(
+                        f"{document_digest}:{page.number}:{dpi}".encode()
+                    ).hexdigest()
+                sheets.append(self._analyze_cv_results(
+                    sheet_path, cv_results, use_rag, compliance_rules,
+                    save_intermediate, image_digest=image_digest
+                ))
             except Exception as e:
-                print(f"  ⚠️ RAG retrieval failed: {e}")
-                # Continue without RAG context
+                print(f"  ❌ Sheet {page.number} failed during {stage}: {e}")
+                sheets.append(self._failed_result(sheet_path, stage, e))
+            
+            # Let go of this sheet's pixels before the next one is rendered
+            page = cv_results = None
         
-        # Step 3: LLM Analysis
-        print("🤖 Analyzing with LLM...")
-        analysis_prompt = self._build_analysis_prompt(cv_results, rag_context, compliance_rules)
+        return self._rollup_document(document_path, sheets, dpi)
+    
+    def analyze_revision(self,
+                         prev_result: DrawingAnalysisResult,
+                         new_image_path: str,
+                         compliance_rules: Optional[Dict] = None,
+                         max_changed_area: float = 0.5) -> DrawingAnalysisResult:
+        """
+        Analyze a new revision of a sheet, re-extracting only what changed.
         
-        specification = self.llm.analyze(
-            images=cv_results['processed_images'],
-            prompt=analysis_prompt,
-            structured_output=PartSpecification
-        )
+        Like a checker marking up rev B against the signed-off rev A: the
+        two prints are pinned together (ORB keypoints, refined by ECC), every
+        difference is clouded (pixel-difference mask), and only the clouded
+        title block, tables and views - plus a crop around each clouded area
+        outside them - are read again and patched into the previous
+        specification. If the sheets cannot be aligned, or more than
+        max_changed_area of the sheet would be re-read, the new revision is
+        extracted in full instead.
+        
+        Args:
+            prev_result: Analysis of the previous revision; its file_path
+                must still point at that image
+            new_image_path: Path to the new revision
+            compliance_rules: Dict of rules to check the new result against
+            max_changed_area: Largest fraction of the sheet worth patching
+        
+        Returns:
+            DrawingAnalysisResult of the new revision, with revision_diff
+            listing the changed regions, fields, dimensions, GD&T and notes
+        """
+        for path in (prev_result.file_path, new_image_path):
+            if not Path(path).exists():
+                raise FileNotFoundError(f"Drawing not found: {path}")
+        previous = cv2.imread(prev_result.file_path, cv2.IMREAD_GRAYSCALE)
+        if previous is None:
+            raise ValueError(f"Could not load image from {prev_result.file_path}")
+        
+        print(f"🔍 Processing revision: {Path(new_image_path).name} "
+              f"(previous: {Path(prev_result.file_path).name})")
+        outputs = list(dict.fromkeys(self._cv_outputs() + ['gray', 'region_payloads']))
+        cv_results = _traced_cv(self.cv.process_drawing, new_image_path, outputs)
+        cv_span = cv_results.pop('cv_span')
         
-        # Step 4: Compliance Checking
-        violations = []
-        if compliance_rules:
-            print("✅ Checking compliance...")
-            violations = self.compliance.check_specification(
-                specification.model_dump(),
-                compliance_rules
+        with self.tracer.span('drawing', file_path=new_image_path,
+                              previous_file=prev_result.file_path) as trace:
+            trace.adopt(cv_span)
+            sheet = cv_results['processed_images']
+            sheet_h, sheet_w = cv_results['metadata']['image_shape'][:2]
+            # 'gray' is a thumbnail on tiled sheets; regions are in sheet pixels
+            gray = cv_results['gray']
+            scale = gray.shape[1] / sheet_w
+            
+            diff = RevisionDiff(previous_file=prev_result.file_path)
+            jobs = None
+            with self.tracer.span('revision_diff') as span:
+                alignment = register_sheets(previous, gray)
+                if alignment is not None:
+                    diff.alignment = alignment.method
+                    mask = change_mask(previous, gray, alignment)
+                    region_payloads = cv_results['region_payloads']
+                    changed, extra = locate_changes(mask, [
+                        tuple(round(v * scale) for v in region['bbox']) for region, _ in region_payloads
+                    ], sheet=gray)
+                    jobs = [region_payloads[i] for i in changed]
+                    for box in extra:
+                        # Changes outside the detected regions: a crop of their own
+                        region = Region('drawing_view', tuple(round(v / scale) for v in box),
+                                        box[2] * box[3] / scale ** 2, payload=sheet)
+                        jobs.append((region, sheet.region_payload(region)))
+                    diff.changed_regions = [
+                        {'type': region['type'], 'bbox': list(region['bbox'])} for region, _ in jobs
+                    ]
+                    diff.changed_area = round(min(1.0, sum(
+                        region['bbox'][2] * region['bbox'][3] for region, _ in jobs
+                    ) / (sheet_w * sheet_h)), 4)
+                diff.full_reanalysis = jobs is None or diff.changed_area > max_changed_area
+                span.set(alignment=diff.alignment, changed_regions=len(diff.changed_regions),
+                         changed_area=diff.changed_area, full_reanalysis=diff.full_reanalysis)
+            
+            context = self._build_analysis_context(cv_results, None, compliance_rules)
+            cascade = None
+            if diff.full_reanalysis:
+                print("  Sheets could not be aligned or changed too much - full extraction")
+                if self.escalation_llm is None:
+                    specification, _ = self._extract(self.llm, 'llm', cv_results, context)
+                else:
+                    specification, cascade = self._extract_cascade(cv_results, context)
+            elif jobs:
+                print(f"🤖 Re-extracting {len(jobs)} changed region(s)...")
+                specification, _ = self._extract(self.llm, 'llm', dict(cv_results, region_payloads=jobs),
+                                                 context, seed=prev_result.specification)
+            else:
+                print("  ♻️ No changes - keeping the previous extraction")
+                specification = prev_result.specification.model_copy(deep=True)
+            
+            diff = diff.model_copy(update=diff_specifications(prev_result.specification, specification))
+            violations = self._check_compliance(specification, compliance_rules)
+            
+            stages = trace.stage_metrics()
+            result = DrawingAnalysisResult(
+                file_path=new_image_path,
+                specification=specification,
+                compliance_violations=violations,
+                cv_metadata=cv_results.get('metadata', {}),
+                revision_diff=diff,
+                processing_info={
+                    'cv_regions_found': len(cv_results.get('regions', [])),
+                    'llm_provider': self.config.llm_config.provider,
+                    'llm_model': getattr(self.llm, 'model', self.config.llm_config.model),
+                    'cascade': cascade,
+                    'tokens_cached': sum(stage.get('tokens_cached', 0) for stage in stages.values()),
+                    'trace_id': trace.trace_id,
+                    'stages': stages
+                }
             )
-            print(f"  Found {len(violations)} violations")
+            self._archive(result)
+        return result
+    
+    def _cv_outputs(self, save_intermediate: bool = False, use_rag: bool = False) -> List[str]:
+        """CV outputs the downstream stages of this run will actually read."""
+        outputs = list(CVProcessor.DEFAULT_OUTPUTS)  # LLM payload builder
+        if self.config.llm_config.extraction_mode == 'regions':
+            outputs.append('region_payloads')  # one request per region
+        if use_rag and self.rag:
+            outputs.append('features')  # retrieval query
+        if self.similarity is not None:
+            outputs.append('fingerprint')  # near-duplicate lookup
+            if 'region_payloads' not in outputs:
+                outputs.append('region_payloads')  # patching changed regions
+        if save_intermediate:
+            outputs += ['enhanced', 'text_mask']  # debug dump
+        return outputs
+    
+    def _rollup_document(self,
+                         document_path: str,
+                         sheets: List[DrawingAnalysisResult],
+                         dpi: int) -> DocumentAnalysisResult:
+        """Summarize per-sheet results at the document level."""
+        part_numbers, materials = [], []
+        for sheet in sheets:
+            spec = sheet.specification
+            if spec.part_number and spec.part_number not in part_numbers:
+                part_numbers.append(spec.part_number)
+            if spec.material and spec.material not in materials:
+                materials.append(spec.material)
         
-        # Step 5: Package Results
-        result = DrawingAnalysisResult(
-            file_path=image_path,
-            specification=specification,
-            compliance_violations=violations,
-            cv_metadata=cv_results.get('metadata', {}),
-            rag_context=rag_context,
+        return DocumentAnalysisResult(
+            file_path=document_path,
+            sheets=sheets,
+            page_count=len(sheets),
+            failed_pages=[n for n, sheet in enumerate(sheets, 1) if sheet.error],
+            part_numbers=part_numbers,
+            materials=materials,
+            total_violations=sum(len(sheet.compliance_violations) for sheet in sheets),
             processing_info={
-                'cv_regions_found': len(cv_results.get('regions', [])),
-                'rag_enabled': use_rag and self.rag is not None,
-                'rag_contexts_used': len(rag_context) if rag_context else 0,
+                'dpi': dpi,
+                'cache_hits': sum(1 for sheet in sheets if sheet.processing_info.get('cache_hit')),
                 'llm_provider': self.config.llm_config.provider,
-                'llm_model': self.config.llm_config.model
+                'llm_model': getattr(self.llm, 'model', self.config.llm_config.model)
             }
         )
+    
+    def analyze_batch(self,
+                      image_paths: Iterable[str],
+                      max_concurrency: int = 8,
+                      cv_workers: Optional[int] = None,
+                      use_rag: bool = False,
+                      compliance_rules: Optional[Dict] = None,
+                      save_individual: bool = False,
+                      output_dir: str = "batch_results") -> Iterator[DrawingAnalysisResult]:
+        """
+        Analyze many drawings concurrently, streaming results as they finish.
+        
+        Like running several assembly lines side by side:
+        - CV runs on a process pool (it is CPU-bound)
+        - LLM calls run on a bounded thread pool (they are network-bound)
+        - Finished drawings come off the line in completion order
+        
+        A drawing that fails at any stage is yielded as a result with
+        `error` set, so one bad file never aborts the run.
+        
+        Args:
+            image_paths: Paths of the drawings to analyze
+            max_concurrency: Maximum number of LLM requests in flight
+            cv_workers: CV worker processes (None = CPU count, 0 = run CV
+                inside the LLM threads instead of a process pool)
+            use_rag: Whether to use RAG for context
+            compliance_rules: Dict of rules to check against
+            save_individual: Whether to write one JSON file per drawing
+            output_dir: Directory for the individual JSON files
+        
+        Yields:
+            DrawingAnalysisResult for each drawing, in completion order
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        
+        if cv_workers is None:
+            cv_workers = os.cpu_count() or 1
+        
+        if save_individual:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
         
-        # Cache for potential RAG use later
-        self._analysis_cache[image_path] = result
+        paths = iter([str(p) for p in image_paths])
+        # Bound the work in flight so finished CV results don't pile up
+        # in memory while they wait for an LLM slot
+        max_in_flight = max_concurrency + 2 * cv_workers
+        in_flight = {}
+        
+        cv_pool = ProcessPoolExecutor(max_workers=cv_workers) if cv_workers > 0 else None
+        llm_pool = ThreadPoolExecutor(max_workers=max_concurrency)
+        
+        def submit_next():
+            while len(in_flight) < max_in_flight:
+                path = next(paths, None)
+                if path is None:
+                    return
+                if cv_pool is not None:
+                    future = cv_pool.submit(_process_drawing_worker, self.cv, path, self._cv_outputs(use_rag=use_rag))
+                    in_flight[future] = ('cv', path)
+                else:
+                    future = llm_pool.submit(
+                        self.analyze_drawing, path, use_rag, compliance_rules
+                    )
+                    in_flight[future] = ('analysis', path)
+        
+        try:
+            submit_next()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, path = in_flight.pop(future)
+                    try:
+                        value = future.result()
+                    except Exception as e:
+                        print(f"  ❌ {Path(path).name} failed during {stage}: {e}")
+                        result = self._failed_result(path, stage, e)
+                    else:
+                        if stage == 'cv':
+                            # CV done - hand off to the LLM pool
+                            llm_future = llm_pool.submit(
+                                self._analyze_cv_results,
+                                path, value, use_rag, compliance_rules
+                            )
+                            in_flight[llm_future] = ('llm', path)
+                            continue
+                        result = value
+                    
+                    if save_individual:
+                        self._save_result(result, Path(output_dir))
+                    yield result
+                submit_next()
+        finally:
+            # Consumer may stop early - don't start work nobody will read
+            for future in in_flight:
+                future.cancel()
+            llm_pool.shutdown(wait=True)
+            if cv_pool is not None:
+                cv_pool.shutdown(wait=True)
+    
+    def _analyze_cv_results(self,
+                            image_path: str,
+                            cv_results: Dict,
+                            use_rag: bool = False,
+                            compliance_rules: Optional[Dict] = None,
+                            save_intermediate: bool = False,
+                            image_digest: Optional[str] = None) -> DrawingAnalysisResult:
+        """
+        Run the RAG, LLM and compliance stages on finished CV results.
+        
+        image_digest identifies the pixels for the cache; it defaults to a
+        digest of the file at image_path.
+        """
+        cv_span = cv_results.pop('cv_span', None)
+        with self.tracer.span('drawing', file_path=image_path) as trace:
+            if cv_span is not None:
+                trace.adopt(cv_span)
+            
+            if save_intermediate:
+                self._save_intermediate_results(image_path, "cv", cv_results)
+            
+            # Step 2: RAG Context Retrieval (if enabled and available)
+            rag_context = None
+            if use_rag and self.rag:
+                print("📚 Retrieving similar drawings context...")
+                with self.tracer.span('rag') as span:
+                    try:
+                        rag_context = self.rag.retrieve_context(
+                            image_features=cv_results.get('features'),
+                            query_embedding=cv_results.get('embedding')
+                        )
+                        span.set(contexts=len(rag_context),
+                                 query=(cv_results.get('features') or {}).get('query'))
+                        print(f"  Found {len(rag_context)} relevant references")
+                    except Exception as e:
+                        span.set(error=f"{type(e).__name__}: {e}")
+                        print(f"  ⚠️ RAG retrieval failed: {e}")
+                        # Continue without RAG context
+            
+            # Step 3: LLM Analysis
+            print("🤖 Analyzing with LLM...")
+            analysis_context = self._build_analysis_context(cv_results, rag_context, compliance_rules)
+            
+            cache_key = None
+            specification = None
+            if self.cache is not None:
+                with self.tracer.span('cache') as span:
+                    cache_key = make_cache_key(
+                        image_digest=image_digest or file_digest(image_path),
+                        prompt=f"{ANALYSIS_INSTRUCTIONS}\n\n{analysis_context}",
+                        provider=getattr(self.llm, 'provider', self.config.llm_config.provider),
+                        model=self._extraction_model(),
+                        version=schema_version(PartSpecification),
+                        settings=self._request_settings()
+                    )
+                    specification = self.cache.get(cache_key, PartSpecification)
+                    span.set(hit=specification is not None)
+                if specification is not None:
+                    print("  ♻️ Cache hit - skipping LLM call")
+            
+            cache_hit = specification is not None
+            cascade = None
+            similar = None
+            streamed = None  # violations already found while the output streamed in
+            if not cache_hit:
+                fingerprint = cv_results.get('fingerprint')
+                if self.similarity is not None and fingerprint is not None:
+                    specification, similar = self._from_similar(cv_results, analysis_context)
+                if specification is None:
+                    if self.escalation_llm is None:
+                        found = []
+                        specification, span = self._extract(self.llm, 'llm', cv_results, analysis_context,
+                                                            compliance_rules=compliance_rules, violations=found)
+                        if span.attributes.get('streamed'):
+                            streamed = found
+                    else:
+                        specification, cascade = self._extract_cascade(cv_results, analysis_context)
+                if (self.similarity is not None and fingerprint is not None
+                        and not (similar and similar['mode'] == 'reused')):
+                    self.similarity.add(self._similarity_namespace(), fingerprint,
+                                        specification, image_path)
+                if cache_key is not None:
+                    self.cache.put(cache_key, specification)
+            
+            # Step 4: Compliance Checking
+            violations = self._check_compliance(specification, compliance_rules, streamed)
+            
+            # Step 5: Package Results
+            # Finished stages so far - packaging itself is not included
+            stages = trace.stage_metrics()
+            result = DrawingAnalysisResult(
+                file_path=image_path,
+                specification=specification,
+                compliance_violations=violations,
+                cv_metadata=cv_results.get('metadata', {}),
+                rag_context=rag_context,
+                processing_info={
+                    'cv_regions_found': len(cv_results.get('regions', [])),
+                    'rag_enabled': use_rag and self.rag is not None,
+                    'rag_contexts_used': len(rag_context) if rag_context else 0,
+                    'llm_provider': self.config.llm_config.provider,
+                    'llm_model': getattr(self.llm, 'model', self.config.llm_config.model),
+                    'cache_hit': cache_hit,
+                    'cascade': cascade,
+                    'similar': similar,
+                    # Prompt tokens served from the provider's prefix cache
+                    'tokens_cached': sum(stage.get('tokens_cached', 0) for stage in stages.values()),
+                    'trace_id': trace.trace_id,
+                    'stages': stages
+                }
+            )
+            self._archive(result)
         
         return result
     
-    def _build_analysis_prompt(self, 
-                              cv_results: Dict,
-                              rag_context: Optional[List[Dict]],
-                              compliance_rules: Optional[Dict]) -> str:
+    def _extract(self, llm: LLMClient, stage: str, cv_results: Dict,
+                 context: str, seed: Optional[PartSpecification] = None,
+                 compliance_rules: Optional[Dict] = None,
+                 violations: Optional[List[Dict]] = None) -> Tuple[PartSpecification, Span]:
         """
-        Build the analysis prompt for the LLM.
+        One traced LLM extraction; returns the specification and its span.
+        
+        In 'regions' extraction mode the sheet is extracted region by
+        region (see src/region_extraction.py); the span then sums the
+        counters of the per-region requests. With a seed specification
+        only cv_results['region_payloads'] are extracted and patched into it.
         
-        Like writing a detailed work order for a specialist:
-        - What to look for (base instructions)
+        Otherwise, with llm_config.stream, the output is streamed (the span
+        gets streamed=True): compliance_rules are checked field by field
+        as it comes in and each violation is appended to `violations` as
+        soon as it is found.
+        """
+        images = cv_results['processed_images']
+        region_payloads = None
+        if seed is not None or self.config.llm_config.extraction_mode == 'regions':
+            region_payloads = cv_results.get('region_payloads')
+        with self.tracer.span(
+            stage,
+            provider=getattr(llm, 'provider', self.config.llm_config.provider),
+            model=getattr(llm, 'model', self.config.llm_config.model),
+            retries=0
+        ) as span:
+            if region_payloads is None:
+                request = dict(
+                    images=images,
+                    prompt=ANALYSIS_INSTRUCTIONS,
+                    structured_output=PartSpecification,
+                    context=context
+                )
+                if self.config.llm_config.stream:
+                    specification = self._stream(llm, request, compliance_rules, violations)
+                    span.set(streamed=True)
+                else:
+                    specification = llm.analyze(**request)
+                # Images are encoded lazily, i.e. while the request is built
+                span.set(bytes_encoded=getattr(images, 'bytes_encoded', None))
+            else:
+                specification, info = extract_by_region(
+                    llm, region_payloads, images, ANALYSIS_INSTRUCTIONS, self.tracer,
+                    context=context,
+                    max_workers=self.config.llm_config.region_concurrency,
+                    seed=seed
+                )
+                span.set(**info)
+                span.add(**sum_region_counters(span))
+                span.set(bytes_encoded=sum(
+                    getattr(payload, 'bytes_encoded', 0)
+                    for payload in [images] + [payload for _, payload in region_payloads]
+                ))
+        return specification, span
+    
+    def _stream(self, llm: LLMClient, request: Dict, compliance_rules: Optional[Dict],
+                violations: Optional[List[Dict]]) -> PartSpecification:
+        """Consume a streamed extraction, passing its events on as they arrive."""
+        rules = self.compliance.compiled_rules(compliance_rules) if compliance_rules else None
+        specification = None
+        for event in llm.analyze_stream(**request, compliance_rules=rules):
+            if self.on_stream_event is not None:
+                self.on_stream_event(event)
+            if event.kind == 'violation' and violations is not None:
+                violations.append(event.value)
+            elif event.kind == 'specification':
+                specification = event.value
+        return specification
+    
+    def _extract_cascade(self, cv_results: Dict, context: str) -> Tuple[PartSpecification, Dict]:
+        """
+        Extract with the cheap model, escalating weak results.
+        
+        Like a junior engineer whose work only goes to the senior for review
+        when it looks shaky: the first tier's answer is scored (confidence,
+        missing fields, schema fixes) and only drawings below min_score -
+        or where the first tier failed outright - are re-run on the
+        stronger model. The encoded images are reused for the second call.
+        """
+        min_score = self.config.cascade_config.min_score
+        latency_ms = {}
+        
+        start = time.perf_counter()
+        try:
+            specification, span = self._extract(self.llm, 'llm', cv_results, context)
+            score = score_specification(specification, span.attributes.get('sanitize_fixes', 0))
+        except LLMError as e:
+            specification = None
+            score = ExtractionScore(0.0, [f"first tier failed: {type(e).__name__}"])
+        latency_ms['tier1'] = (time.perf_counter() - start) * 1000
+        
+        cascade = {
+            'tier': 1,
+            'score': round(score.score, 3),
+            'reasons': score.reasons,
+            'escalated': score.score < min_score
+        }
+        if cascade['escalated']:
+            print(f"  ⬆️ Score {score.score:.2f} < {min_score} - escalating to "
+                  f"{self.escalation_llm.model}")
+            start = time.perf_counter()
+            try:
+                escalated, span = self._extract(self.escalation_llm, 'llm_escalation', cv_results, context)
+            except LLMError as e:
+                if specification is None:
+                    raise
+                # Keep the weak answer rather than none
+                print(f"  ⚠️ Escalation failed, keeping first tier result: {e}")
+                cascade['escalation_error'] = f"{type(e).__name__}: {e}"
+            else:
+                specification = escalated
+                cascade['tier'] = 2
+                cascade['escalated_score'] = round(score_specification(
+                    escalated, span.attributes.get('sanitize_fixes', 0)
+                ).score, 3)
+            finally:
+                latency_ms['tier2'] = (time.perf_counter() - start) * 1000
+        
+        self.cascade_stats.record(cascade['escalated'], latency_ms)
+        cascade['latency_ms'] = {tier: round(ms, 1) for tier, ms in latency_ms.items()}
+        return specification, cascade
+    
+    def _from_similar(self, cv_results: Dict,
+                      context: str) -> Tuple[Optional[PartSpecification], Optional[Dict]]:
+        """
+        Reuse or patch the result of a previously analyzed near-duplicate.
+        
+        Like a checker handed rev C of a sheet they signed off at rev B:
+        they lay the two prints over each other and only re-check the
+        clouded areas. If no ink changed, the old specification is reused
+        as is; if the changes all fall inside extractable regions, only
+        those regions go to the LLM and are patched into it. Anything else
+        (changes outside the regions, a failed patch) needs a full extraction.
+        
+        Returns:
+            (specification, or None if a full extraction is needed;
+             processing_info['similar'], or None without a near-duplicate)
+        """
+        fingerprint = cv_results['fingerprint']
+        regions = cv_results.get('regions', [])
+        region_payloads = cv_results.get('region_payloads') or []
+        
+        with self.tracer.span('similarity') as span:
+            match = self.similarity.nearest(self._similarity_namespace(), fingerprint)
+            span.set(match=match is not None)
+            if match is None:
+                return None, None
+            
+            # Only changes inside a region with its own payload can be patched
+            extractable = {(region['type'], region['bbox']) for region, _ in region_payloads}
+            changes = diff_fingerprints(match.fingerprint, fingerprint, [
+                i for i, region in enumerate(regions) if (region['type'], region['bbox']) in extractable
+            ])
+            if changes is None or changes.unassigned_cells:
+                mode = 'full'
+            else:
+                mode = 'patched' if changes.regions else 'reused'
+            similar = {
+                'file_path': match.file_path,
+                'distance': match.distance,
+                'layout_similarity': match.layout_similarity,
+                'mode': mode,
+                'changed_cells': changes.changed_cells if changes is not None else None,
+                'changed_regions': [regions[i]['type'] for i in changes.regions] if mode == 'patched' else []
+            }
+            span.set(distance=match.distance, mode=mode)
+        
+        if mode == 'full':
+            return None, similar
+        if mode == 'reused':
+            print(f"  ♻️ Unchanged from {match.file_path} - skipping LLM call")
+            return match.specification, similar
+        
+        print(f"  ✏️ Near-duplicate of {match.file_path} - re-extracting "
+              f"{len(changes.regions)} changed region(s)")
+        changed = {(regions[i]['type'], regions[i]['bbox']) for i in changes.regions}
+        patch_results = dict(cv_results, region_payloads=[
+            (region, payload) for region, payload in region_payloads
+            if (region['type'], region['bbox']) in changed
+        ])
+        try:
+            specification, _ = self._extract(self.llm, 'llm', patch_results, context, seed=match.specification)
+        except LLMError as e:
+            print(f"  ⚠️ Patching failed, running a full extraction: {e}")
+            similar.update(mode='full', error=f"{type(e).__name__}: {e}")
+            return None, similar
+        return specification, similar
+    
+    def _check_compliance(self, specification: PartSpecification,
+                          compliance_rules: Optional[Dict],
+                          streamed: Optional[List[Dict]] = None) -> List[str]:
+        """
+        Traced compliance check (no rules, no violations).
+        
+        streamed: the violations analyze_stream() already found while the
+        specification came in - the same ones a check would find, so the
+        spec isn't checked a second time.
+        """
+        if not compliance_rules:
+            return []
+        print("✅ Checking compliance...")
+        with self.tracer.span('compliance', streamed=streamed is not None) as span:
+            violations = streamed
+            if violations is None:
+                violations = self.compliance.check_specification(specification, compliance_rules)
+            span.set(violations=len(violations))
+        print(f"  Found {len(violations)} violations")
+        return [format_violation(v) for v in violations]
+    
+    def _archive(self, result: DrawingAnalysisResult):
+        """Add a finished result to the result store, if there is one."""
+        if self.store is not None:
+            with self.tracer.span('store'):
+                self.store.add(result)
+    
+    def _extraction_model(self) -> str:
+        """Model (or cascade of models) that produces this analyzer's extractions."""
+        model = getattr(self.llm, 'model', self.config.llm_config.model)
+        if self.escalation_llm is not None:
+            # Cascade results may come from either tier
+            model = f"{model}>{self.escalation_llm.model}"
+        return model
+    
+    def _request_settings(self) -> str:
+        """Settings that change what is sent for the same image (part of the cache key)."""
+        encoder = getattr(self.cv, 'encoder', None)
+        return json.dumps({
+            'extraction_mode': self.config.llm_config.extraction_mode,
+            'max_long_edge': getattr(encoder, 'max_long_edge', None),
+            'image_format': getattr(encoder, 'image_format', None),
+            'image_quality': getattr(encoder, 'quality', None),
+            'max_request_bytes': getattr(self.cv, 'max_request_bytes', None)
+        }, sort_keys=True)
+    
+    def _similarity_namespace(self) -> str:
+        """Only results of the same provider, model and schema are reused."""
+        provider = getattr(self.llm, 'provider', self.config.llm_config.provider)
+        return f"{provider}:{self._extraction_model()}:{schema_version(PartSpecification)}"
+    
+    def get_cascade_stats(self) -> Dict:
+        """Escalation rate and mean latency per tier since startup."""
+        return self.cascade_stats.summary()
+    
+    def _failed_result(self, image_path: str, stage: str, error: Exception) -> DrawingAnalysisResult:
+        """Record a drawing that could not be analyzed."""
+        return DrawingAnalysisResult(
+            file_path=image_path,
+            specification=PartSpecification(),
+            error=f"{type(error).__name__}: {error}",
+            processing_info={
+                'failed_stage': stage,
+                'llm_provider': self.config.llm_config.provider,
+                'llm_model': getattr(self.llm, 'model', self.config.llm_config.model)
+            }
+        )
+    
+    def _save_result(self, result: DrawingAnalysisResult, output_dir: Path):
+        """Save a single analysis result as JSON."""
+        output_path = output_dir / f"{self._output_stem(result.file_path)}_analysis.json"
+        with open(output_path, 'w') as f:
+            json.dump(result.model_dump(), f, indent=2, default=str)
+    
+    @staticmethod
+    def _output_stem(file_path: str) -> str:
+        """File name stem for outputs; sheets of a document get a page suffix."""
+        path, _, page = file_path.partition('#page=')
+        stem = Path(path).stem
+        return f"{stem}_page{page}" if page else stem
+    
+    def _build_analysis_context(self, 
+                                cv_results: Dict,
+                                rag_context: Optional[List[Dict]],
+                                compliance_rules: Optional[Dict]) -> str:
+        """
+        Build the per-drawing part of the LLM request.
+        
+        Like the cover sheet clipped to a standard work order: the work
+        order itself (ANALYSIS_INSTRUCTIONS) is the same for every drawing,
+        the cover sheet carries what is specific to this one:
         - Reference examples (RAG context)
         - Special requirements (compliance rules)
+        - What CV found on the sheet
+        
+        It is sent after the instructions and tool schema, so those stay a
+        byte-stable prefix the provider can cache.
         """
-        base_prompt = """You are an expert mechanical engineer analyzing technical drawings. 
-        Extract the following information from this mechanical drawing:
-
-        1. Part identification (number, name, material)
-        2. Overall dimensions (length, width, height) with units and tolerances
-        3. Critical dimensions with their tolerances and what they measure
-        4. All GD&T symbols with their tolerances and datum references
-        5. Different views present (top, front, side, section, etc.)
-        6. Any notes or special requirements
-        7. Title block information
-
-        Focus on precision and completeness."""
+        sections = []
         
         # Add RAG context if available
         if rag_context:
-            base_prompt += "\n\n## Reference Context from Similar Drawings:\n"
+            section = "## Reference Context from Similar Drawings:\n"
             for idx, context in enumerate(rag_context[:3], 1):  # Limit to top 3
-                base_prompt += f"\n### Reference {idx}:\n"
+                section += f"\n### Reference {idx}:\n"
                 # Domain knowledge context
-                base_prompt += f"- Standard: {context.get('title', 'Unknown')}\n"
-                base_prompt += f"- Relevance: {context.get('content', 'Unknown')}\n"
-                base_prompt += f"- Key specs: {context.get('summary', 'N/A')}\n"
+                section += f"- Standard: {context.get('title', 'Unknown')}\n"
+                section += f"- Relevance: {context.get('content', 'Unknown')}\n"
+                section += f"- Key specs: {context.get('summary', 'N/A')}\n"
+            sections.append(section)
         
         # Add compliance rules if provided
-        if compliance_rules:
-            base_prompt += "\n\n## Compliance Requirements to Check:\n"
-            if 'text_rules' in compliance_rules:
-                for rule in compliance_rules['text_rules']:
-                    base_prompt += f"- {rule}\n"
+        if compliance_rules and compliance_rules.get('text_rules'):
+            section = "## Compliance Requirements to Check:\n"
+            for rule in compliance_rules['text_rules']:
+                section += f"- {rule}\n"
+            sections.append(section)
         
-        # Add CV-detected regions info
+        # Add CV-detected regions info (sorted, so the same sheet always
+        # gives the same text - and the same cache key)
         if 'regions' in cv_results:
-            base_prompt += f"\n\n## Detected Regions:\n"
             region_types = [r['type'] for r in cv_results['regions']]
-            base_prompt += f"Found {len(region_types)} regions: {', '.join(set(region_types))}\n"
+            sections.append(
+                f"## Detected Regions:\n"
+                f"Found {len(region_types)} regions: {', '.join(sorted(set(region_types)))}\n"
+            )
         
-        return base_prompt
+        return "\n".join(sections)
     
     def _save_intermediate_results(self, image_path: str, stage: str, data: Dict):
         """Save intermediate processing results for debugging/analysis."""
         output_dir = Path("intermediate_results")
         output_dir.mkdir(exist_ok=True)
         
-        filename = f"{Path(image_path).stem}_{stage}.json"
+        filename = f"{self._output_stem(image_path)}_{stage}.json"
         output_path = output_dir / filename
         
-        # Remove non-serializable data (like images)
-        clean_data = {k: v for k, v in data.items() 
-                     if not k.endswith('_image') and k != 'processed_images'}
+        # Images are written next to the JSON, not into it
+        clean_data = {}
+        for k, v in data.items():
+            if isinstance(v, np.ndarray):
+                cv2.imwrite(str(output_dir / f"{self._output_stem(image_path)}_{stage}_{k}.png"), v)
+            elif not k.endswith('_image') and k != 'processed_images':
+                clean_data[k] = v
         
         with open(output_path, 'w') as f:
             json.dump(clean_data, f, indent=2, default=str)
@@ -239,10 +1068,12 @@ class MechanicalDrawingAnalyzer:
         - Can test different implementations easily
         
         Args:
-            component_name: 'cv', 'llm', 'compliance', or 'rag'
+            component_name: 'cv', 'llm', 'escalation_llm', 'compliance', 'rag',
+                'cache', 'similarity', 'store' or 'tracer'
             new_component: The new component instance
         """
-        valid_components = ['cv', 'llm', 'compliance', 'rag']
+        valid_components = ['cv', 'llm', 'escalation_llm', 'compliance', 'rag', 'cache',
+                            'similarity', 'store', 'tracer']
         if component_name not in valid_components:
             raise ValueError(f"Component must be one of {valid_components}")
         
@@ -265,12 +1096,12 @@ class MechanicalDrawingAnalyzer:
             📁 File: {Path(result.file_path).name}
             🏷️ Part Number: {spec.part_number or 'Not specified'}
             🔧 Material: {spec.material or 'Not specified'}
-
+            
             📐 Dimensions:
             - Critical dimensions found: {len(spec.critical_dimensions)}
             - Views identified: {', '.join([v.view_type for v in spec.views])}
             - GD&T requirements: {len(spec.gdt_requirements)}
-
+            
             """
         if result.compliance_violations:
             summary += f"""⚠️ Compliance Issues: {len(result.compliance_violations)}"""
@@ -22,7 +22,7 @@ class DrawingView(BaseModel):
     view_type: str = Field(description="top, front, side, section, detail, isometric")
     scale: Optional[str] = Field(None, description="Scale if specified (e.g., '1:2')")
     contains_features: List[str] = Field(description="List of visible features")
-    
+
 class PartSpecification(BaseModel):
     """Complete part specification from drawing"""
     part_number: Optional[str] = None
@@ -34,6 +34,60 @@ class PartSpecification(BaseModel):
     notes: List[str] = Field(default_factory=list)
     title_block_info: Dict[str, str] = Field(default_factory=dict)
 
+# Narrower schemas for region-by-region extraction (see src/region_extraction.py):
+# each cropped region only asks for what it can actually show
+
+class ViewExtraction(BaseModel):
+    """Partial specification from one drawing view"""
+    overall_dimensions: Dict[str, Dimension] = Field(default_factory=dict)
+    critical_dimensions: List[Dimension] = Field(default_factory=list)
+    gdt_requirements: List[GDTSymbol] = Field(default_factory=list)
+    views: List[DrawingView] = Field(default_factory=list)
+    notes: List[str] = Field(default_factory=list)
+
+class TitleBlockExtraction(BaseModel):
+    """Partial specification from the title block"""
+    part_number: Optional[str] = None
+    material: Optional[str] = None
+    title_block_info: Dict[str, str] = Field(default_factory=dict)
+    notes: List[str] = Field(default_factory=list)
+
+class TableExtraction(BaseModel):
+    """Partial specification from a table (BOM, hole or revision table)"""
+    material: Optional[str] = None
+    critical_dimensions: List[Dimension] = Field(default_factory=list)
+    notes: List[str] = Field(default_factory=list)
+
+# What changed between two revisions of a sheet (see src/revision_diff.py)
+
+class DimensionChange(BaseModel):
+    """A dimension added, removed or changed between revisions"""
+    feature: str
+    change: str = Field(description="added, removed or changed")
+    old: Optional[Dimension] = None
+    new: Optional[Dimension] = None
+
+class GDTChange(BaseModel):
+    """A GD&T callout added, removed or changed between revisions"""
+    symbol_type: str
+    applies_to: str
+    change: str = Field(description="added, removed or changed")
+    old: Optional[GDTSymbol] = None
+    new: Optional[GDTSymbol] = None
+
+class RevisionDiff(BaseModel):
+    """Differences between a previous analysis and the sheet's new revision"""
+    previous_file: str
+    alignment: Optional[str] = None  # registration method, None if the sheets could not be aligned
+    changed_regions: List[Dict] = Field(default_factory=list)  # type and bbox of each re-extracted area
+    changed_area: float = 0.0  # fraction of the sheet re-extracted
+    full_reanalysis: bool = False
+    fields: Dict[str, List[Optional[str]]] = Field(default_factory=dict)  # name -> [old, new]
+    dimensions: List[DimensionChange] = Field(default_factory=list)
+    gdt: List[GDTChange] = Field(default_factory=list)
+    notes_added: List[str] = Field(default_factory=list)
+    notes_removed: List[str] = Field(default_factory=list)
+
 class DrawingAnalysisResult(BaseModel):
     file_path: str
     specification: PartSpecification
@@ -41,4 +95,17 @@ class DrawingAnalysisResult(BaseModel):
     cv_metadata: Dict = Field(default_factory=dict)
     rag_context: Optional[List[Dict]] = None
     processing_info: Dict = Field(default_factory=dict)
+    error: Optional[str] = None  # set when a batch item could not be analyzed
+    revision_diff: Optional[RevisionDiff] = None  # set by analyze_revision()
+
 
+class DocumentAnalysisResult(BaseModel):
+    """Per-sheet results of a multi-page drawing package plus a rollup"""
+    file_path: str
+    sheets: List[DrawingAnalysisResult] = Field(default_factory=list)
+    page_count: int = 0
+    failed_pages: List[int] = Field(default_factory=list)
+    part_numbers: List[str] = Field(default_factory=list)  # unique, in sheet order
+    materials: List[str] = Field(default_factory=list)
+    total_violations: int = 0
+    processing_info: Dict = Field(default_factory=dict)
@@ -0,0 +1,585 @@
+"""
+RAG Engine for Mechanical Drawing Analysis
+Retrieves relevant knowledge-base sections (standards, GD&T, tolerancing) for the LLM prompt
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+from pathlib import Path
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+
+# Bump when the on-disk layout or the tokenizer changes
+INDEX_FORMAT = 2
+
+# Used when the caller has nothing to query with
+DEFAULT_QUERY = "title block dimensioning tolerancing feature control frame datum"
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+_CITATION = re.compile(r'\s*\[\d+(?:\s*,\s*\d+)*\]')
+_TOKEN = re.compile(r'[a-z0-9]+')
+# Bibliography sections match every query and answer none
+_SKIPPED_SECTIONS = frozenset({'work cited', 'works cited', 'references', 'bibliography'})
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "their this to was were which with".split()
+)
+
+
+@dataclass
+class Chunk:
+    """One heading-delimited section of a knowledge-base file."""
+    source: str      # file name
+    title: str       # the section heading
+    path: str        # enclosing headings, e.g. "Section 7 > 7.4 The 14 ..."
+    content: str     # body text (citations stripped)
+    summary: str     # first sentence of the body
+    
+    @property
+    def digest(self) -> str:
+        """Content hash of everything that is indexed."""
+        text = '\0'.join((self.source, self.path, self.title, self.content))
+        return hashlib.sha256(text.encode()).hexdigest()
+
+
+def chunk_markdown(text: str, source: str, min_chars: int = 40) -> List[Chunk]:
+    """
+    Split a markdown file into one chunk per heading.
+    
+    Sections whose own body is shorter than min_chars (e.g. a "Part 2"
+    heading directly followed by its first subsection) are skipped; their
+    heading still shows up in the path of the subsections.
+    """
+    chunks = []
+    stack: List[str] = []   # open headings, by level
+    title, body = None, []
+    
+    def flush():
+        content = _clean('\n'.join(body))
+        if (title is not None and len(content) >= min_chars
+                and title.lower() not in _SKIPPED_SECTIONS):
+            chunks.append(Chunk(
+                source=source,
+                title=title,
+                path=' > '.join(h for h in stack[:-1] if h),
+                content=content,
+                summary=_first_sentence(content)
+            ))
+    
+    for line in text.splitlines():
+        match = _HEADING.match(line)
+        if match is None:
+            body.append(line)
+            continue
+        flush()
+        level, title = len(match.group(1)), _clean(match.group(2))
+        del stack[level - 1:]
+        stack.extend([''] * (level - 1 - len(stack)))
+        stack.append(title)
+        body = []
+    flush()
+    return chunks
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU embedding model (optional: pip install sentence-transformers)."""
+    
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError(
+                "sentence-transformers not installed. Run: pip install sentence-transformers"
+            )
+        self.name = model_name
+        self._model = SentenceTransformer(model_name, device='cpu')
+    
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32)
+
+
+@dataclass
+class IndexVersion:
+    """One immutable, published version of the index (arrays memory-mapped)."""
+    version: str
+    manifest: Dict
+    chunks: List[Dict]
+    vocab: Dict[str, int]
+    indptr: np.ndarray
+    postings: np.ndarray
+    weights: np.ndarray
+    vectors: Optional[np.ndarray] = None
+
+
+class RAGEngine:
+    """
+    Finds the knowledge-base sections worth showing the LLM for a drawing.
+    
+    Like the index at the back of a handbook: it is compiled once (every
+    section of every knowledge_base/*.md file, scored per term with BM25)
+    and kept on disk, so a worker only has to open it - the arrays are
+    memory-mapped, nothing is re-tokenized or re-embedded at startup.
+    A lookup just adds up the precomputed weights of the query's terms.
+    
+    With an embedder (e.g. SentenceTransformerEmbedder) each section is
+    also embedded, and BM25 and cosine similarity are blended.
+    
+    Updates are incremental and never block readers:
+    - every chunk carries a content hash, so after an edit only the changed
+      sections are re-embedded (BM25 weights are cheap and recomputed)
+    - each build is written to its own versions/<id>/ directory and then
+      published by atomically replacing the CURRENT pointer file
+    - running engines notice the new pointer (checked at most every
+      reload_interval seconds) and switch to it between queries
+    """
+    
+    POINTER = 'CURRENT'
+    
+    def __init__(self,
+                 knowledge_base_dir: str = "knowledge_base",
+                 index_dir: str = ".mech_dwg_cache/rag_index",
+                 embedder: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 top_k: int = 3,
+                 max_content_chars: int = 800,
+                 k1: float = 1.5,
+                 b: float = 0.75,
+                 auto_update: bool = True,
+                 reload_interval: float = 1.0,
+                 keep_versions: int = 2):
+        """
+        Open the current index version, bringing it up to date first.
+        
+        Args:
+            knowledge_base_dir: Directory with the *.md files
+            index_dir: Where index versions are persisted
+            embedder: Callable turning texts into L2-normalized vectors
+                (None = BM25 only)
+            top_k: Sections returned per query
+            max_content_chars: Section text is cut to this length in results
+            k1, b: BM25 term-frequency saturation and length normalization
+            auto_update: Re-index changed knowledge-base files on startup
+                (False = just open what another process published)
+            reload_interval: Seconds between checks for a newly published
+                version (0 = check on every query)
+            keep_versions: Published versions kept on disk, including the
+                current one, for readers that still have an older one open
+        """
+        self.knowledge_base_dir = Path(knowledge_base_dir)
+        self.index_dir = Path(index_dir)
+        self.embedder = embedder
+        self.top_k = top_k
+        self.max_content_chars = max_content_chars
+        self.k1 = k1
+        self.b = b
+        self.reload_interval = reload_interval
+        self.keep_versions = max(1, keep_versions)
+        self.last_update: Dict = {}
+        
+        self._index: Optional[IndexVersion] = None
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+        
+        self.reload()
+        if auto_update or self._index is None:
+            self.update()
+    
+    # ------------------------------------------------------------------
+    # Retrieval
+    # ------------------------------------------------------------------
+    
+    def retrieve_context(self,
+                         image_features: Optional[Dict] = None,
+                         query_embedding: Optional[np.ndarray] = None,
+                         query: Optional[str] = None,
+                         top_k: Optional[int] = None) -> List[Dict]:
+        """
+        Top-k knowledge-base sections for a drawing.
+        
+        With several 'queries' in image_features (one per detected drawing
+        element, see CVProcessor._stage_features) each contributes its best
+        sections in turn, so e.g. a frame-heavy sheet gets the GD&T symbol
+        section rather than whatever matches the most words of a merged
+        query. The prompt stays at most top_k sections however large the
+        knowledge base grows.
+        
+        Args:
+            image_features: CV features of the drawing; its 'queries' /
+                'query' text (or its string values) is used as the query
+            query_embedding: Query vector in the embedder's space (optional)
+            query: Explicit query text (overrides image_features)
+            top_k: Number of sections (default: self.top_k)
+        
+        Returns:
+            Dicts with 'title', 'content', 'summary', 'source', 'path'
+            and 'score', best first
+        """
+        if time.monotonic() - self._checked >= self.reload_interval:
+            self.reload()
+        # One snapshot per query: a concurrent reload can't mix versions
+        index = self._index
+        
+        top_k = top_k or self.top_k
+        queries = (image_features or {}).get('queries') if query is None else None
+        if queries and len(queries) > 1:
+            return self._retrieve_round_robin(index, queries, top_k)
+        query = query or self._query_from_features(image_features) or DEFAULT_QUERY
+        return self._retrieve(index, query, top_k, query_embedding)
+    
+    def _retrieve_round_robin(self, index: IndexVersion, queries: List[str], top_k: int) -> List[Dict]:
+        """Interleave the ranked results of several queries, skipping repeats."""
+        rankings = [self._retrieve(index, q, top_k) for q in queries]
+        results, seen = [], set()
+        for rank in range(top_k):
+            for ranking in rankings:
+                if rank < len(ranking) and len(results) < top_k:
+                    key = (ranking[rank]['source'], ranking[rank]['path'], ranking[rank]['title'])
+                    if key not in seen:
+                        seen.add(key)
+                        results.append(ranking[rank])
+        return results
+    
+    def _retrieve(self, index: IndexVersion, query: str, top_k: int,
+                  query_embedding: Optional[np.ndarray] = None) -> List[Dict]:
+        scores = self._bm25_scores(index, tokenize(query))
+        if index.vectors is not None:
+            if query_embedding is None and self.embedder is not None:
+                query_embedding = self.embedder([query])[0]
+            if query_embedding is not None and len(query_embedding) == index.vectors.shape[1]:
+                dense = np.maximum(index.vectors @ np.asarray(query_embedding, np.float32), 0)
+                peak = scores.max()
+                scores = 0.5 * (scores / peak if peak > 0 else scores) + 0.5 * dense
+        
+        if not scores.any():
+            return []
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [self._result(index, int(i), float(scores[i])) for i in best if scores[i] > 0]
+    
+    @staticmethod
+    def _bm25_scores(index: IndexVersion, terms: List[str]) -> np.ndarray:
+        """Sum of the precomputed BM25 weights of the query terms, per chunk."""
+        scores = np.zeros(len(index.chunks), np.float32)
+        for term in set(terms):
+            row = index.vocab.get(term)
+            if row is None:
+                continue
+            start, end = index.indptr[row], index.indptr[row + 1]
+            np.add.at(scores, index.postings[start:end], index.weights[start:end])
+        return scores
+    
+    def _result(self, index: IndexVersion, position: int, score: float) -> Dict:
+        chunk = index.chunks[position]
+        content = chunk['content']
+        if len(content) > self.max_content_chars:
+            content = content[:self.max_content_chars].rsplit(' ', 1)[0] + ' ...'
+        return {
+            'title': chunk['title'],
+            'content': content,
+            'summary': chunk['summary'],
+            'source': chunk['source'],
+            'path': chunk['path'],
+            'score': round(score, 4)
+        }
+    
+    @staticmethod
+    def _query_from_features(image_features: Optional[Dict]) -> str:
+        if not image_features:
+            return ""
+        if image_features.get('query'):
+            return image_features['query']
+        return ' '.join(str(v) for v in image_features.values() if isinstance(v, str))
+    
+    # ------------------------------------------------------------------
+    # Incremental indexing
+    # ------------------------------------------------------------------
+    
+    @property
+    def version(self) -> Optional[str]:
+        """Id of the index version queries currently run against."""
+        return self._index.version if self._index is not None else None
+    
+    def update(self) -> bool:
+        """
+        Re-index the knowledge base if it changed, and publish the result.
+        
+        Only chunks whose content hash is new are embedded; everything
+        else is reused from the current version. Safe to run while other
+        processes query (or update) the same index_dir.
+        
+        Returns:
+            True if a new version was published
+        """
+        with self._lock:
+            sources = self._source_digests()
+            current = self._index
+            if (current is not None and current.manifest['sources'] == sources
+                    and current.manifest['embedder'] == self._embedder_name()):
+                return False
+            
+            chunks = []
+            for path in self._source_files():
+                chunks.extend(chunk_markdown(path.read_text(encoding='utf-8'), path.name))
+            digests = [chunk.digest for chunk in chunks]
+            
+            version = self._version_id(digests)
+            stats = {'version': version, 'chunks': len(chunks), 'embedded': 0, 'reused': 0}
+            if not (self.index_dir / 'versions' / version / 'manifest.json').exists():
+                vectors = self._embed_incrementally(chunks, digests, current, stats)
+                vocab, indptr, postings, weights = self._bm25_index(chunks)
+                manifest = {
+                    'format': INDEX_FORMAT,
+                    'sources': sources,
+                    'embedder': self._embedder_name(),
+                    'k1': self.k1,
+                    'b': self.b,
+                    'chunks': len(chunks)
+                }
+                self._write_version(version, manifest, chunks, vocab, indptr, postings, weights, vectors)
+            
+            self._publish(version)
+            self._index = self._open(version)
+            self._prune_versions(keep={version, current.version if current else None})
+            self.last_update = stats
+            return True
+    
+    def reload(self) -> bool:
+        """
+        Switch to the version named by the CURRENT pointer, if it changed.
+        
+        Returns:
+            True if a different version was opened
+        """
+        self._checked = time.monotonic()
+        try:
+            version = (self.index_dir / self.POINTER).read_text().strip()
+        except OSError:
+            return False
+        if self._index is not None and version == self._index.version:
+            return False
+        index = self._open(version)
+        if index is None:
+            return False
+        # A single attribute assignment: readers see the old or new version
+        self._index = index
+        return True
+    
+    def _embed_incrementally(self, chunks: List[Chunk], digests: List[str],
+                             current: Optional[IndexVersion], stats: Dict) -> Optional[np.ndarray]:
+        """Vectors for all chunks, embedding only those not in the current version."""
+        if self.embedder is None or not chunks:
+            return None
+        
+        previous = {}
+        if current is not None and current.vectors is not None \
+                and current.manifest['embedder'] == self._embedder_name():
+            previous = {chunk['digest']: row for row, chunk in enumerate(current.chunks)}
+        
+        missing = [i for i, digest in enumerate(digests) if digest not in previous]
+        fresh = self.embedder([self._embedding_text(chunks[i]) for i in missing]) if missing else None
+        fresh_rows = {i: row for row, i in enumerate(missing)}
+        
+        vectors = None
+        for i, digest in enumerate(digests):
+            if digest in previous:
+                vector = current.vectors[previous[digest]]
+            else:
+                vector = fresh[fresh_rows[i]]
+            if vectors is None:
+                vectors = np.empty((len(chunks), len(vector)), np.float32)
+            vectors[i] = vector
+        stats['embedded'] = len(missing)
+        stats['reused'] = len(chunks) - len(missing)
+        return vectors
+    
+    def _version_id(self, digests: List[str]) -> str:
+        """Same chunks and settings -> same version id, whoever builds it."""
+        key = json.dumps([INDEX_FORMAT, self._embedder_name(), self.k1, self.b, digests])
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+    
+    def _embedder_name(self) -> Optional[str]:
+        if self.embedder is None:
+            return None
+        return getattr(self.embedder, 'name', type(self.embedder).__name__)
+    
+    # ------------------------------------------------------------------
+    # Index build and persistence
+    # ------------------------------------------------------------------
+    
+    def _bm25_index(self, chunks: List[Chunk]):
+        """
+        Inverted index with one precomputed BM25 weight per (term, chunk).
+        
+        Returns (vocab: term -> row, indptr, postings, weights) in CSR form:
+        row r's chunks are postings[indptr[r]:indptr[r + 1]].
+        """
+        docs = [self._index_terms(chunk) for chunk in chunks]
+        lengths = np.array([len(doc) for doc in docs], np.float32)
+        avg_length = float(lengths.mean()) if len(docs) else 0.0
+        
+        term_counts: Dict[str, Dict[int, int]] = {}
+        for doc_id, doc in enumerate(docs):
+            for term in doc:
+                counts = term_counts.setdefault(term, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+        
+        vocab = {term: row for row, term in enumerate(sorted(term_counts))}
+        indptr = np.zeros(len(vocab) + 1, np.int64)
+        postings, weights = [], []
+        for term, row in vocab.items():
+            counts = term_counts[term]
+            idf = math.log(1 + (len(docs) - len(counts) + 0.5) / (len(counts) + 0.5))
+            for doc_id, tf in sorted(counts.items()):
+                norm = self.k1 * (1 - self.b + self.b * lengths[doc_id] / avg_length)
+                postings.append(doc_id)
+                weights.append(idf * tf * (self.k1 + 1) / (tf + norm))
+            indptr[row + 1] = len(postings)
+        return vocab, indptr, np.array(postings, np.int32), np.array(weights, np.float32)
+    
+    @staticmethod
+    def _index_terms(chunk: Chunk) -> List[str]:
+        # Headings say what a section is about: count their terms twice
+        heading = tokenize(f"{chunk.path} {chunk.title}")
+        return heading + heading + tokenize(chunk.content)
+    
+    @staticmethod
+    def _embedding_text(chunk: Chunk) -> str:
+        return f"{chunk.title}\n{chunk.content}"
+    
+    def _write_version(self, version: str, manifest: Dict, chunks: List[Chunk], vocab: Dict,
+                       indptr: np.ndarray, postings: np.ndarray, weights: np.ndarray,
+                       vectors: Optional[np.ndarray]):
+        """Write a version to a scratch directory, then rename it into place."""
+        versions = self.index_dir / 'versions'
+        scratch = versions / f".tmp-{uuid.uuid4().hex}"
+        scratch.mkdir(parents=True)
+        try:
+            np.save(scratch / 'indptr.npy', indptr)
+            np.save(scratch / 'postings.npy', postings)
+            np.save(scratch / 'weights.npy', weights)
+            if vectors is not None:
+                np.save(scratch / 'vectors.npy', vectors)
+            with open(scratch / 'chunks.json', 'w', encoding='utf-8') as f:
+                json.dump([dict(asdict(c), digest=c.digest) for c in chunks], f)
+            with open(scratch / 'vocab.json', 'w', encoding='utf-8') as f:
+                json.dump(vocab, f)
+            with open(scratch / 'manifest.json', 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            os.rename(scratch, versions / version)
+        except OSError:
+            # Most likely another process published the same version first
+            shutil.rmtree(scratch, ignore_errors=True)
+            if not (versions / version / 'manifest.json').exists():
+                raise
+    
+    def _publish(self, version: str):
+        """Atomically point CURRENT at a version."""
+        scratch = self.index_dir / f".{self.POINTER}.{uuid.uuid4().hex}"
+        scratch.write_text(version)
+        os.replace(scratch, self.index_dir / self.POINTER)
+    
+    def _prune_versions(self, keep: set):
+        """Delete versions beyond keep_versions, oldest first (never those in keep)."""
+        versions = [p for p in (self.index_dir / 'versions').iterdir()
+                    if p.is_dir() and not p.name.startswith('.')]
+        versions.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        kept = len([p for p in versions if p.name in keep])
+        for path in versions:
+            if path.name in keep:
+                continue
+            if kept < self.keep_versions:
+                kept += 1
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+    
+    def _open(self, version: str) -> Optional[IndexVersion]:
+        """Open a published version (arrays memory-mapped); None if unusable."""
+        directory = self.index_dir / 'versions' / version
+        try:
+            with open(directory / 'manifest.json', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('format') != INDEX_FORMAT or manifest.get('embedder') != self._embedder_name():
+                return None
+            with open(directory / 'chunks.json', encoding='utf-8') as f:
+                chunks = json.load(f)
+            with open(directory / 'vocab.json', encoding='utf-8') as f:
+                vocab = json.load(f)
+            return IndexVersion(
+                version=version,
+                manifest=manifest,
+                chunks=chunks,
+                vocab=vocab,
+                indptr=np.load(directory / 'indptr.npy', mmap_mode='r'),
+                postings=np.load(directory / 'postings.npy', mmap_mode='r'),
+                weights=np.load(directory / 'weights.npy', mmap_mode='r'),
+                vectors=(np.load(directory / 'vectors.npy', mmap_mode='r')
+                         if manifest.get('embedder') else None)
+            )
+        except (OSError, ValueError, KeyError):
+            return None
+    
+    def _source_files(self) -> List[Path]:
+        return sorted(self.knowledge_base_dir.glob('*.md'))
+    
+    def _source_digests(self) -> Dict[str, str]:
+        return {
+            path.name: hashlib.sha256(path.read_bytes()).hexdigest()
+            for path in self._source_files()
+        }
+    
+    def __len__(self) -> int:
+        return len(self._index.chunks) if self._index is not None else 0
+
+
+def _clean(text: str) -> str:
+    """Strip citation markers and markdown escapes, collapse whitespace."""
+    text = _CITATION.sub('', text).replace('\\&', '&').replace('\\', '')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def _first_sentence(text: str, max_chars: int = 200) -> str:
+    match = re.search(r'(.+?[.!?])(\s|$)', text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rsplit(' ', 1)[0] + ' ...'
+
+
+def main():
+    """Re-index the knowledge base, e.g. from a deploy hook or a file watcher."""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Update the knowledge-base index")
+    parser.add_argument("--knowledge-base", default="knowledge_base")
+    parser.add_argument("--index-dir", default=".mech_dwg_cache/rag_index")
+    parser.add_argument("--embedding-model", default="",
+                        help="sentence-transformers model (default: BM25 only)")
+    args = parser.parse_args()
+    
+    engine = RAGEngine(
+        knowledge_base_dir=args.knowledge_base,
+        index_dir=args.index_dir,
+        embedder=SentenceTransformerEmbedder(args.embedding_model) if args.embedding_model else None
+    )
+    if engine.last_update:
+        print(f"Published index {engine.version}: {engine.last_update}")
+    else:
+        print(f"Index {engine.version} is up to date ({len(engine)} sections)")
+
+
+if __name__ == "__main__":
+    main()
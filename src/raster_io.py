@@ -0,0 +1,133 @@
+"""
+Raster I/O for Mechanical Drawings
+Opens very large scans without decoding them into memory where possible
+"""
+
+from typing import Optional, Tuple
+from pathlib import Path
+import struct
+import cv2
+import numpy as np
+from PIL import Image
+
+
+def peek_shape(image_path: str) -> Optional[Tuple[int, int]]:
+    """
+    Read an image's (height, width) from its header without decoding it.
+    
+    Returns None if the size can't be determined cheaply.
+    """
+    path = Path(image_path)
+    suffix = path.suffix.lower()
+    
+    try:
+        if suffix == '.npy':
+            return tuple(np.load(path, mmap_mode='r').shape[:2])
+        
+        with open(path, 'rb') as f:
+            head = f.read(64)
+        
+        if head.startswith(b'\x89PNG\r\n\x1a\n'):
+            # IHDR chunk: width and height are the first two fields
+            width, height = struct.unpack('>II', head[16:24])
+            return height, width
+        
+        if head[:2] in (b'P5', b'P6'):
+            _, width, height, _ = _read_pnm_header(path)
+            return height, width
+        
+        with Image.open(path) as img:
+            width, height = img.size
+            return height, width
+    except Image.DecompressionBombError:
+        # Pillow refuses to even open it - definitely a very large sheet
+        return None
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def open_raster(image_path: str) -> np.ndarray:
+    """
+    Open an image as an array, memory-mapped where the format allows.
+    
+    Like reading a huge blueprint through a window instead of unrolling it
+    on the desk: slices of a memory-mapped array are only read from disk
+    when touched.
+    
+    - .npy files, binary PGM/PPM and uncompressed TIFF (needs tifffile) are
+      memory-mapped; color data comes back in OpenCV's BGR order
+    - Anything else is decoded once as 8-bit grayscale, a third of the
+      memory of a BGR decode
+    """
+    path = Path(image_path)
+    suffix = path.suffix.lower()
+    
+    if suffix == '.npy':
+        return np.load(path, mmap_mode='r')
+    
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+    
+    if magic in (b'P5', b'P6'):
+        channels, width, height, offset = _read_pnm_header(path)
+        shape = (height, width) if channels == 1 else (height, width, 3)
+        raster = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=shape)
+        return raster if channels == 1 else raster[..., ::-1]
+    
+    if suffix in ('.tif', '.tiff'):
+        raster = _memmap_tiff(path)
+        if raster is not None:
+            return raster
+    
+    img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError(f"Could not load image from {image_path}")
+    return img
+
+
+def _read_pnm_header(path: Path) -> Tuple[int, int, int, int]:
+    """Parse a binary PGM/PPM header -> (channels, width, height, data offset)."""
+    with open(path, 'rb') as f:
+        data = f.read(1024)
+    
+    fields = []
+    pos = 0
+    while len(fields) < 4:
+        # Skip whitespace and comments between header fields
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b'#':
+            pos = data.index(b'\n', pos) + 1
+            continue
+        start = pos
+        while not data[pos:pos + 1].isspace():
+            pos += 1
+        fields.append(data[start:pos])
+    
+    magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if maxval > 255:
+        raise ValueError("Only 8-bit PGM/PPM files can be memory-mapped")
+    
+    # Exactly one whitespace byte separates the header from the pixels
+    channels = 1 if magic == b'P5' else 3
+    return channels, width, height, pos + 1
+
+
+def _memmap_tiff(path: Path) -> Optional[np.ndarray]:
+    """Memory-map an uncompressed TIFF with tifffile, if available."""
+    try:
+        import tifffile
+    except ImportError:
+        return None
+    
+    try:
+        raster = tifffile.memmap(str(path), mode='r')
+    except (ValueError, OSError):
+        # Compressed or non-contiguous - can't be mapped
+        return None
+    
+    if raster.dtype != np.uint8 or raster.ndim not in (2, 3):
+        return None
+    if raster.ndim == 3:
+        raster = raster[..., 2::-1]  # RGB(A) -> BGR
+    return raster
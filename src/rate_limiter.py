@@ -0,0 +1,99 @@
+"""
+Rate Limiter for LLM Requests
+Token buckets that keep request and token throughput at the provider's limits
+"""
+
+from typing import Optional
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket that hands out reservations instead of blocking.
+    
+    Like a ticket dispenser at a deli counter: everybody takes a ticket
+    right away, and the ticket says how long to wait. The balance may go
+    negative, so callers queue up in arrival order and nobody starves.
+    Because reserve() only returns the wait, the same bucket serves both
+    threads (time.sleep) and asyncio tasks (asyncio.sleep).
+    """
+    
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: Sustained rate; the bucket also holds at most one
+                minute's worth, which is the largest burst allowed
+        """
+        if per_minute <= 0:
+            raise ValueError("per_minute must be positive")
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0  # per second
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def reserve(self, amount: float = 1.0) -> float:
+        """Take `amount` tokens now; returns the seconds to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # A single request bigger than the bucket still goes through,
+            # it just has to wait for a full bucket
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+    
+    def adjust(self, amount: float):
+        """Give back (positive) or take (negative) tokens after the fact."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """
+    Client-side scheduler for requests-per-minute and tokens-per-minute.
+    
+    Token usage is only known once the response arrives, so each request
+    reserves an estimate up front and settle() corrects the bucket with
+    the real count afterwards. A 429 with Retry-After pauses everybody
+    sharing the limiter, not just the request that got it.
+    """
+    
+    def __init__(self,
+                 requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None):
+        """
+        Args:
+            requests_per_minute: RPM budget (None or 0 = unlimited)
+            tokens_per_minute: TPM budget (None or 0 = unlimited)
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def reserve(self, estimated_tokens: int = 0) -> float:
+        """Reserve one request and its estimated tokens; returns the wait in seconds."""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None and estimated_tokens:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        with self._lock:
+            wait = max(wait, self._paused_until - time.monotonic())
+        return wait
+    
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the real usage is known."""
+        if self.tokens is not None and actual_tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+    
+    def pause(self, seconds: float):
+        """Hold back every request for `seconds` (e.g. the provider's Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
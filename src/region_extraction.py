@@ -0,0 +1,266 @@
+"""
+Region-Parallel Extraction for Mechanical Drawing Analysis
+Map-reduce mode: one narrow LLM request per detected region, merged into one spec
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import contextvars
+
+from pydantic import BaseModel
+
+from src.llm_errors import LLMError
+from src.models import (
+    Dimension, PartSpecification, TableExtraction, TitleBlockExtraction, ViewExtraction
+)
+
+
+# What each region type is asked for
+REGION_SCHEMAS = {
+    'title_block': TitleBlockExtraction,
+    'table': TableExtraction,
+    'drawing_view': ViewExtraction,
+    'sheet': PartSpecification,
+}
+
+REGION_INSTRUCTIONS = {
+    'title_block': (
+        "This image is the title block cropped from the sheet. Extract the part "
+        "number, the material and the other title block fields (drawing number, "
+        "revision, scale, date, drawn by), plus any notes it contains."
+    ),
+    'table': (
+        "This image is a table cropped from the sheet (bill of materials, hole "
+        "table or revision table). Extract the material, any dimensions it lists "
+        "and its rows as notes."
+    ),
+    'drawing_view': (
+        "This image is one view cropped from the sheet. Extract the view type and "
+        "scale, every dimension with its tolerances and the GD&T callouts shown "
+        "in this view. Do not guess values cut off at the edge of the crop."
+    ),
+    'sheet': "",
+}
+
+# Merge order: earlier partials win conflicts (part number, material)
+MERGE_PRIORITY = ('title_block', 'table', 'drawing_view', 'sheet')
+
+# Counters of the per-region spans that are summed onto the enclosing span
+_SUMMED_COUNTERS = ('tokens_in', 'tokens_out', 'tokens_cached', 'tokens_cache_write',
+                    'retries', 'sanitize_fixes')
+
+_MM_PER_UNIT = {'mm': 1.0, 'cm': 10.0, 'm': 1000.0, 'in': 25.4, 'inch': 25.4, '"': 25.4}
+
+
+def plan_region_jobs(region_payloads: List[Tuple[Dict, object]], sheet) -> List[Tuple[str, object]]:
+    """
+    (region type, payload) for every request to make.
+    
+    Without a detected view there is nothing to split the geometry across,
+    so the whole sheet is extracted in one request instead. Without a
+    detected title block the whole sheet is asked for title block fields.
+    """
+    jobs = [(region['type'], payload) for region, payload in region_payloads]
+    types = {region_type for region_type, _ in jobs}
+    if 'drawing_view' not in types:
+        return [('sheet', sheet)] + [job for job in jobs if job[0] != 'title_block']
+    if 'title_block' not in types:
+        jobs.insert(0, ('title_block', sheet))
+    return jobs
+
+
+def extract_by_region(llm,
+                      region_payloads: List[Tuple[Dict, object]],
+                      sheet,
+                      prompt: str,
+                      tracer,
+                      max_workers: int = 8,
+                      context: str = "",
+                      seed: Optional[PartSpecification] = None) -> Tuple[PartSpecification, Dict]:
+    """
+    Extract a specification with one concurrent request per region.
+    
+    Like splitting a long inspection report between several inspectors:
+    one reads the title block, each of the others takes one view, and the
+    lead merges their sheets at the end, crossing out what two of them
+    wrote down twice. Each request only carries a small crop and a narrow
+    schema, so the slowest request - not the sum - sets the latency.
+    
+    Args:
+        llm: LLMClient to use (its rate limiter is shared by all requests)
+        region_payloads: (Region, payload) pairs from the CV 'region_payloads' output
+        sheet: Payload of the whole sheet, for the fallbacks in plan_region_jobs()
+        prompt: Static analysis instructions; region instructions are
+            appended, which keeps one cacheable prefix per region type
+        tracer: Tracer for one span per request, nested under the current span
+        max_workers: Maximum requests in flight for this drawing
+        context: Per-drawing text, sent after the prefix
+        seed: Specification of a near-identical sheet (e.g. the previous
+            revision). Only the given regions are extracted - no whole-sheet
+            fallbacks - and patched into it (see patch_specification())
+    
+    Returns:
+        (merged PartSpecification, info dict with request counts and failures)
+    
+    Raises:
+        LLMError: if every request failed
+    """
+    if seed is None:
+        jobs = plan_region_jobs(region_payloads, sheet)
+    else:
+        jobs = [(region['type'], payload) for region, payload in region_payloads]
+    
+    def run(index: int, region_type: str, payload):
+        with tracer.span(f"region_{index}", region_type=region_type):
+            region_prompt = f"{prompt}\n\n{REGION_INSTRUCTIONS[region_type]}".rstrip()
+            return llm.analyze(
+                images=payload,
+                prompt=region_prompt,
+                structured_output=REGION_SCHEMAS[region_type],
+                context=context
+            )
+    
+    # Threads don't inherit context variables: each request gets a copy of
+    # ours so its span nests under the current one
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as pool:
+        futures = [
+            (region_type, pool.submit(contextvars.copy_context().run, run, i, region_type, payload))
+            for i, (region_type, payload) in enumerate(jobs)
+        ]
+    
+    partials, failed, errors = [], [], []
+    for region_type, future in futures:
+        try:
+            partials.append((region_type, future.result()))
+        except LLMError as e:
+            failed.append(region_type)
+            errors.append(e)
+    if not partials:
+        raise errors[0]
+    
+    info = {
+        'requests': len(jobs),
+        'region_types': sorted({region_type for region_type, _ in jobs}),
+        'failed': failed
+    }
+    partials.sort(key=lambda item: MERGE_PRIORITY.index(item[0]))
+    merged = merge_partial_specifications([partial for _, partial in partials])
+    if seed is not None:
+        return patch_specification(seed, merged), info
+    return merged, info
+
+
+def sum_region_counters(span) -> Dict[str, float]:
+    """Token, retry and fix counters of a span's finished region children, summed."""
+    totals = {}
+    for child in span.children:
+        for key in _SUMMED_COUNTERS:
+            if child.get(key):
+                totals[key] = totals.get(key, 0) + child[key]
+    return totals
+
+
+def merge_partial_specifications(partials: List[BaseModel]) -> PartSpecification:
+    """
+    Merge partial extractions into one PartSpecification.
+    
+    - part_number / material / title block fields: first non-empty value wins
+    - dimensions: the same feature at the same size (compared in mm) seen in
+      several views is kept once, with the highest confidence
+    - GD&T, views and notes: exact duplicates are dropped
+    """
+    merged = PartSpecification()
+    dimensions: Dict[tuple, Dimension] = {}
+    gdt_seen, views_seen, notes_seen = set(), set(), set()
+    
+    for partial in partials:
+        for name in ('part_number', 'material'):
+            value = getattr(partial, name, None)
+            if value and not getattr(merged, name):
+                setattr(merged, name, value)
+        
+        for key, value in getattr(partial, 'title_block_info', {}).items():
+            merged.title_block_info.setdefault(key, value)
+        
+        for key, dim in getattr(partial, 'overall_dimensions', {}).items():
+            current = merged.overall_dimensions.get(key)
+            if current is None or dim.confidence > current.confidence:
+                merged.overall_dimensions[key] = dim
+        
+        for dim in getattr(partial, 'critical_dimensions', []):
+            key = _dimension_key(dim)
+            current = dimensions.get(key)
+            if current is None or dim.confidence > current.confidence:
+                dimensions[key] = dim
+        
+        for gdt in getattr(partial, 'gdt_requirements', []):
+            key = (_norm(gdt.symbol_type), gdt.tolerance,
+                   tuple(_norm(d) for d in gdt.datum_references), _norm(gdt.applies_to))
+            if key not in gdt_seen:
+                gdt_seen.add(key)
+                merged.gdt_requirements.append(gdt)
+        
+        for view in getattr(partial, 'views', []):
+            key = (_norm(view.view_type), view.scale,
+                   tuple(sorted(_norm(f) for f in view.contains_features)))
+            if key not in views_seen:
+                views_seen.add(key)
+                merged.views.append(view)
+        
+        for note in getattr(partial, 'notes', []):
+            if _norm(note) not in notes_seen:
+                notes_seen.add(_norm(note))
+                merged.notes.append(note)
+    
+    merged.critical_dimensions = list(dimensions.values())
+    return merged
+
+
+def patch_specification(base: PartSpecification, update: PartSpecification) -> PartSpecification:
+    """
+    Apply a re-extraction of part of a sheet on top of a full extraction.
+    
+    Like marking up last revision's inspection report instead of writing a
+    new one: whatever the re-read regions show replaces the entry for the
+    same thing - a field, a dimension of the same feature, a GD&T callout
+    on the same feature with the same symbol, a view of the same type -
+    and anything new is added. Entries of the re-read regions that were
+    removed from the sheet are not detected here.
+    """
+    patched = base.model_copy(deep=True)
+    for name in ('part_number', 'material'):
+        if getattr(update, name):
+            setattr(patched, name, getattr(update, name))
+    patched.title_block_info.update(update.title_block_info)
+    patched.overall_dimensions.update(update.overall_dimensions)
+    
+    features = {_norm(dim.feature) for dim in update.critical_dimensions}
+    patched.critical_dimensions = [
+        dim for dim in patched.critical_dimensions if _norm(dim.feature) not in features
+    ] + list(update.critical_dimensions)
+    
+    callouts = {(_norm(gdt.symbol_type), _norm(gdt.applies_to)) for gdt in update.gdt_requirements}
+    patched.gdt_requirements = [
+        gdt for gdt in patched.gdt_requirements
+        if (_norm(gdt.symbol_type), _norm(gdt.applies_to)) not in callouts
+    ] + list(update.gdt_requirements)
+    
+    view_types = {_norm(view.view_type) for view in update.views}
+    patched.views = [
+        view for view in patched.views if _norm(view.view_type) not in view_types
+    ] + list(update.views)
+    
+    notes = {_norm(note) for note in patched.notes}
+    patched.notes += [note for note in update.notes if _norm(note) not in notes]
+    return patched
+
+
+def _dimension_key(dim: Dimension) -> tuple:
+    factor = _MM_PER_UNIT.get(_norm(dim.unit))
+    if factor is None:
+        return (_norm(dim.feature), dim.value, _norm(dim.unit))
+    return (_norm(dim.feature), round(dim.value * factor, 3), 'mm')
+
+
+def _norm(text: Optional[str]) -> str:
+    return ' '.join((text or '').lower().split())
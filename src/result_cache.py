@@ -0,0 +1,187 @@
+"""
+Result Cache for Mechanical Drawing Analysis
+Content-addressed, on-disk cache of LLM extractions
+"""
+
+from typing import Dict, Optional
+from pathlib import Path
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from src.models import PartSpecification
+
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's bytes, read in chunks so large scans stay cheap."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def schema_version(output_model: type = PartSpecification) -> str:
+    """
+    Version of an output schema, derived from its JSON schema.
+    
+    Any field change in the model changes the version, so cached results
+    extracted under an old schema are never returned for a new one.
+    """
+    schema = json.dumps(output_model.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode()).hexdigest()[:16]
+
+
+def make_cache_key(image_digest: str,
+                   prompt: str,
+                   provider: str,
+                   model: str,
+                   version: str,
+                   settings: str = "") -> str:
+    """
+    Build the cache key from everything that determines the LLM output.
+    
+    settings covers how the request is assembled from the image (see
+    MechanicalDrawingAnalyzer._request_settings): the extraction mode and
+    the image encoding budget.
+    """
+    digest = hashlib.sha256()
+    for part in (image_digest, prompt, provider, model, version, settings):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    SQLite-backed cache of extracted specifications.
+    
+    Think of it as a filing cabinet indexed by content, not by name:
+    - The key is a hash of the image bytes, prompt, provider/model, schema
+      and the settings that shape the request (extraction mode, image budget)
+    - A changed file gets a new key, so stale results are never returned
+    - Least recently used entries are thrown out when the cabinet is full
+    """
+    
+    def __init__(self,
+                 path: str = ".mech_dwg_cache/results.sqlite",
+                 max_entries: int = 10000,
+                 max_bytes: int = 512 * 1024 * 1024):
+        """
+        Open (or create) the cache.
+        
+        Args:
+            path: SQLite database file
+            max_entries: Maximum number of cached results
+            max_bytes: Maximum total size of cached JSON payloads
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+        # One connection shared across threads, serialized by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_results_access ON results (last_access)"
+        )
+        self._conn.commit()
+    
+    def get(self, key: str, output_model: type = PartSpecification):
+        """Return the cached result for a key, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            
+            self._conn.execute(
+                "UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+        
+        return output_model.model_validate_json(row[0])
+    
+    def put(self, key: str, value) -> None:
+        """Store a result (a Pydantic model) and evict old entries if needed."""
+        payload = value.model_dump_json()
+        now = time.time()
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+    
+    def _evict(self):
+        """Drop least recently used entries until both limits are met."""
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        
+        rows = self._conn.execute(
+            "SELECT key, size FROM results ORDER BY last_access ASC"
+        )
+        stale = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        
+        self._conn.executemany("DELETE FROM results WHERE key = ?", stale)
+        self.evictions += len(stale)
+    
+    def clear(self) -> None:
+        """Remove every cached result."""
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters and current size of the cache."""
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': count,
+            'bytes': total
+        }
+    
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
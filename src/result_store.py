@@ -0,0 +1,425 @@
+"""
+Result Store for Mechanical Drawing Analysis
+Queryable on-disk archive of DrawingAnalysisResults
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from pathlib import Path
+import json
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+from src.compliance_rules import canonical_symbol, normalize_material, unit_factor
+from src.models import DrawingAnalysisResult, PartSpecification
+
+# Comparison operators a query condition may use
+OPERATORS = {'<': '<', '<=': '<=', '>': '>', '>=': '>=', '=': '=', '==': '=', '!=': '!='}
+
+_REVISION_KEY = re.compile(r'^rev(?:ision)?(?:[\s_.-]|$)', re.IGNORECASE)
+
+# Searchable text fields (see search())
+TEXT_FIELDS = ('note', 'title_block', 'feature')
+
+# One condition: (what, operator, value) - what is a GD&T symbol or, for
+# dimensions, text the feature contains
+Condition = Tuple[str, str, float]
+
+
+@dataclass
+class StoredResult:
+    """Summary row of a stored result (load() returns the full result)."""
+    id: int
+    file_path: str
+    part_number: Optional[str]
+    material: Optional[str]
+    revision: Optional[str]
+    previous_file: Optional[str]
+    analyzed_at: float
+    violations: int
+    error: Optional[str]
+
+
+@dataclass
+class SearchHit:
+    """A note, title block entry or dimension feature matching a search."""
+    file_path: str
+    part_number: Optional[str]
+    field: str  # one of TEXT_FIELDS
+    text: str
+    snippet: str  # the text around the matched terms, which are in [brackets]
+    score: float  # BM25; lower is better
+
+
+class ResultStore:
+    """
+    SQLite archive of analysis results with normalized, indexed tables.
+    
+    Like a drawing office's records room with a card index: the full
+    result is filed away (compressed JSON), while a card per part
+    (part number, material, revision), a card per dimension and a card
+    per GD&T callout are kept in indexed drawers. A query like "aluminum
+    parts with a position tolerance over 0.1" is answered from the cards
+    alone, in SQL, and only the results asked for are ever unpacked.
+    
+    - results: one row per file_path; re-adding a file replaces it
+    - dimensions: feature, value, unit and value_mm (length units only)
+    - gdt: canonical symbol, tolerance, datum references, feature
+    - texts / text_index: notes, title block entries and dimension
+      features, with an FTS5 full-text index over them (see search())
+    """
+    
+    def __init__(self, path: str = "analysis_results/results.sqlite"):
+        """
+        Open (or create) the store.
+        
+        Args:
+            path: SQLite database file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        
+        # Writes share one connection, serialized by the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                file_path TEXT NOT NULL UNIQUE,
+                part_number TEXT COLLATE NOCASE,
+                material TEXT,
+                material_key TEXT,
+                revision TEXT,
+                previous_file TEXT,
+                analyzed_at REAL NOT NULL,
+                violations INTEGER NOT NULL,
+                error TEXT,
+                payload BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS dimensions (
+                result_id INTEGER NOT NULL,
+                feature TEXT NOT NULL,
+                value REAL,
+                unit TEXT,
+                value_mm REAL,
+                tolerance_upper REAL,
+                tolerance_lower REAL
+            );
+            CREATE TABLE IF NOT EXISTS gdt (
+                result_id INTEGER NOT NULL,
+                symbol TEXT NOT NULL,
+                tolerance REAL,
+                datum_references TEXT NOT NULL,
+                applies_to TEXT
+            );
+            CREATE TABLE IF NOT EXISTS texts (
+                id INTEGER PRIMARY KEY,
+                result_id INTEGER NOT NULL,
+                field TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_results_part ON results (part_number, analyzed_at);
+            CREATE INDEX IF NOT EXISTS idx_results_material ON results (material_key);
+            CREATE INDEX IF NOT EXISTS idx_dimensions_result ON dimensions (result_id);
+            CREATE INDEX IF NOT EXISTS idx_dimensions_mm ON dimensions (value_mm);
+            CREATE INDEX IF NOT EXISTS idx_gdt_result ON gdt (result_id);
+            CREATE INDEX IF NOT EXISTS idx_gdt_symbol ON gdt (symbol, tolerance);
+            CREATE INDEX IF NOT EXISTS idx_texts_result ON texts (result_id);
+        """)
+        indexed = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'text_index'"
+        ).fetchone() is not None
+        # Porter stemming: 'anodize' also finds 'anodized' and 'anodizing'
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS text_index USING fts5("
+            "content, content='texts', content_rowid='id', tokenize='porter unicode61')"
+        )
+        if not indexed:
+            # A store created before the full-text index existed
+            for result_id, payload in self._conn.execute("SELECT id, payload FROM results").fetchall():
+                result = DrawingAnalysisResult.model_validate_json(zlib.decompress(payload))
+                self._index_texts(result_id, result.specification)
+        self._conn.commit()
+    
+    def add(self, result: DrawingAnalysisResult) -> int:
+        """Store a result (replacing any earlier one for its file_path); returns its id."""
+        return self.add_many([result])[-1]
+    
+    def add_many(self, results: Iterable[DrawingAnalysisResult]) -> List[int]:
+        """Store several results in one transaction; returns their ids."""
+        ids = []
+        with self._lock:
+            for result in results:
+                ids.append(self._insert(result))
+            self._conn.commit()
+        return ids
+    
+    def find(self,
+             material: Optional[str] = None,
+             part_number: Optional[str] = None,
+             revision: Optional[str] = None,
+             gdt: Union[Condition, Sequence[Condition], None] = None,
+             dimensions: Union[Condition, Sequence[Condition], None] = None,
+             text: Optional[str] = None,
+             failed: Optional[bool] = None,
+             limit: Optional[int] = None) -> Iterator[StoredResult]:
+        """
+        Stored results matching every given filter, newest first.
+        
+        The filters run inside SQLite against the indexed tables, and rows
+        are streamed, so a query never loads the whole store.
+        
+        Args:
+            material: Material, ignoring case and spacing
+            part_number: Part number, ignoring case
+            revision: Revision from the title block
+            gdt: (symbol, operator, tolerance) - or a list of them, all of
+                which must hold - e.g. ('position', '>', 0.1); symbols are
+                matched like compliance rules ('True Position' = 'position')
+            dimensions: (feature text, operator, value in mm), e.g.
+                ('wall', '<', 2.0); the feature must contain the text
+            text: Words a note, title block entry or feature must contain
+                (see search())
+            failed: True for results with an error, False for the rest
+            limit: Maximum number of results
+        
+        Example:
+            store.find(material="Aluminum 6061-T6", gdt=('position', '>', 0.1))
+        """
+        columns = ("id, file_path, part_number, material, revision, previous_file, "
+                   "analyzed_at, violations, error")
+        for row in self._select(columns, material, part_number, revision, gdt, dimensions, text, failed, limit):
+            yield StoredResult(*row)
+    
+    def revisions(self, part_number: str) -> List[StoredResult]:
+        """Every stored result of a part number, oldest first."""
+        return list(reversed(list(self.find(part_number=part_number))))
+    
+    def load(self, file_path: str) -> Optional[DrawingAnalysisResult]:
+        """The full stored result for a file, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM results WHERE file_path = ?", (file_path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return DrawingAnalysisResult.model_validate_json(zlib.decompress(row[0]))
+    
+    def specifications(self,
+                       material: Optional[str] = None,
+                       part_number: Optional[str] = None,
+                       revision: Optional[str] = None,
+                       gdt: Union[Condition, Sequence[Condition], None] = None,
+                       dimensions: Union[Condition, Sequence[Condition], None] = None,
+                       limit: Optional[int] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        (file_path, specification dict) of the results matching the find()
+        filters, skipping failed ones - e.g. for FleetTables.from_specifications().
+        """
+        for file_path, payload in self._select("file_path, payload", material, part_number, revision,
+                                               gdt, dimensions, None, False, limit):
+            yield file_path, json.loads(zlib.decompress(payload))['specification']
+    
+    def search(self, text: str, field: Optional[str] = None, limit: int = 50,
+               max_ranked: int = 5000) -> List[SearchHit]:
+        """
+        Notes, title block entries and dimension features containing every
+        word of `text`, best matches (BM25) first.
+        
+        Words are matched after stemming ('anodize' finds 'anodized'), a
+        trailing * matches any ending and "quoted words" must appear
+        together, e.g. search('"hard anodize" MIL*').
+        
+        Args:
+            text: Words to search for
+            field: Only search one of TEXT_FIELDS
+            limit: Maximum number of hits
+            max_ranked: Searches matching more texts than this (a word on
+                most drawings, like 'chamfer') return the newest hits
+                instead - ranking them all costs more than it tells
+        """
+        if field is not None and field not in TEXT_FIELDS:
+            raise ValueError(f"field must be one of {TEXT_FIELDS}")
+        query = ("SELECT results.file_path, results.part_number, texts.field, texts.content, "
+                 "snippet(text_index, 0, '[', ']', '…', 12), rank FROM text_index "
+                 "JOIN texts ON texts.id = text_index.rowid "
+                 "JOIN results ON results.id = texts.result_id "
+                 "WHERE text_index MATCH ?")
+        params = [match_query(text)]
+        if field is not None:
+            query += " AND texts.field = ?"
+            params.append(field)
+        with self._lock:
+            # Counting uses the index alone; BM25 is computed per match
+            matches = self._conn.execute(
+                "SELECT COUNT(*) FROM text_index WHERE text_index MATCH ?", params[:1]
+            ).fetchone()[0]
+            query += " ORDER BY rank" if matches <= max_ranked else " ORDER BY text_index.rowid DESC"
+            rows = self._conn.execute(query + " LIMIT ?", params + [limit]).fetchall()
+        return [SearchHit(*row) for row in rows]
+    
+    def delete(self, file_path: str) -> bool:
+        """Remove a file's result; returns whether there was one."""
+        with self._lock:
+            removed = self._delete(file_path)
+            self._conn.commit()
+        return removed
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+    
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+    
+    def _select(self, columns: str, material, part_number, revision, gdt, dimensions,
+                text, failed, limit) -> Iterator[tuple]:
+        """Stream the given columns of the results matching the filters."""
+        where, params = [], []
+        if material is not None:
+            where.append("material_key = ?")
+            params.append(normalize_material(material))
+        if part_number is not None:
+            where.append("part_number = ?")
+            params.append(part_number.strip())
+        if revision is not None:
+            where.append("revision = ?")
+            params.append(revision)
+        if failed is not None:
+            where.append("error IS NOT NULL" if failed else "error IS NULL")
+        for symbol, operator, value in _conditions(gdt):
+            where.append(f"id IN (SELECT result_id FROM gdt WHERE symbol = ? AND tolerance {_operator(operator)} ?)")
+            params += [canonical_symbol(symbol), value]
+        for feature, operator, value in _conditions(dimensions):
+            where.append(f"id IN (SELECT result_id FROM dimensions "
+                         f"WHERE value_mm {_operator(operator)} ? AND feature LIKE ? ESCAPE '\\')")
+            params += [value, '%' + re.sub(r'([%_\\])', r'\\\1', feature) + '%']
+        if text is not None:
+            where.append("id IN (SELECT texts.result_id FROM text_index "
+                         "JOIN texts ON texts.id = text_index.rowid WHERE text_index MATCH ?)")
+            params.append(match_query(text))
+        
+        query = f"SELECT {columns} FROM results"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY analyzed_at DESC, id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        
+        # Its own connection, so rows can be streamed while others write
+        conn = sqlite3.connect(str(self.path))
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            conn.close()
+    
+    def _insert(self, result: DrawingAnalysisResult) -> int:
+        spec = result.specification
+        self._delete(result.file_path)
+        cursor = self._conn.execute(
+            "INSERT INTO results (file_path, part_number, material, material_key, revision, "
+            "previous_file, analyzed_at, violations, error, payload) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (result.file_path, (spec.part_number or '').strip() or None, spec.material,
+             normalize_material(spec.material) if spec.material else None,
+             _revision(spec.title_block_info),
+             result.revision_diff.previous_file if result.revision_diff else None,
+             time.time(), len(result.compliance_violations), result.error,
+             zlib.compress(result.model_dump_json().encode()))
+        )
+        result_id = cursor.lastrowid
+        
+        dimensions = list(spec.overall_dimensions.values()) + spec.critical_dimensions
+        self._conn.executemany(
+            "INSERT INTO dimensions (result_id, feature, value, unit, value_mm, tolerance_upper, "
+            "tolerance_lower) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(result_id, dim.feature, dim.value, dim.unit, _in_mm(dim.value, dim.unit),
+              dim.tolerance_upper, dim.tolerance_lower) for dim in dimensions]
+        )
+        self._conn.executemany(
+            "INSERT INTO gdt (result_id, symbol, tolerance, datum_references, applies_to) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(result_id, canonical_symbol(callout.symbol_type), callout.tolerance,
+              json.dumps(callout.datum_references), callout.applies_to) for callout in spec.gdt_requirements]
+        )
+        self._index_texts(result_id, spec)
+        return result_id
+    
+    def _index_texts(self, result_id: int, spec: PartSpecification):
+        features = [dim.feature for dim in list(spec.overall_dimensions.values()) + spec.critical_dimensions]
+        entries = ([('note', note) for note in spec.notes]
+                   + [('title_block', f"{key}: {value}") for key, value in spec.title_block_info.items()]
+                   + [('feature', feature) for feature in dict.fromkeys(features) if feature])
+        for field, content in entries:
+            text_id = self._conn.execute(
+                "INSERT INTO texts (result_id, field, content) VALUES (?, ?, ?)", (result_id, field, content)
+            ).lastrowid
+            self._conn.execute("INSERT INTO text_index (rowid, content) VALUES (?, ?)", (text_id, content))
+    
+    def _delete(self, file_path: str) -> bool:
+        row = self._conn.execute("SELECT id FROM results WHERE file_path = ?", (file_path,)).fetchone()
+        if row is None:
+            return False
+        # An external-content index is told exactly which rows to forget
+        self._conn.execute(
+            "INSERT INTO text_index (text_index, rowid, content) "
+            "SELECT 'delete', id, content FROM texts WHERE result_id = ?", row
+        )
+        for table, column in (('dimensions', 'result_id'), ('gdt', 'result_id'), ('texts', 'result_id'),
+                              ('results', 'id')):
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", row)
+        return True
+
+
+def match_query(text: str) -> str:
+    """FTS5 query for plain search words: each word (or "quoted phrase") must occur."""
+    terms = []
+    for term in re.findall(r'"[^"]*"\*?|[^\s"]+', text):
+        prefix = term.endswith('*')
+        words = term.rstrip('*').strip('"').replace('"', '')
+        if words.strip():
+            terms.append('"' + words + '"' + ('*' if prefix else ''))
+    if not terms:
+        raise ValueError("Nothing to search for")
+    return ' '.join(terms)
+
+
+def _conditions(conditions: Union[Condition, Sequence[Condition], None]) -> List[Condition]:
+    if not conditions:
+        return []
+    if isinstance(conditions[0], str):
+        return [conditions]
+    return list(conditions)
+
+
+def _operator(operator: str) -> str:
+    if operator not in OPERATORS:
+        raise ValueError(f"Unknown operator {operator!r}; use one of {sorted(OPERATORS)}")
+    return OPERATORS[operator]
+
+
+def _in_mm(value: Optional[float], unit: Optional[str]) -> Optional[float]:
+    """A length in mm (no unit = mm); None for other quantities."""
+    if value is None:
+        return None
+    factor = unit_factor(unit, 'length') if unit else 1.0
+    return value * factor if factor is not None else None
+
+
+def _revision(title_block_info: Dict[str, str]) -> Optional[str]:
+    for key, value in title_block_info.items():
+        if _REVISION_KEY.match(key.strip()) and value:
+            return str(value).strip()
+    return None
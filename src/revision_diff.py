@@ -0,0 +1,262 @@
+"""
+Revision Diffing for Mechanical Drawing Analysis
+Aligns two revisions of a sheet, finds what changed and compares the extractions
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+
+from src.models import (
+    Dimension, DimensionChange, GDTChange, GDTSymbol, PartSpecification
+)
+
+
+@dataclass
+class Alignment:
+    """
+    How the previous revision maps onto the new one.
+    
+    matrix maps new-sheet pixel coordinates to previous-sheet coordinates
+    (2x3 affine, for cv2.warpAffine with WARP_INVERSE_MAP).
+    """
+    matrix: np.ndarray
+    method: str  # 'orb', 'orb+ecc', 'ecc' or 'identity'
+    matches: int = 0
+
+
+def register_sheets(previous: np.ndarray, new: np.ndarray,
+                    work_edge: int = 1000,
+                    min_matches: int = 12) -> Optional[Alignment]:
+    """
+    Find the affine transform that lines the previous revision up with the new one.
+    
+    Like a checker pinning two transparencies together: first match
+    distinctive corners (ORB keypoints, which survive rescans that are
+    shifted, rotated or rescaled), then nudge until the lines coincide
+    (ECC refinement to sub-pixel accuracy). Both run on copies with a
+    long edge of work_edge pixels.
+    
+    Args:
+        previous / new: Grayscale sheets (any sizes)
+        work_edge: Long edge of the working copies
+        min_matches: RANSAC inliers needed to trust the ORB estimate
+    
+    Returns:
+        Alignment, or None if the sheets could not be registered
+    """
+    prev_scale = min(1.0, work_edge / max(previous.shape[:2]))
+    new_scale = min(1.0, work_edge / max(new.shape[:2]))
+    prev_small = _resize(previous, prev_scale)
+    new_small = _resize(new, new_scale)
+    
+    # Estimated at working resolution: new_small -> prev_small
+    warp, method, matches = None, None, 0
+    orb = cv2.ORB_create(nfeatures=5000)
+    prev_keys, prev_desc = orb.detectAndCompute(prev_small, None)
+    new_keys, new_desc = orb.detectAndCompute(new_small, None)
+    if prev_desc is not None and new_desc is not None:
+        pairs = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True).match(new_desc, prev_desc)
+        if len(pairs) >= min_matches:
+            src = np.float32([new_keys[p.queryIdx].pt for p in pairs])
+            dst = np.float32([prev_keys[p.trainIdx].pt for p in pairs])
+            estimate, inliers = cv2.estimateAffinePartial2D(src, dst, method=cv2.RANSAC,
+                                                            ransacReprojThreshold=3.0)
+            if estimate is not None and int(inliers.sum()) >= min_matches:
+                warp, method, matches = estimate.astype(np.float32), 'orb', int(inliers.sum())
+    
+    if warp is None and prev_small.shape == new_small.shape:
+        warp, method = np.eye(2, 3, dtype=np.float32), 'identity'
+    
+    if warp is not None:
+        # ECC aligns intensities, so it can start from the keypoint estimate
+        try:
+            _, refined = cv2.findTransformECC(
+                _ecc_input(new_small), _ecc_input(prev_small), warp.copy(), cv2.MOTION_AFFINE,
+                (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 100, 1e-5), None, 5
+            )
+            warp, method = refined, 'ecc' if method == 'identity' else 'orb+ecc'
+        except cv2.error:
+            pass  # did not converge - keep the keypoint estimate
+    
+    if warp is None:
+        return None
+    
+    # Back to full resolution: new -> new_small -> prev_small -> previous
+    to_small = np.diag([new_scale, new_scale, 1.0])
+    from_small = np.diag([1 / prev_scale, 1 / prev_scale, 1.0])
+    full = from_small @ np.vstack([warp, [0, 0, 1]]) @ to_small
+    return Alignment(matrix=full[:2].astype(np.float32), method=method, matches=matches)
+
+
+def change_mask(previous: np.ndarray, new: np.ndarray, alignment: Alignment,
+                tolerance: int = 2, min_blob_pixels: int = 12) -> np.ndarray:
+    """
+    Pixels of the new sheet whose ink differs from the aligned previous one.
+    
+    Ink that has no ink within `tolerance` pixels on the other sheet is a
+    change (added in the new sheet or removed from the old). Blobs smaller
+    than min_blob_pixels are scanner noise.
+    """
+    aligned = cv2.warpAffine(previous, alignment.matrix, (new.shape[1], new.shape[0]),
+                             flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderValue=255)
+    prev_ink = _ink(aligned)
+    new_ink = _ink(new)
+    
+    kernel = np.ones((2 * tolerance + 1, 2 * tolerance + 1), np.uint8)
+    changed = (new_ink > cv2.dilate(prev_ink, kernel)) | (prev_ink > cv2.dilate(new_ink, kernel))
+    
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(changed.astype(np.uint8), connectivity=8)
+    keep = stats[:, cv2.CC_STAT_AREA] >= min_blob_pixels
+    keep[0] = False  # unchanged background
+    return keep[labels]
+
+
+def locate_changes(mask: np.ndarray, boxes: List[Tuple[int, int, int, int]],
+                   sheet: Optional[np.ndarray] = None,
+                   merge_distance: int = 40,
+                   padding: int = 16) -> Tuple[List[int], List[Tuple[int, int, int, int]]]:
+    """
+    Attribute changed pixels to regions.
+    
+    Changes outside every box get extra boxes: everything within
+    merge_distance of them is grouped - on the new sheet's ink when
+    `sheet` is given, so a changed digit brings along the rest of its
+    note or callout instead of being cropped alone.
+    
+    Args:
+        mask: Change mask (see change_mask())
+        boxes: (x, y, w, h) of the regions changes may fall in, in mask pixels
+        sheet: Grayscale new sheet, the size of the mask
+        merge_distance: Grouping distance in pixels
+        padding: Margin around each extra box
+    
+    Returns:
+        (indices of boxes with changes, extra boxes around the other changes)
+    """
+    changed_boxes = []
+    outside = mask.copy()
+    for index, (x, y, w, h) in enumerate(boxes):
+        if mask[y:y + h, x:x + w].any():
+            changed_boxes.append(index)
+        outside[y:y + h, x:x + w] = False
+    
+    if not outside.any():
+        return changed_boxes, []
+    
+    seeds = outside.astype(np.uint8)
+    if sheet is not None:
+        seeds |= _ink(sheet)
+        for x, y, w, h in boxes:
+            seeds[y:y + h, x:x + w] = 0
+    kernel = np.ones((merge_distance, merge_distance), np.uint8)
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(cv2.dilate(seeds, kernel), connectivity=8)
+    
+    img_h, img_w = mask.shape
+    extra = []
+    for label in np.unique(labels[outside]):
+        x, y, w, h, _ = stats[label]
+        # The dilation grew each group by half the kernel on every side
+        x0 = max(0, x + merge_distance // 2 - padding)
+        y0 = max(0, y + merge_distance // 2 - padding)
+        x1 = min(img_w, x + w - merge_distance // 2 + padding)
+        y1 = min(img_h, y + h - merge_distance // 2 + padding)
+        extra.append((int(x0), int(y0), int(x1 - x0), int(y1 - y0)))
+    return changed_boxes, extra
+
+
+def diff_specifications(old: PartSpecification, new: PartSpecification) -> Dict:
+    """
+    What differs between two extractions, field by field.
+    
+    Dimensions are matched by feature name (overall dimensions by their
+    key), GD&T callouts by symbol and the feature they apply to. Identical
+    entries cancel out; the rest are paired up as 'changed' in order, and
+    whatever is left over is 'added' or 'removed'.
+    
+    Returns:
+        Dict with 'fields' ({name: [old, new]} for part number, material
+        and title block entries), 'dimensions', 'gdt', 'notes_added' and
+        'notes_removed' - the matching RevisionDiff fields
+    """
+    fields = {}
+    for name in ('part_number', 'material'):
+        if getattr(old, name) != getattr(new, name):
+            fields[name] = [getattr(old, name), getattr(new, name)]
+    for key in sorted(set(old.title_block_info) | set(new.title_block_info)):
+        if old.title_block_info.get(key) != new.title_block_info.get(key):
+            fields[f"title_block_info.{key}"] = [old.title_block_info.get(key), new.title_block_info.get(key)]
+    
+    def dimensions(spec: PartSpecification) -> List[Tuple[str, Dimension]]:
+        return ([(_norm(key), dim) for key, dim in spec.overall_dimensions.items()]
+                + [(_norm(dim.feature), dim) for dim in spec.critical_dimensions])
+    
+    def dimension_value(dim: Dimension) -> tuple:
+        return (dim.value, _norm(dim.unit), dim.tolerance_upper, dim.tolerance_lower)
+    
+    dimension_changes = [
+        DimensionChange(feature=feature, change=change, old=a, new=b)
+        for feature, change, a, b in _pair_up(dimensions(old), dimensions(new), dimension_value)
+    ]
+    
+    def callouts(spec: PartSpecification) -> List[Tuple[str, GDTSymbol]]:
+        return [(f"{_norm(gdt.symbol_type)}|{_norm(gdt.applies_to)}", gdt) for gdt in spec.gdt_requirements]
+    
+    def callout_value(gdt: GDTSymbol) -> tuple:
+        return (gdt.tolerance, tuple(_norm(d) for d in gdt.datum_references))
+    
+    gdt_changes = [
+        GDTChange(symbol_type=(a or b).symbol_type, applies_to=(a or b).applies_to, change=change, old=a, new=b)
+        for _, change, a, b in _pair_up(callouts(old), callouts(new), callout_value)
+    ]
+    
+    old_notes = {_norm(note) for note in old.notes}
+    new_notes = {_norm(note) for note in new.notes}
+    return {
+        'fields': fields,
+        'dimensions': dimension_changes,
+        'gdt': gdt_changes,
+        'notes_added': [note for note in new.notes if _norm(note) not in old_notes],
+        'notes_removed': [note for note in old.notes if _norm(note) not in new_notes]
+    }
+
+
+def _pair_up(old: List[Tuple[str, object]], new: List[Tuple[str, object]], value) -> List[tuple]:
+    """(key, change, old item, new item) for every difference between two keyed lists."""
+    changes = []
+    for key in dict.fromkeys([k for k, _ in old] + [k for k, _ in new]):
+        before = [item for k, item in old if k == key]
+        after = [item for k, item in new if k == key]
+        # Identical entries cancel out
+        for item in list(before):
+            match = next((other for other in after if value(other) == value(item)), None)
+            if match is not None:
+                before.remove(item)
+                after.remove(match)
+        for a, b in zip(before, after):
+            changes.append((key, 'changed', a, b))
+        changes += [(key, 'removed', a, None) for a in before[len(after):]]
+        changes += [(key, 'added', None, b) for b in after[len(before):]]
+    return changes
+
+
+def _resize(gray: np.ndarray, scale: float) -> np.ndarray:
+    if scale >= 1.0:
+        return gray
+    size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def _ecc_input(gray: np.ndarray) -> np.ndarray:
+    # Thin lines give ECC almost no gradient to follow; blur them wider
+    return cv2.GaussianBlur(gray, (0, 0), 2).astype(np.float32)
+
+
+def _ink(gray: np.ndarray) -> np.ndarray:
+    _, ink = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    return ink
+
+
+def _norm(text: Optional[str]) -> str:
+    return ' '.join((text or '').lower().split())
@@ -0,0 +1,468 @@
+"""
+Drawing Similarity Index for Mechanical Drawing Analysis
+Finds previously analyzed near-duplicate sheets (revisions) so their results can be reused
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+import json
+import sqlite3
+import threading
+import time
+import zlib
+import cv2
+import numpy as np
+
+from src.models import PartSpecification
+
+
+# Cells along the long edge of the grid the ink is summarized on
+INK_GRID = 128
+
+
+@dataclass
+class SheetFingerprint:
+    """
+    What a sheet looks like, compactly.
+    
+    - phash: 64-bit perceptual hash of the whole sheet (ANN lookup key)
+    - regions: (type, normalized x, y, w, h) of each detected region
+    - ink: (3, rows, cols) uint8 grid over the sheet - ink density and
+      ink centroid (x, y) per cell, measured at full resolution so that
+      one changed digit still changes its cell
+    """
+    phash: int
+    regions: List[Tuple[str, Tuple[float, float, float, float]]]
+    ink: np.ndarray
+
+
+@dataclass
+class SheetChanges:
+    """Where a sheet differs from a near-duplicate."""
+    regions: List[int] = field(default_factory=list)  # indices of changed regions
+    changed_cells: int = 0
+    unassigned_cells: int = 0  # changed cells outside the given regions
+
+
+@dataclass
+class SimilarSheet:
+    """A previously analyzed sheet returned by SimilarityIndex.nearest()."""
+    file_path: str
+    distance: int  # Hamming distance of the perceptual hashes
+    layout_similarity: float
+    fingerprint: SheetFingerprint
+    specification: PartSpecification
+
+
+def perceptual_hash(gray: np.ndarray) -> int:
+    """
+    64-bit DCT perceptual hash.
+    
+    The sheet is shrunk to 32x32 (block means) and only its 8x8 lowest
+    frequencies are kept, one bit per frequency (above or below their
+    median). Rescans, re-exports and small edits leave it (nearly) unchanged.
+    """
+    builder = FingerprintBuilder(gray.shape[:2])
+    builder.add_tile(gray)
+    return builder.phash()
+
+
+def sheet_fingerprint(gray: np.ndarray, regions: List[Dict],
+                      sheet_shape: Optional[Tuple[int, int]] = None) -> SheetFingerprint:
+    """
+    Fingerprint a sheet.
+    
+    Args:
+        gray: Grayscale sheet (may be a thumbnail of it)
+        regions: Detected regions, in sheet coordinates
+        sheet_shape: (height, width) the region boxes refer to; defaults to gray's
+    """
+    builder = FingerprintBuilder(gray.shape[:2])
+    # The whole sheet is at hand: OpenCV's Otsu (the same threshold) is
+    # quicker than collecting the histogram
+    builder.threshold = int(cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[0])
+    builder.add_tile(gray)
+    builder.add_ink(gray)
+    return builder.fingerprint(regions, sheet_shape)
+
+
+class FingerprintBuilder:
+    """
+    Fingerprint of a sheet that is read one tile at a time.
+    
+    Like taking a census block by block: each tile only adds its counts
+    to sheet-wide tallies, so the result is the same however the sheet
+    was cut up - a tiled run fingerprints a sheet exactly as a run on the
+    whole array would, at full resolution. Two passes are needed, because
+    what counts as ink (the Otsu threshold) depends on every pixel:
+    
+    1. add_tile() every tile: grey-level histogram and hash block sums
+    2. add_ink() every tile: ink per grid cell, at the sheet's threshold
+    
+    Tiles are given with their (y0, x0) offset in the sheet and must not
+    overlap. A threshold set before the first pass is used as it is.
+    """
+    
+    # Side of the shrunken sheet the perceptual hash is taken from
+    HASH_SIZE = 32
+    
+    def __init__(self, shape: Tuple[int, int]):
+        self.shape = shape
+        height, width = shape
+        self._hash_rows = np.arange(self.HASH_SIZE + 1) * height // self.HASH_SIZE
+        self._hash_cols = np.arange(self.HASH_SIZE + 1) * width // self.HASH_SIZE
+        self._hash_sums = np.zeros((self.HASH_SIZE, self.HASH_SIZE), np.int64)
+        self._histogram = np.zeros(256, np.int64)
+        
+        # Binarize at full resolution: downscaling first would wash thin
+        # strokes (a changed digit) out before they are counted
+        self.cell = max(1, -(-max(shape) // INK_GRID))
+        self._cell_rows = np.arange(-(-height // self.cell) + 1) * self.cell
+        self._cell_cols = np.arange(-(-width // self.cell) + 1) * self.cell
+        # Per cell: ink pixels, and the sums of their x / y offsets in the cell
+        self._ink = np.zeros((3, len(self._cell_rows) - 1, len(self._cell_cols) - 1), np.int64)
+        self.threshold: Optional[int] = None
+    
+    def add_tile(self, gray: np.ndarray, y0: int = 0, x0: int = 0):
+        """First pass: count a tile's grey levels."""
+        if self.threshold is None:
+            # calcHist counts in float32, exact up to 2**24 pixels per call
+            rows = max(1, 2 ** 24 // max(1, gray.shape[1]))
+            for start in range(0, gray.shape[0], rows):
+                chunk = np.ascontiguousarray(gray[start:start + rows])
+                self._histogram += cv2.calcHist([chunk], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+        self._hash_sums += _block_sums(gray, self._hash_rows - y0, self._hash_cols - x0)
+    
+    def add_ink(self, gray: np.ndarray, y0: int = 0, x0: int = 0):
+        """Second pass (after every add_tile()): count a tile's ink per cell."""
+        if self.threshold is None:
+            self.threshold = otsu_threshold(self._histogram)
+        ink = (gray <= self.threshold).view(np.uint8)
+        rows, cols = self._cell_rows - y0, self._cell_cols - x0
+        # Ink per column within each row of cells, and per row within each
+        # column of cells: both offset sums follow without another pass
+        column_counts = _reduce_blocks(ink, rows, 0)
+        row_counts = _reduce_blocks(ink, cols, 1)
+        self._ink[0] += _reduce_blocks(column_counts, cols, 1)
+        self._ink[1] += _reduce_blocks(column_counts * (np.arange(x0, x0 + gray.shape[1]) % self.cell), cols, 1)
+        self._ink[2] += _reduce_blocks(row_counts * (np.arange(y0, y0 + gray.shape[0]) % self.cell)[:, None], rows, 0)
+    
+    def phash(self) -> int:
+        """The perceptual hash of the tiles added so far."""
+        rows, cols = np.diff(self._hash_rows), np.diff(self._hash_cols)
+        with np.errstate(invalid='ignore'):
+            small = np.nan_to_num(self._hash_sums / np.outer(rows, cols)).astype(np.float32)
+        low = cv2.dct(small)[:8, :8].flatten()
+        bits = low > np.median(low[1:])
+        return int(np.packbits(bits).view('>u8')[0])
+    
+    def fingerprint(self, regions: List[Dict],
+                    sheet_shape: Optional[Tuple[int, int]] = None) -> SheetFingerprint:
+        """
+        The fingerprint, once both passes are done.
+        
+        Args:
+            regions: Detected regions, in sheet coordinates
+            sheet_shape: (height, width) the region boxes refer to; defaults to shape
+        """
+        sheet_h, sheet_w = sheet_shape or self.shape
+        counts, sum_x, sum_y = self._ink
+        span = max(1, self.cell - 1)
+        with np.errstate(invalid='ignore'):
+            centroid_x = np.nan_to_num(sum_x / (counts * span))
+            centroid_y = np.nan_to_num(sum_y / (counts * span))
+        grid = np.stack([counts / (self.cell * self.cell), centroid_x, centroid_y])
+        
+        return SheetFingerprint(
+            phash=self.phash(),
+            regions=[
+                (region['type'], (round(x / sheet_w, 4), round(y / sheet_h, 4),
+                                  round(w / sheet_w, 4), round(h / sheet_h, 4)))
+                for region in regions
+                for x, y, w, h in [region['bbox']]
+            ],
+            ink=np.round(grid * 255).astype(np.uint8)
+        )
+
+
+def otsu_threshold(histogram: np.ndarray) -> int:
+    """
+    Otsu's threshold of a 256-bin grey-level histogram, as
+    cv2.threshold(..., THRESH_OTSU) picks it: levels <= it are ink.
+    """
+    total = histogram.sum()
+    if not total:
+        return 0
+    p = histogram / total
+    levels = np.arange(256)
+    q1 = np.cumsum(p)
+    q2 = 1 - q1
+    mu1_sum = np.cumsum(levels * p)
+    eps = np.finfo(np.float32).eps
+    valid = (np.minimum(q1, q2) >= eps) & (np.maximum(q1, q2) <= 1 - eps)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mu1 = mu1_sum / q1
+        mu2 = (mu1_sum[-1] - mu1_sum) / q2
+        sigma = np.where(valid, q1 * q2 * (mu1 - mu2) ** 2, 0.0)
+    return int(np.argmax(sigma)) if sigma.max() > 0 else 0
+
+
+def _block_sums(values: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """
+    Sums of `values` over the blocks between consecutive row / column
+    edges, given relative to `values`. Edges outside it are clipped, so
+    blocks it doesn't reach sum to 0; the edges must span all of it.
+    """
+    return _reduce_blocks(_reduce_blocks(values, rows, 0), cols, 1)
+
+
+def _reduce_blocks(values: np.ndarray, edges: np.ndarray, axis: int) -> np.ndarray:
+    edges = np.clip(edges, 0, values.shape[axis])
+    starts = edges[:-1]
+    filled = np.flatnonzero(edges[1:] > starts)
+    shape = list(values.shape)
+    shape[axis] = len(starts)
+    # 8-bit pixels summed along one axis of a sheet fit in int32 (and
+    # add up much faster than in int64)
+    dtype = np.int32 if values.dtype == np.uint8 else np.int64
+    sums = np.zeros(shape, dtype)
+    if len(filled):
+        # Each filled block runs to the next one's start, the last to the
+        # end of the axis; empty blocks in between have no width
+        index = [slice(None)] * values.ndim
+        index[axis] = filled
+        sums[tuple(index)] = np.add.reduceat(values, starts[filled], axis=axis, dtype=dtype)
+    return sums
+
+
+def layout_similarity(a: SheetFingerprint, b: SheetFingerprint) -> float:
+    """Mean best IoU between same-type regions of two sheets (both ways), 0 to 1."""
+    if not a.regions and not b.regions:
+        return 1.0
+    
+    def best_ious(src, dst):
+        return [max((_iou(box, other) for kind, other in dst if kind == region_type), default=0.0)
+                for region_type, box in src]
+    
+    scores = best_ious(a.regions, b.regions) + best_ious(b.regions, a.regions)
+    return sum(scores) / len(scores)
+
+
+def diff_fingerprints(old: SheetFingerprint, new: SheetFingerprint,
+                      region_indices: Optional[List[int]] = None,
+                      tolerance: int = 1) -> Optional[SheetChanges]:
+    """
+    Compare the ink of two sheets cell by cell and attribute changes to regions.
+    
+    Like laying one print over the other on a light table and clouding
+    every square of the grid that doesn't match: a cell changed if its ink
+    density or ink centroid moved by more than `tolerance` (in 1/255ths).
+    The sheets must be aligned - the same export, not a rescan.
+    
+    Args:
+        old / new: Fingerprints to compare
+        region_indices: Which of new.regions changes may be attributed to
+            (default: all); changed cells outside them are counted as unassigned
+        tolerance: Largest difference per cell that is not a change
+    
+    Returns:
+        SheetChanges, or None if the sheets are not comparable (different grids)
+    """
+    if old.ink.shape != new.ink.shape:
+        return None
+    
+    changed = (np.abs(old.ink.astype(np.int16) - new.ink.astype(np.int16)) > tolerance).any(axis=0)
+    changes = SheetChanges(changed_cells=int(changed.sum()))
+    if not changes.changed_cells:
+        return changes
+    
+    rows, cols = changed.shape
+    assigned = np.zeros_like(changed)
+    if region_indices is None:
+        region_indices = range(len(new.regions))
+    for index in region_indices:
+        x, y, w, h = new.regions[index][1]
+        window = (slice(int(y * rows), int(np.ceil((y + h) * rows))),
+                  slice(int(x * cols), int(np.ceil((x + w) * cols))))
+        if changed[window].any():
+            changes.regions.append(index)
+        assigned[window] = True
+    changes.unassigned_cells = int((changed & ~assigned).sum())
+    return changes
+
+
+class SimilarityIndex:
+    """
+    On-disk index of analyzed sheets, looked up by perceptual hash.
+    
+    Like a drawing archive sorted by appearance rather than by number: a
+    new revision is filed next to its predecessors, so finding "the sheet
+    that looks like this one" is a short walk, not a search of every
+    drawer. The 64-bit hash is split into bands; two hashes within
+    `bands - 1` bits of each other share at least one band exactly, so
+    an indexed band lookup finds every candidate without a full scan.
+    
+    Entries are namespaced (provider/model/schema) so a result is only
+    reused for the same kind of extraction.
+    """
+    
+    def __init__(self,
+                 path: str = ".mech_dwg_cache/similarity.sqlite",
+                 max_distance: int = 6,
+                 min_layout_similarity: float = 0.8,
+                 bands: int = 8,
+                 max_entries: int = 10000):
+        """
+        Open (or create) the index.
+        
+        Args:
+            path: SQLite database file
+            max_distance: Largest Hamming distance between perceptual hashes
+                that counts as a near-duplicate (at most bands - 1)
+            min_layout_similarity: Smallest layout_similarity() that counts
+            bands: Hash bands (64 must divide evenly)
+            max_entries: Oldest sheets are dropped beyond this many
+        """
+        if 64 % bands or max_distance >= bands:
+            raise ValueError("bands must divide 64 and exceed max_distance")
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_distance = max_distance
+        self.min_layout_similarity = min_layout_similarity
+        self.bands = bands
+        self.max_entries = max_entries
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sheets (
+                id INTEGER PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                phash INTEGER NOT NULL,
+                regions TEXT NOT NULL,
+                ink BLOB NOT NULL,
+                ink_h INTEGER NOT NULL,
+                ink_w INTEGER NOT NULL,
+                specification TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                sheet_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_bands ON bands (band, value);
+            CREATE INDEX IF NOT EXISTS idx_bands_sheet ON bands (sheet_id);
+        """)
+        self._conn.commit()
+    
+    def add(self, namespace: str, fingerprint: SheetFingerprint,
+            specification: PartSpecification, file_path: str = "") -> int:
+        """File an analyzed sheet; returns its id."""
+        _, ink_h, ink_w = fingerprint.ink.shape
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO sheets (namespace, phash, regions, ink, ink_h, ink_w, "
+                "specification, file_path, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (namespace, _signed(fingerprint.phash), json.dumps(fingerprint.regions),
+                 zlib.compress(fingerprint.ink.tobytes()), ink_h, ink_w,
+                 specification.model_dump_json(), file_path, time.time())
+            )
+            sheet_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO bands (band, value, sheet_id) VALUES (?, ?, ?)",
+                [(band, value, sheet_id) for band, value in enumerate(self._band_values(fingerprint.phash))]
+            )
+            self._evict()
+            self._conn.commit()
+        return sheet_id
+    
+    def nearest(self, namespace: str, fingerprint: SheetFingerprint) -> Optional[SimilarSheet]:
+        """
+        The most similar filed sheet, or None if none is a near-duplicate.
+        
+        Ranked by the number of changed grid cells (see diff_fingerprints()),
+        then hash distance, then recency - so a revision is matched to the
+        revision it differs least from.
+        """
+        conditions = " OR ".join(["(band = ? AND value = ?)"] * self.bands)
+        params = [p for band, value in enumerate(self._band_values(fingerprint.phash)) for p in (band, value)]
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, phash, regions, ink, ink_h, ink_w, specification, file_path "
+                f"FROM sheets WHERE namespace = ? AND id IN "
+                f"(SELECT sheet_id FROM bands WHERE {conditions}) ORDER BY id DESC",
+                [namespace] + params
+            ).fetchall()
+        
+        best, best_rank = None, None
+        for sheet_id, phash, regions, ink, ink_h, ink_w, specification, file_path in rows:
+            distance = bin((phash & (2 ** 64 - 1)) ^ fingerprint.phash).count('1')
+            if distance > self.max_distance:
+                continue
+            candidate = SheetFingerprint(
+                phash=phash & (2 ** 64 - 1),
+                regions=[(kind, tuple(box)) for kind, box in json.loads(regions)],
+                ink=np.frombuffer(zlib.decompress(ink), np.uint8).reshape(3, ink_h, ink_w)
+            )
+            layout = layout_similarity(candidate, fingerprint)
+            if layout < self.min_layout_similarity:
+                continue
+            changes = diff_fingerprints(candidate, fingerprint)
+            rank = (changes.changed_cells if changes is not None else float('inf'), distance)
+            if best_rank is None or rank < best_rank:
+                best_rank = rank
+                best = SimilarSheet(
+                    file_path=file_path,
+                    distance=distance,
+                    layout_similarity=round(layout, 3),
+                    fingerprint=candidate,
+                    specification=PartSpecification.model_validate_json(specification)
+                )
+        return best
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sheets").fetchone()[0]
+    
+    def clear(self) -> None:
+        """Remove every filed sheet."""
+        with self._lock:
+            self._conn.execute("DELETE FROM sheets")
+            self._conn.execute("DELETE FROM bands")
+            self._conn.commit()
+    
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
+    
+    def _band_values(self, phash: int) -> List[int]:
+        width = 64 // self.bands
+        return [(phash >> (band * width)) & ((1 << width) - 1) for band in range(self.bands)]
+    
+    def _evict(self):
+        """Drop the oldest sheets beyond max_entries."""
+        stale = self._conn.execute(
+            "SELECT id FROM sheets ORDER BY id DESC LIMIT -1 OFFSET ?", (self.max_entries,)
+        ).fetchall()
+        if stale:
+            self._conn.executemany("DELETE FROM sheets WHERE id = ?", stale)
+            self._conn.executemany("DELETE FROM bands WHERE sheet_id = ?", stale)
+
+
+def _iou(a: Tuple[float, ...], b: Tuple[float, ...]) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = max(0.0, min(ax + aw, bx + bw) - max(ax, bx))
+    h = max(0.0, min(ay + ah, by + bh) - max(ay, by))
+    union = aw * ah + bw * bh - w * h
+    return w * h / union if union > 0 else 0.0
+
+
+def _signed(value: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return value - 2 ** 64 if value >= 2 ** 63 else value
@@ -0,0 +1,191 @@
+"""
+Incremental JSON Parsing for Mechanical Drawing Analysis
+Pulls finished fields out of a structured output while it is still streaming
+"""
+
+from typing import Any, Iterator, List, Optional, Tuple
+import json
+import re
+
+# Inside a string only quotes and escapes matter
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = re.compile(r'[ \t\r\n]*')
+_SCALAR_END = re.compile(r'[,\]} \t\r\n]')
+
+
+class _Frame:
+    """An open object or array: where the current member starts and what it is called."""
+    __slots__ = ('kind', 'key', 'expect_key', 'start')
+    
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.key = 0 if kind == '[' else None  # array index or object key
+        self.expect_key = kind == '{'
+        self.start = None
+
+
+class IncrementalJSONParser:
+    """
+    Streaming parser for one JSON object, fed in arbitrary pieces.
+    
+    Like a clerk reading a fax as it comes off the machine: as soon as a
+    line is complete (the part number, one dimension row) it is passed on,
+    without waiting for the last page. Only the nesting is tracked while
+    scanning; a finished value is decoded with json.loads on its own slice
+    of the text, and text nothing can refer back to any more is dropped,
+    so each character is looked at once however small the pieces are.
+    
+    feed() yields (path, value) for every value that completes at `depth`
+    (e.g. ('critical_dimensions', 0) -> the first dimension dict) and for
+    scalars above it (('part_number',) -> 'BRK-100'). Containers above
+    `depth` are not yielded themselves, only their members.
+    """
+    
+    def __init__(self, depth: int = 2):
+        self.depth = depth
+        self.done = False
+        self._chunks: List[str] = []
+        self._buffer = ""  # unconsumed text; offsets below are relative to it
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._string_is_key = False
+        self._string_start = 0
+        self._scalar_start: Optional[int] = None
+    
+    def feed(self, chunk: str) -> Iterator[Tuple[Tuple, Any]]:
+        """
+        Add the next piece of the document; yields the values it completes.
+        
+        Raises:
+            ValueError: the text is not valid JSON (so far)
+        """
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        text, i, end = self._buffer, self._pos, len(self._buffer)
+        stack = self._stack
+        
+        while i < end:
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, i)
+                if match is None:
+                    i = end
+                    break
+                i = match.start()
+                if text[i] == '\\':
+                    if i + 1 >= end:
+                        break  # wait for the escaped character
+                    i += 2
+                    continue
+                self._in_string = False
+                i += 1
+                if self._string_is_key:
+                    stack[-1].key = json.loads(text[self._string_start:i])
+                else:
+                    yield from self._end_value(i)
+                continue
+            
+            if self._scalar_start is not None:
+                # A number / true / false / null ends at the next delimiter
+                match = _SCALAR_END.search(text, i)
+                if match is None:
+                    i = end
+                    break
+                i = match.start()
+                yield from self._end_value(i)
+                self._scalar_start = None
+            
+            i = _WHITESPACE.match(text, i).end()
+            if i >= end:
+                break
+            char = text[i]
+            if self.done:
+                raise ValueError(f"Extra data after the JSON object at {i}")
+            elif char == '"':
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = bool(stack) and stack[-1].expect_key
+                if not self._string_is_key:
+                    self._start_value(i)
+            elif char in '{[':
+                self._start_value(i)
+                stack.append(_Frame(char))
+            elif char in '}]':
+                if not stack or stack[-1].kind != ('{' if char == '}' else '['):
+                    raise ValueError(f"Unexpected {char!r} at {i}")
+                stack.pop()
+                yield from self._end_value(i + 1)
+            elif char == ':':
+                if not stack or not stack[-1].expect_key:
+                    raise ValueError(f"Unexpected ':' at {i}")
+                stack[-1].expect_key = False
+            elif char == ',':
+                if not stack:
+                    raise ValueError(f"Unexpected ',' at {i}")
+                frame = stack[-1]
+                if frame.kind == '[':
+                    frame.key += 1
+                else:
+                    frame.expect_key = True
+            else:
+                self._start_value(i)
+                self._scalar_start = i
+            i += 1
+        
+        self._pos = i
+        self._trim()
+    
+    def close(self) -> Any:
+        """
+        The whole document, once the stream has ended.
+        
+        Raises:
+            ValueError: the stream stopped before the object was complete
+        """
+        return json.loads(self.text)
+    
+    @property
+    def text(self) -> str:
+        """Everything fed so far."""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+    
+    def _start_value(self, index: int):
+        if self._stack:
+            self._stack[-1].start = index
+        elif self.done or _WHITESPACE.match(self._buffer).end() != index:
+            raise ValueError(f"Expected a single JSON value at {index}")
+    
+    def _trim(self):
+        """Drop the text before anything a later value or key still starts at."""
+        keep = [self._pos]
+        for depth, frame in enumerate(self._stack[:self.depth], 1):
+            # Containers above `depth` are never decoded as a whole
+            if frame.start is not None and (depth == self.depth or self._buffer[frame.start] not in '{['):
+                keep.append(frame.start)
+        if self._in_string:
+            keep.append(self._string_start)
+        cut = min(keep)
+        if cut == 0 or not self._stack:
+            return
+        self._buffer = self._buffer[cut:]
+        self._pos -= cut
+        self._string_start -= cut
+        for frame in self._stack:
+            if frame.start is not None:
+                # Members that won't be decoded may lose their start
+                frame.start = frame.start - cut if frame.start >= cut else None
+    
+    def _end_value(self, end: int) -> Iterator[Tuple[Tuple, Any]]:
+        stack = self._stack
+        if not stack:
+            self.done = True
+            return
+        frame = stack[-1]
+        start, frame.start = frame.start, None
+        depth = len(stack)
+        if start is None:
+            return
+        if depth == self.depth or (depth < self.depth and self._buffer[start] not in '{['):
+            yield tuple(frame.key for frame in stack), json.loads(self._buffer[start:end])
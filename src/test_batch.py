@@ -0,0 +1,54 @@
+"""Test that a batch carries on past drawings that cannot be analyzed"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+import pytest
+
+from src.mech_dwg_orchestrator import MechanicalDrawingAnalyzer
+from src.models import PartSpecification
+
+
+class FakeLLM:
+    provider = "fake"
+    model = "fake-model"
+    
+    def analyze(self, images, prompt, structured_output, context=""):
+        return PartSpecification(part_number="P-1")
+
+
+def drawings(tmp_path):
+    good, corrupt = tmp_path / "good.png", tmp_path / "corrupt.png"
+    sheet = np.full((300, 400), 255, np.uint8)
+    cv2.rectangle(sheet, (50, 50), (350, 250), 0, 2)
+    cv2.imwrite(str(good), sheet)
+    corrupt.write_bytes(b"not a png")
+    return [good, corrupt, tmp_path / "missing.png"]
+
+
+@pytest.mark.parametrize("cv_workers, failed_stage", [(0, 'analysis'), (1, 'cv')])
+def test_bad_and_missing_files_become_error_results(tmp_path, cv_workers, failed_stage):
+    analyzer = MechanicalDrawingAnalyzer(llm_client=FakeLLM())
+    
+    results = {Path(result.file_path).name: result for result in
+               analyzer.analyze_batch(drawings(tmp_path), max_concurrency=2, cv_workers=cv_workers)}
+    
+    assert sorted(results) == ["corrupt.png", "good.png", "missing.png"]
+    assert results["good.png"].error is None
+    assert results["good.png"].specification.part_number == "P-1"
+    for name in ("corrupt.png", "missing.png"):
+        assert results[name].error
+        assert results[name].processing_info['failed_stage'] == failed_stage
+
+
+def test_results_can_be_saved_one_file_per_drawing(tmp_path):
+    analyzer = MechanicalDrawingAnalyzer(llm_client=FakeLLM())
+    
+    results = list(analyzer.analyze_batch(drawings(tmp_path), cv_workers=0, save_individual=True,
+                                          output_dir=str(tmp_path / "out")))
+    
+    assert len(results) == 3
+    assert len(list((tmp_path / "out").glob("*.json"))) == 3
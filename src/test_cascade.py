@@ -0,0 +1,90 @@
+"""Test scoring cheap-model extractions and escalating the weak ones"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pytest
+
+from src.cascade import score_specification
+from src.image_payload import ImageEncoder, LazyImagePayload
+from src.llm_errors import LLMRequestError, LLMUnavailableError
+from src.mech_dwg_orchestrator import MechanicalDrawingAnalyzer
+from src.models import Dimension, PartSpecification
+
+
+def dimension(confidence):
+    return Dimension(value=8.5, unit="mm", feature="hole diameter", confidence=confidence)
+
+
+CONFIDENT = PartSpecification(part_number="BRK-100", material="AL 6061-T6",
+                              overall_dimensions={"length": dimension(1.0)},
+                              critical_dimensions=[dimension(1.0)])
+SHAKY = PartSpecification(critical_dimensions=[dimension(0.9), dimension(0.7)])
+
+
+class FakeLLM:
+    provider = "fake"
+    
+    def __init__(self, model, answer):
+        self.model = model
+        self.answer = answer
+        self.calls = 0
+    
+    def analyze(self, images, prompt, structured_output, context=""):
+        self.calls += 1
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+
+def test_score_starts_from_confidence_and_docks_missing_fields_and_fixes():
+    assert score_specification(CONFIDENT) == score_specification(CONFIDENT, sanitize_fixes=0)
+    assert (score_specification(CONFIDENT).score, score_specification(CONFIDENT).reasons) == (1.0, [])
+    
+    shaky = score_specification(SHAKY, sanitize_fixes=2)
+    assert shaky.score == pytest.approx(0.8 - 2 * 0.25 - 2 * 0.05)
+    assert shaky.reasons == ["average confidence 0.80", "missing part_number", "missing material",
+                             "2 schema fixes"]
+    assert score_specification(PartSpecification()).score == 0.0  # never below zero
+
+
+def cv_results():
+    return {'processed_images': LazyImagePayload(np.full((100, 150, 3), 255, np.uint8), ImageEncoder())}
+
+
+def test_only_weak_or_failed_extractions_are_escalated():
+    first, second = FakeLLM("small", CONFIDENT), FakeLLM("large", CONFIDENT)
+    analyzer = MechanicalDrawingAnalyzer(llm_client=first, escalation_llm=second)
+    
+    confident = analyzer._analyze_cv_results("a.png", cv_results()).processing_info['cascade']
+    first.answer = SHAKY
+    shaky = analyzer._analyze_cv_results("b.png", cv_results())
+    first.answer = LLMUnavailableError("down")
+    failed = analyzer._analyze_cv_results("c.png", cv_results()).processing_info['cascade']
+    
+    assert (confident['tier'], confident['escalated'], list(confident['latency_ms'])) == (1, False, ['tier1'])
+    cascade = shaky.processing_info['cascade']
+    assert shaky.specification == CONFIDENT
+    assert (cascade['tier'], cascade['score'], cascade['escalated_score']) == (2, 0.3, 1.0)
+    assert (failed['tier'], failed['reasons']) == (2, ["first tier failed: LLMUnavailableError"])
+    assert second.calls == 2
+    stats = analyzer.get_cascade_stats()
+    assert (stats['drawings'], stats['escalated']) == (3, 2)
+    assert set(stats['mean_latency_ms']) == {'tier1', 'tier2'}
+
+
+def test_a_failed_escalation_keeps_the_first_answer_unless_there_is_none():
+    first, second = FakeLLM("small", SHAKY), FakeLLM("large", LLMRequestError("unknown model"))
+    analyzer = MechanicalDrawingAnalyzer(llm_client=first, escalation_llm=second)
+    
+    result = analyzer._analyze_cv_results("a.png", cv_results())
+    
+    assert result.specification == SHAKY
+    assert result.processing_info['cascade']['tier'] == 1
+    assert result.processing_info['cascade']['escalation_error'] == "LLMRequestError: unknown model"
+    
+    first.answer = LLMUnavailableError("down")
+    with pytest.raises(LLMRequestError):
+        analyzer._analyze_cv_results("b.png", cv_results())
@@ -0,0 +1,98 @@
+"""Test rule compilation, unit normalization and GD&T dispatch"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.compliance_rules import ComplianceChecker, compile_rules, format_violation
+from src.models import Dimension, GDTSymbol, PartSpecification
+
+RULES = {
+    'numeric_rules': {
+        'min_wall_thickness': 2.0,
+        'max_hole_diameter': {'value': 0.5, 'unit': 'in'},
+        'max_position_tolerance': 0.1,
+        'max_tolerance_stack': 0.5
+    },
+    'material_rules': {
+        'allowed_materials': ['Aluminum 6061-T6'],
+        'require_material_spec': True
+    },
+    'gdt_rules': {
+        'require_datum_references': True,
+        'max_flatness': 0.05
+    }
+}
+
+
+def make_spec(**kwargs):
+    fields = dict(part_number="P-1", material="Aluminum 6061-T6", overall_dimensions={},
+                  critical_dimensions=[], gdt_requirements=[], notes=[])
+    fields.update(kwargs)
+    return PartSpecification(**fields)
+
+
+def check(spec, rules=RULES):
+    return ComplianceChecker().check_specification(spec, rules)
+
+
+def test_every_offending_dimension_is_reported_in_mm():
+    spec = make_spec(critical_dimensions=[
+        Dimension(value=0.06, unit="in", feature="Wall thickness, left", confidence=0.9),
+        Dimension(value=3.0, unit="mm", feature="Wall thickness, right", confidence=0.9),
+        Dimension(value=1.5, unit="mm", feature="Rib wall", confidence=0.9),
+        Dimension(value=20.0, unit="mm", feature="Bore hole diameter", confidence=0.9),
+    ])
+    
+    violations = check(spec)
+    
+    assert [(v['rule'], v['location']) for v in violations] == [
+        ('min_wall_thickness', "Wall thickness, left"),
+        ('min_wall_thickness', "Rib wall"),
+        ('max_hole_diameter', "Bore hole diameter"),
+    ]
+    assert violations[0]['message'] == "Wall thickness 1.524mm below minimum 2mm"
+    assert violations[2]['message'] == "Hole diameter 20mm exceeds maximum 12.7mm"
+
+
+def test_hole_limits_only_apply_to_hole_diameters():
+    compiled = compile_rules({'numeric_rules': {'max_hole_diameter': 10.0, 'max_hole_depth': 5.0}})
+    
+    assert compiled.categories("Hole  Depth") == ['hole_depth']
+    assert compiled.categories("hole depth") is compiled.categories("HOLE DEPTH")
+    assert compiled.categories("hole diameter") == compiled.categories("Ø8 holes") == ['hole_diameter']
+    assert compiled.categories("bore") == ['hole_diameter']
+    assert compiled.categories("hole spacing") == compiled.categories("depth of bore") == []
+    assert [v['rule'] for v in compiled.dimension_violations(
+        {'value': 12, 'unit': 'mm', 'feature': 'hole depth'})] == ['max_hole_depth']
+
+
+def test_a_feature_can_fall_in_two_categories():
+    compiled = compile_rules({'numeric_rules': {'min_wall_thickness': 2.0, 'min_thickness': 3.0}})
+    
+    assert compiled.categories("Wall thickness") == ['wall_thickness', 'thickness']
+    assert [v['rule'] for v in compiled.dimension_violations(
+        {'value': 1.5, 'unit': 'mm', 'feature': 'wall thickness'})] == ['min_wall_thickness', 'min_thickness']
+
+
+def test_gdt_rules_dispatch_on_symbol_and_datums():
+    spec = make_spec(gdt_requirements=[
+        GDTSymbol(symbol_type="True Position", tolerance=0.2, datum_references=[], applies_to="hole A"),
+        GDTSymbol(symbol_type="Position", tolerance=0.05, datum_references=["A", "B"], applies_to="hole B"),
+        GDTSymbol(symbol_type="Flatness", tolerance=0.1, datum_references=[], applies_to="top face"),
+    ])
+    
+    violations = [format_violation(v) for v in check(spec)]
+    
+    assert violations == [
+        "[error] max_position_tolerance: Position tolerance 0.2mm exceeds maximum 0.1mm (hole A)",
+        "[error] require_datum_references: Position tolerance has no datum reference (hole A)",
+        "[error] max_flatness: Flatness tolerance 0.1mm exceeds maximum 0.05mm (top face)",
+    ]
+
+
+def test_material_rules_and_unsupported_rules():
+    assert check(make_spec()) == []
+    assert [v['severity'] for v in check(make_spec(material="Steel 1018"))] == ['warning']
+    assert [v['rule'] for v in check(make_spec(material=None))] == ['require_material_spec']
+    assert compile_rules(RULES).unsupported == ['max_tolerance_stack']
@@ -0,0 +1,165 @@
+"""Test region detection, GD&T counting and tiled processing on synthetic sheets"""
+
+import base64
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+import pytest
+
+from src.cv_processor import CVProcessor, _contour_stats
+
+TITLE_BLOCK = (1100, 900, 550, 250)
+
+
+def decode(data_url):
+    data = base64.b64decode(data_url.split(',', 1)[1])
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+
+def tiled(**kwargs):
+    return CVProcessor(tile_size=512, tile_overlap=64, tile_threshold_pixels=1, **kwargs)
+
+
+def gdt_sheet():
+    img = np.full((1200, 1700), 255, np.uint8)
+    x, y, w, h = TITLE_BLOCK
+    cv2.rectangle(img, (x, y), (x + w, y + h), 0, 3)
+    for row in range(y + 30, y + h, 30):  # cells as high as a frame
+        cv2.line(img, (x, row), (x + w, row), 0, 2)
+    for column in range(x + 30, x + w, 30):
+        cv2.line(img, (column, y), (column, y + h), 0, 2)
+    
+    # Feature control frame: |⌖|0.05|A|
+    cv2.rectangle(img, (200, 200), (350, 230), 0, 2)
+    for divider in (230, 320):
+        cv2.line(img, (divider, 200), (divider, 230), 0, 2)
+    cv2.putText(img, "0.05", (240, 224), cv2.FONT_HERSHEY_SIMPLEX, 0.6, 0, 1)
+    
+    # Datum feature symbol: boxed letter on a leader and triangle
+    cv2.rectangle(img, (600, 400), (630, 430), 0, 2)
+    cv2.putText(img, "A", (607, 424), cv2.FONT_HERSHEY_SIMPLEX, 0.7, 0, 2)
+    cv2.line(img, (615, 400), (615, 360), 0, 2)
+    cv2.fillPoly(img, [np.array([[605, 360], [625, 360], [615, 345]])], 0)
+    
+    cv2.putText(img, "BOSS 0 20 DEEP", (100, 700), cv2.FONT_HERSHEY_SIMPLEX, 1.0, 0, 2)
+    cv2.circle(img, (900, 600), 20, 0, 2)  # a balloon, not a datum
+    return img
+
+
+def views_sheet():
+    img = gdt_sheet()
+    cv2.rectangle(img, (100, 100), (700, 500), 0, 2)  # front view with a bore
+    cv2.circle(img, (450, 350), 100, 0, 2)
+    cv2.rectangle(img, (900, 100), (1600, 400), 0, 2)  # parts list
+    for row in range(150, 400, 50):
+        cv2.line(img, (900, row), (1600, row), 0, 2)
+    cv2.rectangle(img, (800, 700), (1000, 800), 0, 2)  # detail
+    return img
+
+
+def contour_regions(processor, gray):
+    """The region detection CVProcessor started out with: one contour at a time."""
+    edges = cv2.Canny(gray, *processor.edge_threshold)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    img_h, img_w = gray.shape
+    regions = []
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area >= processor.min_region_area:
+            x, y, w, h = cv2.boundingRect(contour)
+            regions.append((processor._classify_region(x, y, w, h, img_w, img_h), (x, y, w, h), area))
+    return sorted(regions)
+
+
+def test_regions_match_the_contour_by_contour_detection():
+    processor = CVProcessor()
+    enhanced = processor._stage_enhanced(views_sheet())
+    
+    expected = contour_regions(processor, enhanced)
+    regions = sorted((r['type'], r['bbox'], r['area']) for r in processor._detect_regions(enhanced))
+    
+    assert [(kind, bbox) for kind, bbox, _ in regions] == [(kind, bbox) for kind, bbox, _ in expected] == [
+        ('detail', (798, 698, 204, 104)),
+        ('table', (98, 98, 604, 404)),
+        ('table', (898, 98, 704, 304)),
+        ('title_block', (1097, 897, 556, 256)),
+    ]
+    # Enclosed pixels rather than the polygon area: close, not identical
+    assert [area for *_, area in regions] == pytest.approx([area for *_, area in expected], rel=0.1)
+
+
+def test_only_the_stages_an_output_depends_on_run_once_each():
+    class CountingProcessor(CVProcessor):
+        calls = []
+        
+        def _stage_enhanced(self, gray):
+            self.calls.append('enhanced')
+            return super()._stage_enhanced(gray)
+    
+    processor = CountingProcessor()
+    
+    result = processor.process_image(views_sheet(), ['features', 'regions', 'fingerprint'])
+    
+    assert list(result) == ['features', 'regions', 'fingerprint', 'metadata']
+    assert set(result['metadata']['stage_timings']) == {'gray', 'enhanced', 'regions', 'features', 'fingerprint'}
+    assert processor.calls == ['enhanced']
+    assert list(processor.process_image(views_sheet(), ['gray'])['metadata']['stage_timings']) == ['gray']
+    assert set(processor.process_image(views_sheet())) == {'processed_images', 'regions', 'metadata'}
+    with pytest.raises(ValueError, match="Unknown CV outputs"):
+        processor.process_image(views_sheet(), ['regions', 'ocr'])
+
+
+def test_gdt_frames_and_datums_are_counted_outside_the_title_block():
+    regions = [{'type': 'title_block', 'bbox': TITLE_BLOCK}]
+    
+    assert CVProcessor()._detect_gdt_frames(gdt_sheet(), regions) == \
+        {'feature_control_frame': 1, 'datum_feature': 1}
+
+
+def test_contour_stats_match_opencv():
+    _, binary = cv2.threshold(gdt_sheet(), 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    boxes, areas = _contour_stats(contours)
+    
+    assert boxes.tolist() == [list(cv2.boundingRect(contour)) for contour in contours]
+    assert areas.tolist() == [cv2.contourArea(contour) for contour in contours]
+
+
+def test_tiled_and_untiled_runs_find_the_same_regions_and_symbols(tmp_path):
+    path = str(tmp_path / "sheet.png")
+    cv2.imwrite(path, views_sheet())
+    outputs = ['processed_images', 'regions', 'features', 'text_mask']
+    
+    whole = CVProcessor(max_long_edge=850).process_drawing(path, outputs)
+    result = tiled(max_long_edge=850).process_drawing(path, outputs)
+    
+    assert result['metadata']['tiled'] and result['metadata']['tiles'] > 1
+    regions = sorted(result['regions'], key=lambda r: r['bbox'])
+    expected = sorted(whole['regions'], key=lambda r: r['bbox'])
+    assert [r['type'] for r in regions] == [r['type'] for r in expected]
+    # Edges are pooled 2x2 when tiled, so boxes may grow by a pixel or two
+    assert np.abs(np.array([r['bbox'] for r in regions]) - [r['bbox'] for r in expected]).max() <= 4
+    assert result['features']['gdt'] == whole['features']['gdt'] == \
+        {'feature_control_frame': 1, 'datum_feature': 1}
+    assert result['features']['region_histogram'] == whole['features']['region_histogram']
+    assert result['text_mask'].shape == (600, 850)
+    thumbnails = [decode(r['processed_images']['full']).astype(int) for r in (result, whole)]
+    assert thumbnails[0].shape == thumbnails[1].shape == (600, 850)
+    assert np.abs(thumbnails[0] - thumbnails[1]).mean() < 1
+    # Crops still come from the full-resolution sheet
+    assert [r.crop().shape[:2] for r in regions] == [(r['bbox'][3], r['bbox'][2]) for r in regions]
+
+
+def test_tiled_and_untiled_runs_fingerprint_a_sheet_alike():
+    sheet = cv2.cvtColor(gdt_sheet(), cv2.COLOR_GRAY2BGR)
+    sheet[300:340, 900:1000] = (40, 90, 200)  # a colored stamp
+    
+    whole = CVProcessor().process_image(sheet, ['fingerprint'])['fingerprint']
+    result = tiled(max_long_edge=600).process_image(sheet, ['fingerprint'])  # small thumbnail
+    
+    assert result['metadata']['tiled'] and result['metadata']['tiles'] > 1
+    assert result['fingerprint'].phash == whole.phash
+    assert np.array_equal(result['fingerprint'].ink, whole.ink)
@@ -0,0 +1,84 @@
+"""Test page-at-a-time PDF/TIFF ingestion and per-sheet failures"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src import document_ingest
+from src.document_ingest import iter_pages
+from src.mech_dwg_orchestrator import MechanicalDrawingAnalyzer
+from src.models import PartSpecification
+
+
+def write_pdf(path, pages=2):
+    # 100 px at 100 dpi -> 72 x 72 pt pages
+    images = [Image.new('RGB', (100 * (i + 1), 100), 'white') for i in range(pages)]
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=100)
+    return path
+
+
+class FakeLLM:
+    provider = "fake"
+    model = "fake-model"
+    
+    def analyze(self, images, prompt, structured_output, context=""):
+        return PartSpecification(part_number="P-1")
+
+
+def test_tiff_frames_come_one_at_a_time_capped_at_dpi(tmp_path):
+    path, low = str(tmp_path / "package.tif"), str(tmp_path / "fax.tif")
+    Image.new('L', (400, 200), 255).save(
+        path, save_all=True, dpi=(400, 400),
+        append_images=[Image.new('RGB', (300, 100), 'white'), Image.new('1', (50, 60), 1)])
+    Image.new('L', (80, 40), 255).save(low, dpi=(100, 100))
+    
+    pages = list(iter_pages(path, dpi=200))
+    
+    assert [(page.number, page.dpi, page.error) for page in pages] == \
+        [(1, 200, None), (2, 200, None), (3, 200, None)]
+    assert [page.image.shape for page in pages] == [(100, 200), (50, 150, 3), (30, 25)]
+    assert [(page.image.shape, page.dpi) for page in iter_pages(low, dpi=200)] == [((40, 80), 100)]
+
+
+def test_pdf_pages_are_rendered_at_dpi(tmp_path):
+    pages = list(iter_pages(write_pdf(str(tmp_path / "package.pdf")), dpi=50))
+    
+    assert [(page.number, page.image.shape, page.dpi) for page in pages] == \
+        [(1, (50, 50, 3), 50), (2, (50, 100, 3), 50)]
+
+
+def test_scans_above_pillows_limit_are_read_and_max_pixels_applies(tmp_path, monkeypatch):
+    path = str(tmp_path / "scan.tif")
+    Image.new('L', (300, 200), 255).save(path, save_all=True, append_images=[Image.new('L', (100, 100), 255)])
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 1000)
+    
+    assert [page.image.shape for page in iter_pages(path)] == [(200, 300), (100, 100)]
+    assert Image.MAX_IMAGE_PIXELS == 1000
+    
+    pages = list(iter_pages(path, max_pixels=20_000))
+    assert isinstance(pages[0].error, ValueError) and pages[0].image is None
+    assert pages[1].image.shape == (100, 100)
+
+
+def test_a_page_that_fails_to_render_is_recorded_and_the_rest_analyzed(tmp_path, monkeypatch):
+    path = write_pdf(str(tmp_path / "package.pdf"), pages=3)
+    render = document_ingest._render_pdf_page
+    
+    def render_or_fail(pdf, index, dpi, max_pixels):
+        if index == 1:
+            raise RuntimeError("damaged content stream")
+        return render(pdf, index, dpi, max_pixels)
+    
+    monkeypatch.setattr(document_ingest, '_render_pdf_page', render_or_fail)
+    document = MechanicalDrawingAnalyzer(llm_client=FakeLLM()).analyze_document(path, dpi=50)
+    
+    assert document.page_count == 3 and document.failed_pages == [2]
+    failed = document.sheets[1]
+    assert failed.file_path.endswith("#page=2")
+    assert failed.processing_info['failed_stage'] == 'render'
+    assert failed.error == "RuntimeError: damaged content stream"
+    assert document.part_numbers == ["P-1"]
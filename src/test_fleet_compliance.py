@@ -0,0 +1,77 @@
+"""Test columnar fleet compliance against the per-part checker"""
+
+import json
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.compliance_rules import ComplianceChecker
+from src.fleet_compliance import FleetTables, check_fleet
+from src.models import DrawingAnalysisResult, PartSpecification
+
+RULES = {
+    'numeric_rules': {
+        'min_wall_thickness': 2.0,
+        'max_hole_diameter': {'value': 0.5, 'unit': 'in'},
+        'max_aspect_ratio': 10.0,
+        'max_position_tolerance': 0.1
+    },
+    'material_rules': {
+        'allowed_materials': ['Aluminum 6061-T6', 'Steel 1018'],
+        'require_material_spec': True,
+        'require_heat_treatment': True
+    },
+    'gdt_rules': {
+        'require_datum_references': True,
+        'max_flatness': 0.05
+    }
+}
+
+
+def dim(value, unit, feature):
+    return {'value': value, 'unit': unit, 'feature': feature, 'confidence': 0.9}
+
+
+def gdt(symbol, tolerance, datums, applies_to):
+    return {'symbol_type': symbol, 'tolerance': tolerance, 'datum_references': datums, 'applies_to': applies_to}
+
+
+FLEET = [
+    ('bracket', PartSpecification(
+        material="Aluminum 6061-T6", notes=["HEAT TREAT TO T6"],
+        overall_dimensions={'length': dim(200, 'mm', 'length'), 'width': dim(0.5, 'in', 'width')},
+        critical_dimensions=[dim(0.06, 'in', 'Wall thickness'), dim(3, '', 'wall'), dim(14, 'mm', 'Hole dia')],
+        gdt_requirements=[gdt('True Position', 0.2, [], 'hole'), gdt('Flatness', 0.01, [], 'face')]
+    )),
+    ('cover', {
+        'material': 'Brass', 'notes': [],
+        'critical_dimensions': [dim(1.0, 'mm', 'Rib wall')],
+        'gdt_requirements': [gdt('Position', 0.05, ['A'], 'boss'), gdt('flatness', 0.1, [], 'top')]
+    }),
+    ('spacer', {'material': None}),
+]
+
+
+def test_fleet_reports_what_the_checker_reports_per_part():
+    violations = check_fleet(FleetTables.from_specifications(FLEET), RULES)
+    
+    checker = ComplianceChecker()
+    expected = sorted(
+        (part_id, v['rule'], v['severity'], v['message'], v['location'])
+        for part_id, spec in FLEET for v in checker.check_specification(spec, RULES)
+    )
+    assert sorted(map(tuple, violations.itertuples(index=False))) == expected
+    assert violations.groupby('part_id').size().to_dict() == {'bracket': 5, 'cover': 4, 'spacer': 2}
+
+
+def test_saved_results_are_loaded_and_failures_skipped(tmp_path):
+    for name, spec in FLEET[:2]:
+        result = DrawingAnalysisResult(file_path=f"{name}.png", specification=PartSpecification.model_validate(spec))
+        (tmp_path / f"{name}_analysis.json").write_text(result.model_dump_json())
+    failed = DrawingAnalysisResult(file_path="broken.png", specification=PartSpecification(), error="timeout")
+    (tmp_path / "broken_analysis.json").write_text(json.dumps(failed.model_dump()))
+    
+    tables = FleetTables.from_result_files(sorted(tmp_path.glob("*_analysis.json")))
+    
+    assert list(tables.parts['part_id']) == ["bracket.png", "cover.png"]
+    assert set(check_fleet(tables, {'gdt_rules': {'max_flatness': 0.05}})['part_id']) == {"cover.png"}
@@ -0,0 +1,103 @@
+"""Test encoding sheets and region crops for the LLM within a byte budget"""
+
+import base64
+import pickle
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+import pytest
+
+from src.image_payload import ImageEncoder, LazyImagePayload
+
+
+def sheet(h=600, w=900):
+    # Noise keeps JPEG from compressing the sheet to almost nothing
+    return np.random.default_rng(0).integers(0, 256, (h, w, 3), dtype=np.uint8)
+
+
+def decode(data_url):
+    data = base64.b64decode(data_url.split(',', 1)[1])
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def test_long_edge_is_capped_but_never_enlarged():
+    encoder = ImageEncoder(max_long_edge=300, image_format="jpg")
+    
+    assert decode(encoder.encode(sheet())).shape == (200, 300, 3)
+    assert decode(encoder.encode(sheet(100, 150))).shape == (100, 150, 3)
+    assert decode(ImageEncoder(max_long_edge=0).encode(sheet())).shape == (600, 900, 3)
+    with pytest.raises(ValueError):
+        ImageEncoder(image_format="gif")
+
+
+def test_over_budget_lowers_quality_before_resolution():
+    encoder = ImageEncoder(max_long_edge=900, quality=85)
+    unlimited = len(encoder.encode(sheet()))
+    at_min_quality = len(encoder._encode_once(sheet(), ImageEncoder.MIN_QUALITY))
+    
+    fits_by_quality = encoder.encode(sheet(), max_bytes=at_min_quality)
+    fits_by_size = encoder.encode(sheet(), max_bytes=at_min_quality - 1)
+    
+    assert at_min_quality < unlimited
+    assert decode(fits_by_quality).shape == (600, 900, 3)
+    assert len(fits_by_size) < at_min_quality
+    assert decode(fits_by_size).shape[1] < 900
+    assert encoder.encode(sheet(), max_bytes=100) is None
+
+
+def test_lossless_formats_go_straight_to_downscaling():
+    encoder = ImageEncoder(max_long_edge=900, image_format="png")
+    full = len(encoder.encode(sheet()))
+    
+    smaller = encoder.encode(sheet(), max_bytes=full - 1)
+    
+    assert decode(smaller).shape == (450, 675, 3)
+
+
+def test_sheet_and_regions_share_one_request_budget():
+    image = sheet()
+    full = len(ImageEncoder().encode(image))
+    title_block = len(ImageEncoder().encode(image[400:600, 600:900]))
+    regions = [{'type': 'title_block', 'bbox': (600, 400, 300, 200)},
+               {'type': 'table', 'bbox': (0, 0, 300, 200)}]
+    payload = LazyImagePayload(image, ImageEncoder(), regions=regions, max_request_bytes=full + title_block + 100)
+    
+    assert payload.bytes_encoded == 0  # nothing encoded until read
+    assert len(payload['full']) == full
+    assert len(payload['regions'][0]['image']) == title_block
+    assert payload['regions'][1]['image'] is None  # budget used up
+    assert payload.bytes_encoded == full + title_block
+    assert payload['enhanced'] is None
+
+
+def test_regions_are_views_into_the_full_resolution_sheet():
+    source = sheet()
+    payload = LazyImagePayload(cv2.resize(source, (450, 300)), ImageEncoder(),
+                               regions=[{'type': 'table', 'bbox': (90, 60, 30, 20), 'area': 600}],
+                               region_source=source)
+    region = payload['regions'][0]
+    
+    assert dict(region) == {'type': 'table', 'bbox': (90, 60, 30, 20), 'area': 600}
+    assert np.shares_memory(region.crop(), source)
+    assert np.array_equal(region.crop(), source[60:80, 90:120])
+    assert payload.bytes_encoded == 0
+    assert decode(region['image']).shape == (20, 30, 3)
+    assert decode(payload.region_payload(region)['full']).shape == (20, 30, 3)
+
+
+def test_pickled_payload_carries_what_gets_sent_not_the_pixels():
+    regions = [{'type': 'title_block', 'bbox': (600, 400, 300, 200)}, {'type': 'table', 'bbox': (0, 0, 300, 200)}]
+    payload = LazyImagePayload(sheet(), ImageEncoder(), enhanced=sheet()[..., 0], regions=regions)
+    
+    copy = pickle.loads(pickle.dumps(payload))
+    
+    assert copy['full'] == payload['full']
+    assert copy['regions'] == payload['regions']
+    title_block, table = copy['regions']
+    assert title_block['image'] == payload['regions'][0]['image']
+    assert table.crop() is None and table['image'] is None
+    assert copy['enhanced'] is None
+    assert len(pickle.dumps(payload)) < sheet().nbytes
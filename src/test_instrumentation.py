@@ -0,0 +1,62 @@
+"""Test span nesting, counters and the trace sinks"""
+
+import json
+import sys
+import threading
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.instrumentation import InMemorySink, JsonLinesSink, Tracer, current_span
+
+
+class BrokenSink:
+    def emit(self, record):
+        raise OSError("disk full")
+
+
+def test_spans_nest_and_every_sink_gets_the_same_records(tmp_path):
+    memory, lines = InMemorySink(), JsonLinesSink(str(tmp_path / "traces" / "run.jsonl"))
+    tracer = Tracer([memory, BrokenSink(), lines])
+    
+    with tracer.span('analysis', file="a.png") as root:
+        with tracer.span('cv'):
+            current_span().add(bytes_encoded=100).add(bytes_encoded=50, retries=0)
+        with pytest.raises(ValueError):
+            with tracer.span('llm'):
+                current_span().set(model="gpt-4o-mini")
+                raise ValueError("bad JSON")
+        root.adopt({'name': 'worker', 'wall_ms': 1.0, 'trace_id': 'other'})
+    
+    assert [record['name'] for record in memory.records] == ['cv', 'llm', 'worker', 'analysis']
+    assert {record['trace_id'] for record in memory.records} == {root.trace_id}
+    assert [record['parent'] for record in memory.records] == ['analysis'] * 3 + [None]
+    assert root.record()['file'] == "a.png"
+    stages = root.stage_metrics()
+    assert stages['cv']['bytes_encoded'] == 150 and 'retries' not in stages['cv']
+    assert stages['llm']['model'] == "gpt-4o-mini"
+    assert stages['llm']['error'] == "ValueError: bad JSON"
+    assert stages['cv']['wall_ms'] <= root.wall_ms
+    assert [json.loads(line) for line in lines.path.read_text().splitlines()] == list(memory.records)
+    assert set(memory.by_stage()) == {'analysis', 'cv', 'llm', 'worker'}
+
+
+def test_outside_a_span_counters_go_nowhere_and_threads_start_new_traces():
+    tracer = Tracer()
+    current_span().add(tokens_in=10).set(model="x")
+    assert current_span().attributes == {}
+    
+    roots = []
+    
+    def worker():
+        with tracer.span('llm') as span:
+            roots.append(span)
+    
+    with tracer.span('batch') as batch:
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+    
+    assert roots[0].parent is None and roots[0].trace_id != batch.trace_id
+    assert current_span().attributes == {}
@@ -0,0 +1,402 @@
+"""Test the LLM provider plugins offline against a local stub server"""
+
+import asyncio
+import json
+import sys
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+import pytest
+
+from src.compliance_rules import ComplianceChecker, format_violation
+from src.config import AnalyzerConfig, CascadeConfig, LLMConfig
+from src.image_payload import ImageEncoder, LazyImagePayload
+from src.instrumentation import Tracer
+from src.llm_client import LLMClient
+from src.llm_errors import LLMRateLimitError, LLMRequestError
+from src.mech_dwg_orchestrator import MechanicalDrawingAnalyzer
+from src import rate_limiter
+from src.rate_limiter import RateLimiter
+
+# What every stub endpoint "extracts": overall_dimensions comes back as a
+# list, so the shared _sanitize_llm_response has something to fix
+SPEC = {
+    "part_number": "BRK-100",
+    "material": "AL 6061-T6",
+    "overall_dimensions": [
+        {"value": 120, "unit": "mm", "feature": "Overall Length", "confidence": 0.9}
+    ],
+    "critical_dimensions": [{"value": 8.5, "unit": "mm", "feature": "hole diameter"}]
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers like OpenAI, Anthropic and Ollama would; `failures` forces errors first."""
+    failures = []
+    requests = []
+    
+    def log_message(self, *args):
+        pass
+    
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['content-length'])))
+        StubHandler.requests.append((self.path, body))
+        
+        if StubHandler.failures:
+            status = StubHandler.failures.pop(0)
+            return self._reply({"error": {"type": "error", "message": f"stub {status}"}},
+                               status, {"retry-after": "0"})
+        
+        if body.get('stream'):
+            self._stream(body)
+        elif self.path.endswith('/chat/completions'):
+            self._reply({
+                "id": "c1", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "tool_calls", "message": {
+                    "role": "assistant", "content": None,
+                    "tool_calls": [{"id": "t1", "type": "function", "function": {
+                        "name": "extract_specifications", "arguments": json.dumps(SPEC)}}]}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120,
+                          "prompt_tokens_details": {"cached_tokens": 64}}
+            })
+        elif self.path.endswith('/messages'):
+            self._reply({
+                "id": "m1", "type": "message", "role": "assistant", "model": body["model"],
+                "content": [{"type": "tool_use", "id": "t1",
+                             "name": "extract_specifications", "input": SPEC}],
+                "stop_reason": "tool_use", "stop_sequence": None,
+                "usage": {"input_tokens": 90, "output_tokens": 30, "cache_read_input_tokens": 50}
+            })
+        elif self.path == '/api/chat':
+            self._reply({
+                "model": body["model"], "created_at": "2025-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": json.dumps(SPEC)},
+                "done": True, "prompt_eval_count": 80, "eval_count": 25
+            })
+        else:
+            self._reply({"error": "not found"}, 404)
+    
+    def do_GET(self):
+        StubHandler.requests.append((self.path, None))
+        if self.path == '/api/tags':
+            self._reply({"models": [{"name": "llava:latest", "model": "llava:latest",
+                                     "modified_at": "2025-01-01T00:00:00Z", "size": 1, "digest": "d1"}]})
+        elif self.path == '/v1/models' and 'anthropic-version' in self.headers:
+            self._reply({"data": [{"type": "model", "id": "claude-haiku-4-5", "display_name": "Haiku",
+                                   "created_at": "2025-01-01T00:00:00Z"}],
+                         "has_more": False, "first_id": "claude-haiku-4-5", "last_id": "claude-haiku-4-5"})
+        elif self.path == '/v1/models':
+            self._reply({"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model",
+                                                     "created": 0, "owned_by": "stub"}]})
+        else:
+            self._reply({"error": "not found"}, 404)
+    
+    def _stream(self, body):
+        """The same SPEC, a few characters per event, the way each API streams it."""
+        text = json.dumps(SPEC)
+        pieces = [text[i:i + 7] for i in range(0, len(text), 7)]
+        if self.path.endswith('/chat/completions'):
+            def chunk(delta, usage=None):
+                return {"id": "c1", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                        "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": None}],
+                        "usage": usage}
+            events = [chunk({"role": "assistant", "tool_calls": [{"index": 0, "id": "t1", "type": "function",
+                             "function": {"name": "extract_specifications", "arguments": ""}}]})]
+            events += [chunk({"tool_calls": [{"index": 0, "function": {"arguments": piece}}]}) for piece in pieces]
+            events.append(chunk(None, {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}))
+            lines = [f"data: {json.dumps(event)}\n\n" for event in events] + ["data: [DONE]\n\n"]
+        elif self.path.endswith('/messages'):
+            events = [
+                {"type": "message_start", "message": {
+                    "id": "m1", "type": "message", "role": "assistant", "model": body["model"],
+                    "content": [], "stop_reason": None, "stop_sequence": None,
+                    "usage": {"input_tokens": 90, "output_tokens": 1, "cache_read_input_tokens": 50}}},
+                {"type": "content_block_start", "index": 0, "content_block": {
+                    "type": "tool_use", "id": "t1", "name": "extract_specifications", "input": {}}},
+            ]
+            events += [{"type": "content_block_delta", "index": 0,
+                        "delta": {"type": "input_json_delta", "partial_json": piece}} for piece in pieces]
+            events += [{"type": "content_block_stop", "index": 0},
+                       {"type": "message_delta", "delta": {"stop_reason": "tool_use", "stop_sequence": None},
+                        "usage": {"output_tokens": 30}},
+                       {"type": "message_stop"}]
+            lines = [f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in events]
+        else:
+            events = [{"model": body["model"], "created_at": "2025-01-01T00:00:00Z",
+                       "message": {"role": "assistant", "content": piece}, "done": False} for piece in pieces]
+            events.append({"model": body["model"], "created_at": "2025-01-01T00:00:00Z",
+                           "message": {"role": "assistant", "content": ""}, "done": True,
+                           "prompt_eval_count": 80, "eval_count": 25})
+            lines = [json.dumps(event) + "\n" for event in events]
+        
+        self.send_response(200)
+        self.send_header('content-type', 'application/x-ndjson' if self.path == '/api/chat' else 'text/event-stream')
+        self.end_headers()
+        for line in lines:
+            self.wfile.write(line.encode())
+            self.wfile.flush()
+    
+    def _reply(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture(autouse=True)
+def reset_stub():
+    StubHandler.failures = []
+    StubHandler.requests = []
+
+
+def make_images():
+    sheet = np.full((200, 300, 3), 255, np.uint8)
+    return LazyImagePayload(sheet, ImageEncoder(max_long_edge=300))
+
+
+def make_client(provider, stub_url):
+    base_urls = {'openai': f"{stub_url}/v1", 'claude': stub_url, 'ollama': stub_url}
+    return LLMClient(provider=provider, api_key="test-key", base_url=base_urls[provider],
+                     max_retries=2, backoff_base=0.01)
+
+
+@pytest.mark.parametrize("provider", ['openai', 'claude', 'ollama'])
+def test_provider_extracts_and_sanitizes(provider, stub_url):
+    spec = make_client(provider, stub_url).analyze(make_images(), "Extract the spec")
+    
+    assert spec.part_number == "BRK-100"
+    # Sanitized: list -> dict keyed by feature, missing confidence filled in
+    assert spec.overall_dimensions["overall_length"].value == 120
+    assert spec.critical_dimensions[0].confidence == 0.9
+
+
+def test_claude_forces_tool_use_with_base64_image(stub_url):
+    make_client('claude', stub_url).analyze(make_images(), "Extract the spec")
+    
+    _, body = StubHandler.requests[-1]
+    assert body["tool_choice"] == {"type": "tool", "name": "extract_specifications"}
+    image = body["messages"][0]["content"][1]
+    assert image["source"]["media_type"] == "image/jpeg"
+    assert not image["source"]["data"].startswith("data:")
+
+
+def test_ollama_uses_json_mode(stub_url):
+    make_client('ollama', stub_url).analyze(make_images(), "Extract the spec")
+    
+    _, body = StubHandler.requests[-1]
+    assert body["format"] == "json"
+    assert "part_number" in body["messages"][0]["content"]  # schema in the prompt
+    assert len(body["messages"][1]["images"]) == 1
+
+
+@pytest.mark.parametrize("provider,cached", [('openai', 64), ('claude', 50)])
+def test_static_prefix_is_byte_stable_and_cache_hits_reported(provider, cached, stub_url):
+    client = make_client(provider, stub_url)
+    with Tracer([]).span('llm') as span:
+        client.analyze(make_images(), "Extract the spec", context="Found 2 regions: table")
+        client.analyze(make_images(), "Extract the spec", context="Found 1 regions: title_block")
+    
+    (_, first), (_, second) = StubHandler.requests
+    prefix = ('tools', 'system') if provider == 'claude' else ('tools',)
+    for key in prefix:
+        assert json.dumps(first[key]) == json.dumps(second[key])
+    if provider == 'claude':
+        assert first['system'][0]['cache_control'] == {"type": "ephemeral"}
+    else:
+        assert first['messages'][0] == second['messages'][0]
+    assert span.attributes['tokens_cached'] == 2 * cached
+
+
+@pytest.mark.parametrize("provider", ['openai', 'claude'])
+def test_rate_limits_are_retried_then_typed(provider, stub_url):
+    client = make_client(provider, stub_url)
+    
+    StubHandler.failures = [429, 503]
+    assert client.analyze(make_images(), "Extract the spec").part_number == "BRK-100"
+    
+    StubHandler.failures = [429, 429, 429]
+    with pytest.raises(LLMRateLimitError):
+        client.analyze(make_images(), "Extract the spec")
+    
+    StubHandler.failures = [400]
+    with pytest.raises(LLMRequestError):
+        client.analyze(make_images(), "Extract the spec")
+
+
+@pytest.mark.parametrize("provider", ['openai', 'claude', 'ollama'])
+def test_async_requests_share_one_client_and_retry(provider, stub_url):
+    client = make_client(provider, stub_url)
+    
+    async def run():
+        specs = await asyncio.gather(*(client.analyze_async(make_images(), "Extract the spec") for _ in range(3)))
+        pooled = client._async_client
+        StubHandler.failures = [503]
+        specs.append(await client.analyze_async(make_images(), "Extract the spec"))
+        assert client._async_client is pooled
+        await client.aclose()
+        assert client._async_client is None
+        return specs
+    
+    specs = asyncio.run(run())
+    
+    assert specs == [client.analyze(make_images(), "Extract the spec")] * 4
+    assert len([path for path, body in StubHandler.requests if body is not None]) == 6
+
+
+@pytest.mark.parametrize("provider", ['openai', 'claude', 'ollama'])
+def test_connection_checks_list_models(provider, stub_url):
+    client = make_client(provider, stub_url)
+    
+    async def check():
+        try:
+            return await client.test_connection_async()
+        finally:
+            await client.aclose()
+    
+    assert client.test_connection()
+    assert asyncio.run(check())
+    assert [path for path, _ in StubHandler.requests] == \
+        2 * ['/api/tags' if provider == 'ollama' else '/v1/models']
+    
+    unreachable = LLMClient(provider=provider, api_key="test-key", base_url="http://127.0.0.1:9", max_retries=0)
+    assert not unreachable.test_connection()
+    assert not asyncio.run(unreachable.test_connection_async())
+
+
+def frozen_limiter(monkeypatch):
+    """A token budget that doesn't refill while the test runs."""
+    monkeypatch.setattr(rate_limiter, 'time', SimpleNamespace(monotonic=lambda: 0.0))
+    return RateLimiter(tokens_per_minute=1_000_000)
+
+
+def test_failed_attempts_give_their_token_reservation_back(monkeypatch):
+    client = LLMClient(provider='openai', api_key="test-key", backoff_base=0.01,
+                       rate_limiter=frozen_limiter(monkeypatch))
+    outcomes = [ConnectionError("reset"), TimeoutError("slow"),
+                SimpleNamespace(usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20))]
+    
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    
+    client._send(call, estimated_tokens=5000)
+    
+    bucket = client.rate_limiter.tokens
+    assert bucket.capacity - bucket._tokens == 120
+
+
+def test_stream_stopped_early_is_closed_and_settled(monkeypatch, stub_url):
+    client = LLMClient(provider='claude', api_key="test-key", base_url=stub_url,
+                       rate_limiter=frozen_limiter(monkeypatch))
+    events = client.analyze_stream(make_images(), "Extract the spec")
+    
+    assert next(events).path == ('part_number',)
+    events.close()
+    
+    # Only what message_start reported (90 in, 1 out), not the estimate
+    bucket = client.rate_limiter.tokens
+    assert bucket.capacity - bucket._tokens == 91
+
+
+def test_streams_that_fail_before_the_first_event_are_closed_and_retried(stub_url):
+    client = make_client('openai', stub_url)
+    send_stream, opened = client._provider.send_stream, []
+    
+    class DroppedStream:
+        closed = False
+        
+        def __iter__(self):
+            raise ConnectionError("connection reset")
+        
+        def close(self):
+            self.closed = True
+    
+    def flaky_send_stream(sdk_client, request):
+        if len(opened) < 2:
+            opened.append(DroppedStream())
+            return opened[-1]
+        return send_stream(sdk_client, request)
+    
+    client._provider.send_stream = flaky_send_stream
+    events = list(client.analyze_stream(make_images(), "Extract the spec"))
+    
+    assert events[-1].value.part_number == "BRK-100"
+    assert [stream.closed for stream in opened] == [True, True]
+
+
+@pytest.mark.parametrize("provider,tokens", [('openai', 120), ('claude', 120), ('ollama', 105)])
+def test_streamed_fields_and_violations_arrive_before_the_specification(provider, tokens, stub_url):
+    rules = {'numeric_rules': {'max_hole_diameter': 5.0}, 'material_rules': {'require_heat_treatment': True}}
+    with Tracer([]).span('llm') as span:
+        events = list(make_client(provider, stub_url).analyze_stream(
+            make_images(), "Extract the spec", compliance_rules=rules))
+    
+    assert [(event.kind, event.path) for event in events] == [
+        ('field', ('part_number',)),
+        ('field', ('material',)),
+        ('field', ('overall_dimensions', 'overall_length')),
+        ('field', ('critical_dimensions', 0)),
+        ('violation', ('critical_dimensions', 0)),  # before generation ends
+        ('violation', ()),  # heat treatment needs the whole spec
+        ('specification', ()),
+    ]
+    assert events[3].value.confidence == 0.9  # sanitized like analyze() does
+    assert events[4].value['message'] == "Hole diameter 8.5mm exceeds maximum 5mm"
+    assert events[-1].value == make_client(provider, stub_url).analyze(make_images(), "Extract the spec")
+    assert span.attributes['tokens_in'] + span.attributes['tokens_out'] == tokens
+    assert span.attributes['first_field_ms'] <= span.wall_ms
+
+
+def test_analyzer_reports_streamed_violations_before_the_specification(stub_url):
+    class CheckOnlyWhileStreaming(ComplianceChecker):
+        def check_specification(self, spec, rules=None):
+            raise AssertionError("the streamed specification was checked again")
+    
+    events = []
+    analyzer = MechanicalDrawingAnalyzer(
+        config=AnalyzerConfig(llm_config=LLMConfig(stream=True)),
+        llm_client=make_client('openai', stub_url),
+        compliance_checker=CheckOnlyWhileStreaming(),
+        on_stream_event=events.append
+    )
+    result = analyzer._analyze_cv_results(
+        "sheet.png", {'processed_images': make_images()},
+        compliance_rules={'numeric_rules': {'max_hole_diameter': 5.0}})
+    
+    kinds = [event.kind for event in events]
+    assert kinds.index('violation') < kinds.index('specification') == len(kinds) - 1
+    assert result.specification == events[-1].value
+    assert result.compliance_violations == [
+        format_violation(event.value) for event in events if event.kind == 'violation'
+    ] == ["[error] max_hole_diameter: Hole diameter 8.5mm exceeds maximum 5mm (hole diameter)"]
+    stages = result.processing_info['stages']
+    assert stages['llm']['streamed'] and stages['compliance']['streamed']
+
+
+def test_each_provider_falls_back_to_its_own_default_models():
+    analyzer = MechanicalDrawingAnalyzer(config=AnalyzerConfig(
+        llm_config=LLMConfig(provider="ollama"),
+        cascade_config=CascadeConfig(enabled=True, escalation_provider="claude", escalation_api_key="test-key")
+    ))
+    
+    assert analyzer.llm.model == "llava:latest"
+    assert analyzer.escalation_llm.model == "claude-sonnet-4-6"
+    assert LLMClient(provider="claude", api_key="test-key").model == "claude-haiku-4-5"
@@ -0,0 +1,123 @@
+"""Test knowledge-base chunking, BM25 retrieval and the persisted index"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import numpy as np
+
+from src.rag_engine import RAGEngine, chunk_markdown
+
+KB = """# Handbook
+
+## Section 7: GD\\&T
+
+### 7.2 The Feature Control Frame
+
+A feature control frame holds the geometric characteristic symbol, the tolerance and the datum references.[75, 78]
+
+### 7.4 The 14 Geometric Characteristic Symbols
+
+Flatness, straightness, perpendicularity, position and runout are geometric characteristic symbols.
+
+## Section 9: Manufacturing
+
+### 9.3 Surface Texture
+
+Surface roughness Ra is specified with the surface texture symbol per ASME Y14.36.
+
+## Work Cited
+
+1. ASME Y14.5 feature control frame surface texture
+"""
+
+
+def make_engine(tmp_path, kb=KB, **kwargs):
+    kb_dir = tmp_path / "kb"
+    kb_dir.mkdir(exist_ok=True)
+    (kb_dir / "handbook.md").write_text(kb)
+    return RAGEngine(knowledge_base_dir=str(kb_dir), index_dir=str(tmp_path / "index"), **kwargs)
+
+
+def test_chunks_by_heading_with_path_and_clean_text():
+    chunks = chunk_markdown(KB, "handbook.md")
+    
+    assert [c.title for c in chunks] == [
+        "7.2 The Feature Control Frame",
+        "7.4 The 14 Geometric Characteristic Symbols",
+        "9.3 Surface Texture",
+    ]
+    assert chunks[0].path == "Handbook > Section 7: GD&T"
+    assert "[75" not in chunks[0].content
+    assert chunks[0].summary.startswith("A feature control frame holds")
+
+
+def test_retrieves_relevant_sections_with_prompt_fields(tmp_path):
+    engine = make_engine(tmp_path, top_k=2)
+    
+    results = engine.retrieve_context(image_features={'query': "surface roughness Ra"})
+    
+    assert results[0]['title'] == "9.3 Surface Texture"
+    assert {'title', 'content', 'summary'} <= set(results[0])
+    assert engine.retrieve_context(query="feature control frame")[0]['title'] == \
+        "7.2 The Feature Control Frame"
+
+
+WELDING = "\n### 9.4 Welding\n\nFillet weld symbols per AWS A2.4 welding.\n"
+
+
+class CountingEmbedder:
+    """Deterministic bag-of-words vectors; remembers how many texts it embedded."""
+    name = "counting"
+    
+    def __init__(self):
+        self.embedded = 0
+    
+    def __call__(self, texts):
+        self.embedded += len(texts)
+        vectors = np.zeros((len(texts), 32), np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, hash(word) % 32] += 1
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_index_is_persisted_memory_mapped_and_reopened(tmp_path):
+    engine = make_engine(tmp_path)
+    
+    reopened = make_engine(tmp_path)
+    assert reopened.version == engine.version
+    assert reopened.last_update == {}  # opened, not rebuilt
+    assert isinstance(reopened._index.weights, np.memmap)
+
+
+def test_only_changed_sections_are_reembedded(tmp_path):
+    embedder = CountingEmbedder()
+    engine = make_engine(tmp_path, embedder=embedder)
+    assert embedder.embedded == len(engine) == 3
+    
+    updated = make_engine(tmp_path, KB + WELDING, embedder=embedder)
+    assert updated.last_update['embedded'] == 1
+    assert updated.last_update['reused'] == 3
+    assert updated.retrieve_context(query="fillet weld")[0]['title'] == "9.4 Welding"
+
+
+def test_running_engine_picks_up_published_version(tmp_path):
+    worker = make_engine(tmp_path, reload_interval=0)
+    old_version = worker.version
+    
+    # Another process re-indexes; the worker keeps serving, then switches
+    indexer = make_engine(tmp_path, KB + WELDING)
+    assert indexer.version != old_version
+    assert worker.retrieve_context(query="fillet weld")[0]['title'] == "9.4 Welding"
+    assert worker.version == indexer.version
+    assert (tmp_path / "index" / "CURRENT").read_text() == indexer.version
+
+
+def test_each_detected_element_gets_its_own_section(tmp_path):
+    engine = make_engine(tmp_path, top_k=2)
+    features = {'queries': ["feature control frame", "surface roughness Ra"]}
+    
+    titles = [r['title'] for r in engine.retrieve_context(image_features=features)]
+    
+    assert titles == ["7.2 The Feature Control Frame", "9.3 Surface Texture"]
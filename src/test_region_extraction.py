@@ -0,0 +1,45 @@
+"""Test merging the partial extractions of separate sheet regions"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.models import (Dimension, DrawingView, GDTSymbol, TableExtraction,
+                        TitleBlockExtraction, ViewExtraction)
+from src.region_extraction import merge_partial_specifications
+
+
+def dimension(value, unit="mm", feature="hole diameter", confidence=0.8):
+    return Dimension(value=value, unit=unit, feature=feature, confidence=confidence)
+
+
+def test_duplicates_seen_in_several_regions_are_kept_once():
+    position = GDTSymbol(symbol_type="Position", tolerance=0.05, datum_references=["A", "B"], applies_to="Hole")
+    front = ViewExtraction(
+        overall_dimensions={"length": dimension(120, feature="length", confidence=0.7)},
+        critical_dimensions=[dimension(6.35), dimension(20, feature="bore depth")],
+        gdt_requirements=[position],
+        views=[DrawingView(view_type="front", scale="1:2", contains_features=["hole", "bore"])],
+        notes=["BREAK ALL EDGES"])
+    side = ViewExtraction(
+        overall_dimensions={"length": dimension(120, feature="length", confidence=0.9)},
+        critical_dimensions=[dimension(0.25, "in", "Hole  Diameter", 0.95), dimension(9.0)],
+        gdt_requirements=[position.model_copy(update={'symbol_type': "position", 'applies_to': "hole"})],
+        views=[DrawingView(view_type="Front", scale="1:2", contains_features=["bore", "hole"]),
+               DrawingView(view_type="section", contains_features=["bore"])],
+        notes=["break all  edges", "DEBURR"])
+    title_block = TitleBlockExtraction(part_number="BRK-100", material="AL 6061-T6",
+                                       title_block_info={"rev": "B"}, notes=["DEBURR"])
+    table = TableExtraction(material="STEEL", critical_dimensions=[dimension(0.635, "cm", confidence=0.6)])
+    
+    merged = merge_partial_specifications([front, side, title_block, table,
+                                           TitleBlockExtraction(part_number="OTHER", title_block_info={"rev": "C"})])
+    
+    assert (merged.part_number, merged.material, merged.title_block_info) == ("BRK-100", "AL 6061-T6", {"rev": "B"})
+    assert merged.overall_dimensions["length"].confidence == 0.9
+    # 6.35 mm, 0.25 in and 0.635 cm are one hole; 9 mm is a different size
+    assert [(d.value, d.unit, d.confidence) for d in merged.critical_dimensions] == \
+        [(0.25, "in", 0.95), (20, "mm", 0.8), (9.0, "mm", 0.8)]
+    assert merged.gdt_requirements == [position]
+    assert [view.view_type for view in merged.views] == ["front", "section"]
+    assert merged.notes == ["BREAK ALL EDGES", "DEBURR"]
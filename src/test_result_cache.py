@@ -0,0 +1,52 @@
+"""Test the content-addressed result cache and what goes into its keys"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from pydantic import BaseModel
+
+from src.config import AnalyzerConfig, LLMConfig
+from src.cv_processor import CVProcessor
+from src.mech_dwg_orchestrator import MechanicalDrawingAnalyzer
+from src.models import PartSpecification
+from src.result_cache import ResultCache, make_cache_key, schema_version
+
+
+def key(image="img", **settings):
+    return make_cache_key(image, "prompt", "openai", "gpt-4o-mini", schema_version(), **settings)
+
+
+def test_hits_misses_and_least_recently_used_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite"), max_entries=2)
+    cache.put(key("a"), PartSpecification(part_number="A"))
+    cache.put(key("b"), PartSpecification(part_number="B"))
+    
+    assert cache.get(key("a")).part_number == "A"  # b is now least recently used
+    assert cache.get(key("c")) is None
+    cache.put(key("c"), PartSpecification(part_number="C"))
+    
+    assert cache.get(key("b")) is None
+    assert cache.get(key("a")).part_number == "A"
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (2, 2, 1, 2)
+
+
+def test_schema_change_and_request_settings_change_the_key():
+    class NarrowerSpec(BaseModel):
+        part_number: str = ""
+    
+    assert schema_version(NarrowerSpec) != schema_version(PartSpecification)
+    assert key(settings='{"extraction_mode": "regions"}') != key(settings='{"extraction_mode": "single"}')
+
+
+def test_cache_is_opt_in_and_keyed_on_extraction_mode_and_image_budget():
+    def settings(mode="single", **cv):
+        analyzer = MechanicalDrawingAnalyzer(
+            config=AnalyzerConfig(llm_config=LLMConfig(extraction_mode=mode)),
+            cv_processor=CVProcessor(**cv), llm_client=object())
+        assert analyzer.cache is None
+        return analyzer._request_settings()
+    
+    assert len({settings(), settings("regions"), settings(max_long_edge=1024),
+                settings(max_request_bytes=1 << 20), settings(image_quality=60)}) == 5
@@ -0,0 +1,81 @@
+"""Test storing results and querying them through the normalized tables"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from src.fleet_compliance import FleetTables, check_fleet
+from src.models import DrawingAnalysisResult, PartSpecification, RevisionDiff
+from src.result_store import ResultStore
+
+
+def result(file_path, part_number, material, revision="A", position=None, wall=None, previous=None):
+    spec = {'part_number': part_number, 'material': material, 'title_block_info': {'REV': revision}}
+    if position is not None:
+        spec['gdt_requirements'] = [{'symbol_type': 'True Position', 'tolerance': position,
+                                     'datum_references': ['A'], 'applies_to': 'hole'}]
+    if wall is not None:
+        spec['critical_dimensions'] = [{'value': wall[0], 'unit': wall[1], 'feature': 'Wall thickness',
+                                        'confidence': 0.9}]
+    return DrawingAnalysisResult(
+        file_path=file_path,
+        specification=PartSpecification.model_validate(spec),
+        revision_diff=RevisionDiff(previous_file=previous) if previous else None
+    )
+
+
+def test_queries_filter_on_material_gdt_and_dimensions(tmp_path):
+    store = ResultStore(str(tmp_path / "results.sqlite"))
+    store.add_many([
+        result("a.png", "P-1", "Aluminum 6061-T6", position=0.2, wall=(0.06, 'in')),
+        result("b.png", "P-2", "aluminum  6061-t6", position=0.05, wall=(3.0, 'mm')),
+        result("c.png", "P-3", "Steel 1018", position=0.3),
+    ])
+    
+    def paths(**filters):
+        return sorted(r.file_path for r in store.find(**filters))
+    
+    assert paths(material="Aluminum 6061-T6") == ["a.png", "b.png"]
+    assert paths(material="Aluminum 6061-T6", gdt=('position', '>', 0.1)) == ["a.png"]
+    assert paths(gdt=('True Position', '>=', 0.2)) == ["a.png", "c.png"]
+    assert paths(dimensions=('wall', '<', 2.0)) == ["a.png"]  # 0.06in = 1.52mm
+    assert paths(dimensions=('wall', '<', 2.0), gdt=('position', '>', 0.25)) == []
+
+
+def test_revisions_replacement_and_loading(tmp_path):
+    store = ResultStore(str(tmp_path / "results.sqlite"))
+    store.add(result("p1_a.png", "P-1", "Steel 1018", "A", position=0.2))
+    store.add(result("p1_b.png", "P-1", "Steel 1018", "B", position=0.05, previous="p1_a.png"))
+    # Re-analysis of a file replaces its rows, including its callouts
+    store.add(result("p1_a.png", "p-1", "Steel 1018", "A", position=0.08))
+    
+    assert len(store) == 2
+    assert list(store.find(gdt=('position', '>', 0.1))) == []
+    assert [(r.file_path, r.revision) for r in store.revisions("P-1")] == [("p1_b.png", "B"), ("p1_a.png", "A")]
+    assert store.load("p1_b.png").revision_diff.previous_file == "p1_a.png"
+    
+    tables = FleetTables.from_specifications(store.specifications(part_number="P-1"))
+    assert set(check_fleet(tables, {'max_position_tolerance': 0.06})['part_id']) == {"p1_a.png"}
+
+
+def test_full_text_search_over_notes_title_blocks_and_features(tmp_path):
+    store = ResultStore(str(tmp_path / "results.sqlite"))
+    plate = result("plate.png", "P-1", "Aluminum 6061-T6", wall=(2.5, 'mm'))
+    plate.specification.notes = ["HARD ANODIZED PER MIL-A-8625 TYPE III", "DEBURR ALL EDGES"]
+    plate.specification.title_block_info['Title'] = "COVER PLATE"
+    shaft = result("shaft.png", "P-2", "Steel 1018")
+    shaft.specification.notes = ["Anodize not permitted on bearing seats"]
+    store.add_many([plate, shaft])
+    
+    hits = store.search("anodize")
+    assert sorted(hit.file_path for hit in hits) == ["plate.png", "shaft.png"]
+    assert store.search('"hard anodize" MIL*')[0].snippet == "[HARD ANODIZED] PER [MIL]-A-8625 TYPE III"
+    assert [(hit.field, hit.text) for hit in store.search("plate", field='title_block')] == \
+        [('title_block', "Title: COVER PLATE")]
+    assert [hit.file_path for hit in store.search("wall", field='feature')] == ["plate.png"]
+    assert [r.file_path for r in store.find(text="anodize", material="Steel 1018")] == ["shaft.png"]
+    
+    # Re-analysis replaces the indexed text
+    shaft.specification.notes = ["Black oxide finish"]
+    store.add(shaft)
+    assert [hit.file_path for hit in store.search("anodize")] == ["plate.png"]
@@ -0,0 +1,83 @@
+"""Test revision registration, change localization and extraction diffs"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+from src.models import Dimension, GDTSymbol, PartSpecification
+from src.revision_diff import change_mask, diff_specifications, locate_changes, register_sheets
+
+VIEW = (50, 50, 650, 550)
+
+
+def sheet(dimension="25.0", note="NOTE 1"):
+    img = np.full((1200, 1700), 255, np.uint8)
+    cv2.rectangle(img, (50, 50), (700, 600), 0, 3)
+    cv2.rectangle(img, (800, 50), (1500, 600), 0, 3)
+    cv2.circle(img, (400, 350), 80, 0, 2)
+    cv2.line(img, (900, 100), (1400, 500), 0, 2)
+    cv2.circle(img, (1200, 300), 50, 0, 2)
+    cv2.putText(img, dimension, (200, 300), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+    cv2.putText(img, note, (100, 1000), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+    return img
+
+
+def rescan(img):
+    """Rotated, scaled and shifted like a sheet fed into a scanner again."""
+    matrix = cv2.getRotationMatrix2D((850, 600), 0.7, 1.02)
+    matrix[:, 2] += (12, -7)
+    return cv2.warpAffine(img, matrix, (1700, 1200), borderValue=255)
+
+
+def test_rescanned_revision_is_aligned_before_diffing():
+    previous, new = sheet(), rescan(sheet())
+    
+    alignment = register_sheets(previous, new)
+    
+    assert alignment.method in ('orb', 'orb+ecc')
+    assert not change_mask(previous, new, alignment).any()
+
+
+def test_changes_map_to_their_region_or_an_extra_crop():
+    previous = sheet()
+    new = rescan(sheet(dimension="27.5", note="NOTE 2"))
+    mask = change_mask(previous, new, register_sheets(previous, new))
+    
+    # Region boxes as detected on the rescanned sheet
+    changed, extra = locate_changes(mask, [(40, 30, 680, 590), (800, 50, 700, 550)], sheet=new)
+    
+    assert changed == [0]
+    assert len(extra) == 1
+    x, y, w, h = extra[0]
+    assert x < 110 and x + w > 230 and 940 < y < 1000  # the whole "NOTE 2" line
+
+
+def test_diff_pairs_dimensions_by_feature_and_gdt_by_callout():
+    def dim(feature, value):
+        return Dimension(value=value, unit="mm", feature=feature, confidence=0.9)
+    
+    old = PartSpecification(
+        part_number="PN-100",
+        critical_dimensions=[dim("bore", 25.0), dim("length", 120.0), dim("slot", 6.0)],
+        gdt_requirements=[GDTSymbol(symbol_type="position", tolerance=0.1, applies_to="bore")],
+        notes=["NOTE 1"]
+    )
+    new = PartSpecification(
+        part_number="PN-100",
+        critical_dimensions=[dim("Bore", 27.5), dim("length", 120.0), dim("chamfer", 1.0)],
+        gdt_requirements=[GDTSymbol(symbol_type="position", tolerance=0.05, applies_to="bore")],
+        notes=["NOTE 2"]
+    )
+    
+    diff = diff_specifications(old, new)
+    
+    assert [(d.feature, d.change) for d in diff['dimensions']] == [
+        ("bore", "changed"), ("slot", "removed"), ("chamfer", "added")
+    ]
+    assert diff['dimensions'][0].new.value == 27.5
+    assert [(g.change, g.old.tolerance, g.new.tolerance) for g in diff['gdt']] == [("changed", 0.1, 0.05)]
+    assert diff['fields'] == {}
+    assert (diff['notes_added'], diff['notes_removed']) == (["NOTE 2"], ["NOTE 1"])
@@ -0,0 +1,72 @@
+"""Test near-duplicate lookup, change attribution and patching of prior results"""
+
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import cv2
+import numpy as np
+
+from src.models import Dimension, PartSpecification
+from src.region_extraction import patch_specification
+from src.similarity_index import SimilarityIndex, diff_fingerprints, sheet_fingerprint
+
+REGIONS = [
+    {'type': 'drawing_view', 'bbox': (50, 50, 650, 550)},
+    {'type': 'title_block', 'bbox': (1100, 900, 550, 250)},
+]
+
+
+def sheet(dimension="25.0", title="PN-100", note="NOTE 1"):
+    img = np.full((1200, 1700), 255, np.uint8)
+    for x, y, w, h in (region['bbox'] for region in REGIONS):
+        cv2.rectangle(img, (x, y), (x + w, y + h), 0, 3)
+    cv2.putText(img, dimension, (200, 300), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+    cv2.putText(img, title, (1200, 1000), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+    cv2.putText(img, note, (100, 1000), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 0, 2)
+    return img
+
+
+def test_finds_revision_of_filed_sheet_across_reopen(tmp_path):
+    index = SimilarityIndex(path=str(tmp_path / "sim.sqlite"))
+    index.add("openai:m", sheet_fingerprint(sheet(), REGIONS), PartSpecification(part_number="PN-100"), "rev_a.png")
+    index.close()
+    
+    index = SimilarityIndex(path=str(tmp_path / "sim.sqlite"))
+    match = index.nearest("openai:m", sheet_fingerprint(sheet(dimension="27.5"), REGIONS))
+    assert match.file_path == "rev_a.png"
+    assert match.specification.part_number == "PN-100"
+    
+    assert index.nearest("ollama:m", sheet_fingerprint(sheet(), REGIONS)) is None
+    noise = np.random.default_rng(0).integers(0, 256, (1200, 1700), dtype=np.uint8)
+    assert index.nearest("openai:m", sheet_fingerprint(noise, REGIONS)) is None
+
+
+def test_changes_are_attributed_to_the_regions_they_fall_in():
+    rev_a = sheet_fingerprint(sheet(), REGIONS)
+    
+    assert diff_fingerprints(rev_a, sheet_fingerprint(sheet(), REGIONS)).changed_cells == 0
+    
+    changes = diff_fingerprints(rev_a, sheet_fingerprint(sheet(dimension="27.5"), REGIONS))
+    assert changes.regions == [0]
+    assert changes.unassigned_cells == 0
+    
+    # The note is outside every region
+    changes = diff_fingerprints(rev_a, sheet_fingerprint(sheet(note="NOTE 2"), REGIONS))
+    assert changes.regions == []
+    assert changes.unassigned_cells > 0
+
+
+def test_patch_replaces_re_extracted_dimensions_only():
+    def dim(feature, value):
+        return Dimension(value=value, unit="mm", feature=feature, confidence=0.9)
+    
+    base = PartSpecification(part_number="PN-100", material="AL 6061",
+                             critical_dimensions=[dim("Bore", 25.0), dim("Length", 120.0)])
+    update = PartSpecification(critical_dimensions=[dim("bore", 27.5)])
+    
+    patched = patch_specification(base, update)
+    
+    assert [(d.feature, d.value) for d in patched.critical_dimensions] == [("Length", 120.0), ("bore", 27.5)]
+    assert patched.part_number == "PN-100"
+    assert base.critical_dimensions[0].value == 25.0
@@ -0,0 +1,58 @@
+"""Test incremental parsing of structured output fed in arbitrary pieces"""
+
+import json
+import random
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent))
+
+import pytest
+
+from src.stream_parser import IncrementalJSONParser
+
+OUTPUT = {
+    "part_number": "BRK-\"100\"\\A",
+    "material": "AL 6061-T6",
+    "overall_dimensions": {"length": {"value": 120, "unit": "mm", "feature": "length"}},
+    "critical_dimensions": [
+        {"value": 8.5e0, "unit": "mm", "feature": "hole ø diameter"},
+        {"value": -0.25, "unit": "in", "feature": "wall"}
+    ],
+    "gdt_requirements": [],
+    "notes": ["DEBURR, BREAK EDGES {0.2}]"],
+    "title_block_info": {}
+}
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_values_come_out_as_they_complete_however_the_text_is_split(indent):
+    text = json.dumps(OUTPUT, indent=indent, ensure_ascii=False)
+    rng = random.Random(0)
+    for _ in range(50):
+        parser, found, i = IncrementalJSONParser(), [], 0
+        while i < len(text):
+            size = rng.randint(1, 9)
+            found.extend(parser.feed(text[i:i + size]))
+            i += size
+        
+        assert found == [
+            (("part_number",), OUTPUT["part_number"]),
+            (("material",), "AL 6061-T6"),
+            (("overall_dimensions", "length"), OUTPUT["overall_dimensions"]["length"]),
+            (("critical_dimensions", 0), OUTPUT["critical_dimensions"][0]),
+            (("critical_dimensions", 1), OUTPUT["critical_dimensions"][1]),
+            (("notes", 0), "DEBURR, BREAK EDGES {0.2}]"),
+        ]
+        assert parser.close() == OUTPUT
+
+
+def test_a_dimension_is_available_before_the_object_closes():
+    parser = IncrementalJSONParser()
+    assert list(parser.feed('{"part_number": "P-1", "critical_dimensions": [{"value": 2')) == \
+        [(("part_number",), "P-1")]
+    assert list(parser.feed('.5, "unit": "mm"}, {"va')) == \
+        [(("critical_dimensions", 0), {"value": 2.5, "unit": "mm"})]
+    with pytest.raises(ValueError):
+        parser.close()
+    with pytest.raises(ValueError):
+        list(parser.feed('lue": 1]'))